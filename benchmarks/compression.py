@@ -0,0 +1,191 @@
+"""Measure the CPU cost and the bytes saved by each compression level.
+
+The bodies of the largest responses are built against a seeded SQLite
+database, at the page sizes the clients use: pages of GET /users/me/events
+(events with their speakers), GET /venues/, GET /users/me/ embedding a user's
+events and one batch of GET /export/events. Each is compressed with every
+installed coding at a range of levels, one shot like the JSON responses, or
+flushed per batch like the exports. The levels used by the app (LEVELS in
+compression.py) are marked with a *.
+
+Usage:
+    python benchmarks/compression.py [--pages 20,100,1000] [--iterations 50]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark-compression.db"
+)
+
+from tim_events_api.main import app  # noqa: E402,F401
+from tim_events_api.compression import (  # noqa: E402
+    ENCODERS,
+    LEVELS,
+    available_encodings,
+)
+from tim_events_api.database import Base, SessionLocal, engine  # noqa: E402
+from tim_events_api.fieldsets import parse_fieldset  # noqa: E402
+from tim_events_api.serialization import dumps, page_response  # noqa: E402
+from tim_events_api.models import (  # noqa: E402
+    models_event,
+    models_speaker,
+    models_user,
+    models_venue,
+)
+from tim_events_api.schemas import schema_users  # noqa: E402
+from tim_events_api.crud import events, export, users, venues  # noqa: E402
+
+# The levels tried for each coding
+TRIED_LEVELS = {"gzip": [1, 3, 5, 6, 9], "br": [1, 3, 4, 5, 7], "zstd": [1, 3, 6, 9]}
+
+
+def seed(rows: int, speakers_per_event: int):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            models_user.User.__table__.insert(),
+            [dict(username="organizer", email="organizer@example.org")],
+        )
+        start = datetime(2030, 1, 1)
+        connection.execute(
+            models_event.Event.__table__.insert(),
+            [
+                dict(
+                    name=f"Event {i}",
+                    description=f"Talks and workshops on topic {i % 37}, "
+                    "with networking sessions between the tracks. " * 3,
+                    location=["Lagos", "Abuja", "Accra", "Nairobi"][i % 4],
+                    start_time=start + timedelta(hours=i),
+                    end_time=start + timedelta(hours=i + 2),
+                    organizer_id=1,
+                )
+                for i in range(rows)
+            ],
+        )
+        connection.execute(
+            models_speaker.Speaker.__table__.insert(),
+            [
+                dict(
+                    first_name=f"Ada {i % 53}",
+                    last_name=f"Speaker {i}",
+                    contact_info=f"speaker{i}@example.org",
+                    bio=f"Engineer with {i % 20} years of experience in "
+                    "distributed systems and developer tooling. " * 2,
+                    event_id=i % rows + 1,
+                )
+                for i in range(rows * speakers_per_event)
+            ],
+        )
+        connection.execute(
+            models_venue.Venue.__table__.insert(),
+            [
+                dict(
+                    name=f"Venue {i}",
+                    location=["Lagos", "Abuja"][i % 2],
+                    capacity=100 + i,
+                    description=f"A hall for {100 + i} people " * 4,
+                )
+                for i in range(rows)
+            ],
+        )
+
+
+def build_payloads(pages: list, user_events: int):
+    """The bodies, by name: (content type, chunks)."""
+    payloads = {}
+    with SessionLocal() as db:
+        for limit in pages:
+            page = events.get_event_rows(user_id=1, db=db, limit=limit)
+            payloads[f"GET /users/me/events limit={limit}"] = (
+                "application/json",
+                [page_response(page).body],
+            )
+        for limit in pages:
+            page = venues.get_venue_rows(db=db, limit=limit)
+            payloads[f"GET /venues/ limit={limit}"] = (
+                "application/json",
+                [page_response(page).body],
+            )
+        selected = parse_fieldset(
+            schema_users.User,
+            models_user.User,
+            None,
+            f"events:{user_events},events.speakers",
+        )
+        user = users.get_user_fields(db, 1, selected)
+        payloads[f"GET /users/me/ events={user_events}"] = (
+            "application/json",
+            [dumps(user)],
+        )
+    with SessionLocal() as db, SessionLocal() as speakers_db:
+        batches = export.stream_events(db, speakers_db)
+        chunks = [b"".join(dumps(row) + b"\n" for row in next(batches))]
+        batches.close()
+    payloads["GET /export/events, one batch"] = ("application/x-ndjson", chunks)
+    return payloads
+
+
+def compress(encoding: str, level: int, chunks: list, streamed: bool):
+    encoder = ENCODERS[encoding](level)
+    out = 0
+    for chunk in chunks:
+        out += len(encoder.compress(chunk))
+        if streamed:
+            out += len(encoder.flush())
+    return out + len(encoder.finish())
+
+
+def measure(encoding: str, level: int, chunks: list, streamed: bool, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        size = compress(encoding, level, chunks, streamed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--pages", default="20,100,1000", help="comma separated page sizes"
+    )
+    parser.add_argument("--user-events", type=int, default=100)
+    parser.add_argument("--speakers-per-event", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = [int(size) for size in args.pages.split(",")]
+    seed(max(pages + [args.user_events, 1000]), args.speakers_per_event)
+    encodings = available_encodings()
+    print(f"codings: {', '.join(encodings)}, times are the median in ms")
+    print(
+        f"{'response':<36}{'coding':<8}{'level':>6}{'bytes':>10}"
+        f"{'ratio':>8}{'ms':>9}{'MB/s':>8}"
+    )
+    for name, (content_type, chunks) in build_payloads(pages, args.user_events).items():
+        size = sum(len(chunk) for chunk in chunks)
+        streamed = content_type != "application/json"
+        print(f"{name:<36}{'none':<8}{'':>6}{size:>10}")
+        for encoding in encodings:
+            for level in TRIED_LEVELS[encoding]:
+                ms, compressed = measure(
+                    encoding, level, chunks, streamed, args.iterations
+                )
+                used = "*" if LEVELS[content_type][encoding] == level else " "
+                print(
+                    f"{'':<36}{encoding:<8}{level:>5}{used}{compressed:>10}"
+                    f"{size / compressed:>7.1f}x{ms:>9.3f}"
+                    f"{size / ms / 1000:>8.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
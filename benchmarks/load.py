@@ -0,0 +1,598 @@
+"""Load-test every route of the users, events, speakers and venues routers.
+
+A database (a SQLite file in a new temporary directory by default, or the one
+of DATABASE_URL, which has to be empty) is seeded with users, events booked
+into venues and speakers, and the app is started on it with uvicorn. Each
+concurrent client logs in as one of the seeded users and runs rounds of a
+scenario calling every route once: it signs up, edits and deletes a user,
+creates, reads, edits and deletes its own events, speakers and venues one by
+one and in bulk, and reads the seeded ones.
+
+The report is JSON: the number of requests, errors (non-2xx), status codes,
+throughput and p50/p95/p99 latency of every route, by method and path
+template, and of all of them. Keep the reports of two commits and compare
+them, exiting with 1 when a route got slower than the tolerance:
+
+Usage:
+    python benchmarks/load.py [--clients 16] [--rounds 20] [--output load.json]
+    python benchmarks/load.py --compare before.json after.json [--tolerance 0.25]
+
+Pass --url to load-test an already running server instead, seeded through
+DATABASE_URL. Logins and signups hash with bcrypt, set BCRYPT_ROUNDS (read
+by the server) to take them out of the measure.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark-load.db"
+)
+os.environ.setdefault("SECRET_KEY", os.urandom(16).hex())
+# The signups use example.org, which accepts no mail (null MX)
+os.environ.setdefault("EMAIL_DELIVERABILITY", "off")
+
+import httpx  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from tim_events_api.main import app  # noqa: E402,F401
+from tim_events_api.database import Base, SessionLocal, engine  # noqa: E402
+from tim_events_api.models import (  # noqa: E402
+    models_event,
+    models_speaker,
+    models_user,
+    models_venue,
+)
+from tim_events_api.passwords import bcrypt_hash  # noqa: E402
+from percentiles import percentile  # noqa: E402
+
+PASSWORD = "benchmark-password"
+SEEDED_START = datetime(2030, 1, 1)
+# The events created by the clients are booked after the seeded ones
+CREATED_START = datetime(2040, 1, 1)
+BULK_SIZE = 5
+PAGE_SIZE = 20
+
+
+def seed(users: int, events_per_user: int, speakers_per_event: int, venues: int):
+    """Seed the database, every event booked into a venue at its own time."""
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.scalar(select(models_user.User.id).limit(1)) is not None:
+            sys.exit(f"{engine.url} already has users, empty it first")
+    hashed_password = bcrypt_hash(PASSWORD)
+    with engine.begin() as connection:
+        connection.execute(
+            models_user.User.__table__.insert(),
+            [
+                dict(
+                    username=f"user{i}",
+                    email=f"user{i}@example.org",
+                    first_name="Load",
+                    last_name=f"User {i}",
+                    hashed_password=hashed_password,
+                    # Lets the clients read the other users
+                    is_admin=True,
+                )
+                for i in range(users)
+            ],
+        )
+        connection.execute(
+            models_venue.Venue.__table__.insert(),
+            [
+                dict(
+                    name=f"Venue {i}",
+                    location="Lagos",
+                    capacity=100 + i,
+                    description="A large hall " * 4,
+                )
+                for i in range(venues)
+            ],
+        )
+        events = users * events_per_user
+        connection.execute(
+            models_event.Event.__table__.insert(),
+            [
+                dict(
+                    name=f"Event {i}",
+                    description="A conference about things " * 4,
+                    location="Lagos",
+                    start_time=SEEDED_START + timedelta(hours=2 * i),
+                    end_time=SEEDED_START + timedelta(hours=2 * i + 1),
+                    organizer_id=i % users + 1,
+                    venue_id=i % venues + 1,
+                )
+                for i in range(events)
+            ],
+        )
+        connection.execute(
+            models_speaker.Speaker.__table__.insert(),
+            [
+                dict(
+                    first_name="Ada",
+                    last_name=f"Speaker {i}",
+                    contact_info="ada@example.org",
+                    bio="Speaks about things " * 8,
+                    event_id=i % events + 1,
+                )
+                for i in range(events * speakers_per_event)
+            ],
+        )
+
+
+class Client:
+    """A client logged in as a seeded user, running rounds of the scenario.
+    Args:
+    http (AsyncClient): The HTTP client, shared by all clients.
+    number (int): The number of the client, from 0.
+    args (Namespace): The command line arguments.
+    timings (dict): The (seconds, status) of every request, by route.
+    """
+
+    def __init__(self, http, number: int, args, timings: dict):
+        self.http = http
+        self.number = number
+        self.args = args
+        self.timings = timings
+        self.record = False
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.user_id = number + 1
+        self.username = f"user{number}"
+        self.headers = {}
+        self.slots = 0
+        self.signups = 0
+
+    async def call(self, method: str, template: str, headers=None, **kwargs):
+        """Send a request, timed under its method and path template.
+        The path parameters are the keyword arguments ending with _id.
+        Returns the response, or None when the connection failed."""
+        path = {key: kwargs.pop(key) for key in list(kwargs) if key.endswith("_id")}
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(
+                method,
+                template.format(**path),
+                headers=self.headers if headers is None else headers,
+                **kwargs,
+            )
+            status = response.status_code
+        except httpx.TransportError:
+            response = status = None
+        elapsed = time.perf_counter() - started
+        if self.record:
+            self.timings.setdefault(f"{method} {template}", []).append(
+                (elapsed, status)
+            )
+        return response
+
+    async def login(self, username: str):
+        """Log in as a user, returns the authorization headers or None."""
+        response = await self.call(
+            "POST",
+            "/token",
+            headers={},
+            data=dict(username=username, password=PASSWORD),
+        )
+        if not ok(response):
+            return None
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def slot(self):
+        """The times of a new event, no two clients or events share them."""
+        start = CREATED_START + timedelta(
+            hours=2 * (self.slots * self.args.clients + self.number)
+        )
+        self.slots += 1
+        return dict(
+            start_time=start.isoformat(),
+            end_time=(start + timedelta(hours=1)).isoformat(),
+        )
+
+    def event(self):
+        return dict(
+            name="Load test event",
+            description="Created by the load test",
+            location="Lagos",
+            venue_id=self.rng.randint(1, self.args.venues),
+            **self.slot(),
+        )
+
+    def seeded_event_id(self):
+        """One of the events seeded for the client's user."""
+        number = self.rng.randrange(self.args.events_per_user)
+        return number * self.args.users + self.user_id
+
+    async def run(self, rounds: int):
+        self.headers = await self.login(self.username)
+        if self.headers is None:
+            sys.exit(f"client {self.number} could not log in as {self.username}")
+        for _ in range(rounds):
+            await self.users()
+            await self.events()
+            await self.venues()
+
+    async def users(self):
+        self.signups += 1
+        username = f"signup{self.number}x{self.signups}"
+        user = dict(
+            email=f"{username}@example.org",
+            first_name="Load",
+            last_name="Signup",
+            username=username,
+        )
+        response = await self.call(
+            "POST", "/users/", headers={}, json=user | dict(password=PASSWORD)
+        )
+        await self.call("GET", "/users/", params=dict(limit=PAGE_SIZE))
+        await self.call("GET", "/users/me/")
+        await self.call(
+            "GET",
+            "/users/{user_id}/",
+            user_id=self.rng.randint(1, self.args.users),
+        )
+        if not ok(response):
+            return
+        headers = await self.login(username)
+        if headers is None:
+            return
+        await self.call("PUT", "/users/me/", headers=headers, json=user)
+        await self.call(
+            "PATCH", "/users/me/", headers=headers, json=dict(first_name="Patched")
+        )
+        await self.call("DELETE", "/users/me/", headers=headers)
+
+    async def events(self):
+        event = self.event()
+        response = await self.call("POST", "/users/me/events", json=event)
+        await self.call("GET", "/users/me/events", params=dict(limit=PAGE_SIZE))
+        await self.call(
+            "GET", "/users/me/events/{event_id}/", event_id=self.seeded_event_id()
+        )
+        if not ok(response):
+            return
+        event_id = response.json()["id"]
+        await self.call(
+            "PUT",
+            "/users/me/events/{event_id}/",
+            event_id=event_id,
+            json=event | dict(name="Updated"),
+        )
+        await self.call(
+            "PATCH",
+            "/users/me/events/{event_id}/",
+            event_id=event_id,
+            json=self.slot(),
+        )
+        await self.speakers(event_id)
+        await self.call("DELETE", "/users/me/events/{event_id}/", event_id=event_id)
+
+        events = [self.event() for _ in range(BULK_SIZE)]
+        response = await self.call(
+            "POST", "/users/me/events/bulk/", json=events, params=dict(ids_only=True)
+        )
+        if not ok(response):
+            return
+        event_ids = [result["id"] for result in response.json()["results"]]
+        await self.call(
+            "PUT",
+            "/users/me/events/bulk/",
+            json=[
+                self.event() | dict(id=event_id, name="Updated")
+                for event_id in event_ids
+            ],
+        )
+        await self.call("DELETE", "/users/me/events/bulk/", json=event_ids)
+
+    async def speakers(self, event_id: int):
+        speaker = dict(
+            first_name="Ada",
+            last_name="Lovelace",
+            contact_info="ada@example.org",
+            bio="Speaks about engines",
+            event_id=event_id,
+        )
+        response = await self.call("POST", "/users/me/speakers/", json=speaker)
+        await self.call("GET", "/users/me/speakers/", params=dict(limit=PAGE_SIZE))
+        await self.call(
+            "GET", "/users/me/events/{event_id}/speakers", event_id=event_id
+        )
+        await self.call(
+            "GET",
+            "/users/me/events/speakers",
+            params=dict(event_ids=[self.seeded_event_id(), event_id]),
+        )
+        if not ok(response):
+            return
+        speaker_id = response.json()["id"]
+        await self.call(
+            "GET", "/users/me/speakers/{speaker_id}/", speaker_id=speaker_id
+        )
+        await self.call(
+            "PUT",
+            "/users/me/speakers/{speaker_id}/",
+            speaker_id=speaker_id,
+            json=speaker | dict(bio="Updated"),
+        )
+        await self.call(
+            "PATCH",
+            "/users/me/speakers/{speaker_id}/",
+            speaker_id=speaker_id,
+            json=dict(bio="Patched"),
+        )
+        await self.call(
+            "DELETE", "/users/me/speakers/{speaker_id}/", speaker_id=speaker_id
+        )
+
+        response = await self.call(
+            "POST",
+            "/users/me/speakers/bulk/",
+            json=[speaker] * BULK_SIZE,
+            params=dict(ids_only=True),
+        )
+        if not ok(response):
+            return
+        speaker_ids = [result["id"] for result in response.json()["results"]]
+        await self.call(
+            "PUT",
+            "/users/me/speakers/bulk/",
+            json=[speaker | dict(id=speaker_id) for speaker_id in speaker_ids],
+            params=dict(ids_only=True),
+        )
+        await self.call("DELETE", "/users/me/speakers/bulk/", json=speaker_ids)
+
+    async def venues(self):
+        venue = dict(name="Load venue", location="Abuja", capacity=50, description="")
+        seeded_id = self.rng.randint(1, self.args.venues)
+        response = await self.call("POST", "/venues/", json=venue)
+        await self.call("GET", "/venues/", params=dict(limit=PAGE_SIZE))
+        await self.call("GET", "/venues/{venue_id}/", venue_id=seeded_id)
+        start = SEEDED_START + timedelta(hours=self.rng.randrange(24 * 365))
+        await self.call(
+            "GET",
+            "/venues/{venue_id}/availability",
+            venue_id=seeded_id,
+            params=dict(
+                start=start.isoformat(),
+                end=(start + timedelta(hours=4)).isoformat(),
+            ),
+        )
+        await self.call(
+            "GET",
+            "/venues/{venue_id}/conflicts",
+            venue_id=seeded_id,
+            params=dict(
+                starts_after=start.isoformat(),
+                ends_before=(start + timedelta(days=30)).isoformat(),
+            ),
+        )
+        if not ok(response):
+            return
+        venue_id = response.json()["id"]
+        await self.call(
+            "PUT",
+            "/venues/{venue_id}/",
+            venue_id=venue_id,
+            json=venue | dict(capacity=60),
+        )
+        await self.call(
+            "PATCH", "/venues/{venue_id}/", venue_id=venue_id, json=dict(capacity=70)
+        )
+        await self.call("DELETE", "/venues/{venue_id}/", venue_id=venue_id)
+
+        response = await self.call(
+            "POST",
+            "/venues/bulk/",
+            json=[venue] * BULK_SIZE,
+            params=dict(ids_only=True),
+        )
+        if not ok(response):
+            return
+        venue_ids = [result["id"] for result in response.json()["results"]]
+        await self.call(
+            "PUT",
+            "/venues/bulk/",
+            json=[venue | dict(id=venue_id) for venue_id in venue_ids],
+            params=dict(ids_only=True),
+        )
+        await self.call("DELETE", "/venues/bulk/", json=venue_ids)
+
+
+def ok(response):
+    return response is not None and response.is_success
+
+
+def summarize(timings: list, elapsed: float):
+    """Summarize the (seconds, status) of the requests of a route, the
+    failed connections are counted as the "connection error" status."""
+    seconds = sorted(timing for timing, _ in timings)
+    statuses = Counter(
+        "connection error" if status is None else str(status) for _, status in timings
+    )
+    return {
+        "requests": len(timings),
+        "errors": sum(
+            1 for _, status in timings if status is None or not 200 <= status < 300
+        ),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(timings) / elapsed, 2),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 3),
+        "p50_ms": round(percentile(seconds, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 0.99) * 1000, 3),
+        "max_ms": round(seconds[-1] * 1000, 3),
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def load(url: str, args):
+    timings = {}
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as http:
+        clients = [
+            Client(http, number, args, timings) for number in range(args.clients)
+        ]
+        if args.warmup:
+            await asyncio.gather(*(client.run(args.warmup) for client in clients))
+        for client in clients:
+            client.record = True
+        started = time.perf_counter()
+        await asyncio.gather(*(client.run(args.rounds) for client in clients))
+        elapsed = time.perf_counter() - started
+    every = [timing for route in timings.values() for timing in route]
+    return {
+        "meta": {
+            "commit": commit(),
+            "database": engine.url.get_backend_name(),
+            "python": platform.python_version(),
+            "clients": args.clients,
+            "rounds": args.rounds,
+            "users": args.users,
+            "events_per_user": args.events_per_user,
+            "speakers_per_event": args.speakers_per_event,
+            "venues": args.venues,
+            "elapsed_s": round(elapsed, 3),
+        },
+        "endpoints": {
+            route: summarize(route_timings, elapsed)
+            for route, route_timings in sorted(timings.items())
+        },
+        "total": summarize(every, elapsed),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int):
+    """Start the app with uvicorn and wait until it answers."""
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "tim_events_api.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit("the server exited before answering")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    sys.exit("the server did not answer within 30 seconds")
+
+
+def compare(before_path: str, after_path: str, tolerance: float):
+    """Print the p95 and throughput changes of every route between two
+    reports, exiting with 1 when a p95 grew by more than the tolerance."""
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    routes = {**before["endpoints"], **after["endpoints"], "total": None}
+    regressions = []
+    print(f"{'route':<48}{'p95 before':>12}{'p95 after':>12}{'change':>9}{'rps':>9}")
+    for route in routes:
+        old = before["total"] if route == "total" else before["endpoints"].get(route)
+        new = after["total"] if route == "total" else after["endpoints"].get(route)
+        if old is None or new is None:
+            print(
+                f"{route:<48}{'only in ' + ('after' if old is None else 'before'):>42}"
+            )
+            continue
+        change = new["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        rps_change = (
+            new["throughput_rps"] / old["throughput_rps"] - 1
+            if old["throughput_rps"]
+            else 0.0
+        )
+        print(
+            f"{route:<48}{old['p95_ms']:>12.2f}{new['p95_ms']:>12.2f}"
+            f"{change:>+9.0%}{rps_change:>+9.0%}"
+        )
+        if change > tolerance:
+            regressions.append(route)
+    if regressions:
+        sys.exit(
+            f"p95 regressed by more than {tolerance:.0%}: {', '.join(regressions)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--rounds", type=int, default=20, help="scenarios per client")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured rounds")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--events-per-user", type=int, default=20)
+    parser.add_argument("--speakers-per-event", type=int, default=2)
+    parser.add_argument("--venues", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="a running server, seeded through DATABASE_URL")
+    parser.add_argument("--output", help="write the report there, not to stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p95 growth")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare, args.tolerance)
+        return
+    if args.clients > args.users:
+        sys.exit("every client logs in as its own user, seed more --users")
+    seed(args.users, args.events_per_user, args.speakers_per_event, args.venues)
+    server = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        server = start_server(port)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        report = asyncio.run(load(url, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
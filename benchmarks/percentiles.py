@@ -0,0 +1,23 @@
+"""The percentiles reported by the benchmarks.
+
+The functions are:
+- percentile: Get the nearest-rank percentile of sorted timings.
+"""
+
+import math
+
+
+def percentile(timings: list, fraction: float):
+    """Get the nearest-rank percentile of sorted timings, the smallest timing
+    that at least that fraction of the timings do not exceed. It is never
+    below the median, however few the timings.
+    Args:
+    timings (list): The timings, sorted.
+    fraction (float): The percentile, eg. 0.95 for the p95.
+
+    Returns:
+    float: The timing.
+    """
+    # Rounded first, so that eg. 100 * 0.07 (7.000000000000001) ranks 7th
+    rank = math.ceil(round(len(timings) * fraction, 9))
+    return timings[max(rank, 1) - 1]
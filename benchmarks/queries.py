@@ -0,0 +1,502 @@
+"""Check the number of SQL statements of every route against a budget.
+
+Every route of the users, events, speakers and venues routers is called in
+process against a SQLite database seeded at a small size, then again once it
+has grown to a large size (--small and --large events per user, with a venue
+per event and speakers per event). The bulk routes are sent --small-bulk
+items at the small size and --large-bulk at the large one. The statements sent by each request are
+counted with the before_cursor_execute event of the engines, with the
+authentication and response caches emptied first so that every request takes
+its uncached path.
+
+A route fails when it sends more statements than its budget in BUDGETS, or
+more at the large size than at the small one: a count growing with the data,
+or with the items of a bulk request, is a query run per row (N+1). The counts are printed and the script exits with 1
+when a route failed or did not answer 2xx.
+
+Usage:
+    python benchmarks/queries.py [--small 1] [--large 500] [--small-bulk 2]
+        [--large-bulk 50] [--output queries.json]
+
+Set USE_ASYNC_DB=true to count the statements of the asyncio engine path.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark-queries.db"
+)
+os.environ.setdefault("SECRET_KEY", os.urandom(16).hex())
+# Hashing does not send statements, keep it cheap
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The signups use example.org, which accepts no mail (null MX)
+os.environ.setdefault("EMAIL_DELIVERABILITY", "off")
+# The in-process response cache, emptied before every request
+os.environ["RESPONSE_CACHE_URL"] = ""
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from tim_events_api.main import app  # noqa: E402
+from tim_events_api.crud.users import token_cache, user_cache  # noqa: E402
+from tim_events_api.database import Base, engine, sync_engines  # noqa: E402
+from tim_events_api.models import (  # noqa: E402
+    models_event,
+    models_speaker,
+    models_user,
+    models_venue,
+)
+from tim_events_api.passwords import bcrypt_hash  # noqa: E402
+from tim_events_api import response_cache  # noqa: E402
+
+PASSWORD = "benchmark-password"
+SEEDED_START = datetime(2030, 1, 1)
+# The events created by the requests are booked after the seeded ones
+CREATED_START = datetime(2040, 1, 1)
+USERS = 3
+SPEAKERS_PER_EVENT = 2
+PAGE_SIZE = 20
+
+# The most statements each route may send, by method and path template, with
+# empty caches, whatever the number of items of the bulk routes.
+BUDGETS = {
+    "POST /token": 1,
+    "POST /users/": 3,
+    "GET /users/": 2,
+    "GET /users/me/": 4,
+    "GET /users/{user_id}/": 4,
+    "PUT /users/me/": 4,
+    "PATCH /users/me/": 4,
+    "DELETE /users/me/": 3,
+    "POST /users/me/events": 8,
+    "GET /users/me/events": 3,
+    "POST /users/me/events/bulk/": 6,
+    "PUT /users/me/events/bulk/": 8,
+    "DELETE /users/me/events/bulk/": 4,
+    # The event, then its speakers, see fieldsets.load_nested
+    "GET /users/me/events/{event_id}/": 3,
+    "PUT /users/me/events/{event_id}/": 8,
+    "PATCH /users/me/events/{event_id}/": 8,
+    "DELETE /users/me/events/{event_id}/": 3,
+    "POST /users/me/speakers/": 4,
+    "GET /users/me/speakers/": 2,
+    "GET /users/me/events/{event_id}/speakers": 2,
+    "GET /users/me/events/speakers": 2,
+    "POST /users/me/speakers/bulk/": 3,
+    "PUT /users/me/speakers/bulk/": 5,
+    "DELETE /users/me/speakers/bulk/": 4,
+    "GET /users/me/speakers/{speaker_id}/": 2,
+    "PUT /users/me/speakers/{speaker_id}/": 4,
+    "PATCH /users/me/speakers/{speaker_id}/": 3,
+    "DELETE /users/me/speakers/{speaker_id}/": 3,
+    "POST /venues/": 3,
+    "GET /venues/": 2,
+    "POST /venues/bulk/": 2,
+    "PUT /venues/bulk/": 3,
+    "DELETE /venues/bulk/": 4,
+    "GET /venues/{venue_id}/": 2,
+    "GET /venues/{venue_id}/availability": 4,
+    "GET /venues/{venue_id}/conflicts": 3,
+    "PUT /venues/{venue_id}/": 3,
+    "PATCH /venues/{venue_id}/": 3,
+    "DELETE /venues/{venue_id}/": 3,
+}
+
+
+def seed_users(hashed_password: str):
+    """Seed the users organizing the events, user0 organizes the ones read
+    by the requests, and a user edited and deleted at each size."""
+    Base.metadata.create_all(bind=engine)
+    usernames = [f"user{i}" for i in range(USERS)] + ["editor-small", "editor-large"]
+    with engine.begin() as connection:
+        connection.execute(
+            models_user.User.__table__.insert(),
+            [
+                dict(
+                    username=username,
+                    email=f"{username}@example.org",
+                    first_name="Query",
+                    last_name=username,
+                    hashed_password=hashed_password,
+                    # Lets user0 read the other users
+                    is_admin=True,
+                )
+                for username in usernames
+            ],
+        )
+
+
+def seed_events(first: int, last: int):
+    """Seed the events first to last (excluded) of every user, each booked
+    into its own venue, and their speakers."""
+    with engine.begin() as connection:
+        connection.execute(
+            models_venue.Venue.__table__.insert(),
+            [
+                dict(
+                    name=f"Venue {i}",
+                    location="Lagos",
+                    capacity=100 + i,
+                    description="A large hall " * 4,
+                )
+                for i in range(first * USERS, last * USERS)
+            ],
+        )
+        # Inserted in order, so event i is booked into venue i + 1
+        connection.execute(
+            models_event.Event.__table__.insert(),
+            [
+                dict(
+                    name=f"Event {i}",
+                    description="A conference about things " * 4,
+                    location="Lagos",
+                    start_time=SEEDED_START + timedelta(hours=2 * i),
+                    end_time=SEEDED_START + timedelta(hours=2 * i + 1),
+                    organizer_id=i % USERS + 1,
+                    venue_id=i + 1,
+                )
+                for i in range(first * USERS, last * USERS)
+            ],
+        )
+        connection.execute(
+            models_speaker.Speaker.__table__.insert(),
+            [
+                dict(
+                    first_name="Ada",
+                    last_name=f"Speaker {i}",
+                    contact_info="ada@example.org",
+                    bio="Speaks about things " * 8,
+                    event_id=i // SPEAKERS_PER_EVENT + 1,
+                )
+                for i in range(
+                    first * USERS * SPEAKERS_PER_EVENT,
+                    last * USERS * SPEAKERS_PER_EVENT,
+                )
+            ],
+        )
+
+
+class Counter:
+    """Call routes, counting the statements each one sends.
+    Args:
+    client (TestClient): The client of the app.
+    """
+
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.headers = {}
+        # The items sent to the bulk routes
+        self.bulk_size = 1
+        self.statements = []
+        # route: (statements, status)
+        self.counts = {}
+        # route: the statements sent
+        self.sent = {}
+        self.slots = 0
+        for db_engine in sync_engines():
+            event.listen(db_engine, "before_cursor_execute", self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def call(self, method: str, template: str, headers=None, **kwargs):
+        """Send a request with empty caches, counted under its method and
+        path template. The path parameters are the keyword arguments ending
+        with _id."""
+        path = {key: kwargs.pop(key) for key in list(kwargs) if key.endswith("_id")}
+        token_cache.clear()
+        user_cache.clear()
+        response_cache.backend.clear()
+        self.statements.clear()
+        response = self.client.request(
+            method,
+            template.format(**path),
+            headers=self.headers if headers is None else headers,
+            **kwargs,
+        )
+        route = f"{method} {template}"
+        self.counts[route] = (len(self.statements), response.status_code)
+        self.sent[route] = list(self.statements)
+        return response
+
+    def login(self, username: str):
+        response = self.call(
+            "POST",
+            "/token",
+            headers={},
+            data=dict(username=username, password=PASSWORD),
+        )
+        if not response.is_success:
+            sys.exit(f"could not log in as {username}: {response.text}")
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def slot(self):
+        """The times of a new event, no two events share them."""
+        start = CREATED_START + timedelta(hours=2 * self.slots)
+        self.slots += 1
+        return dict(
+            start_time=start.isoformat(),
+            end_time=(start + timedelta(hours=1)).isoformat(),
+        )
+
+    def event(self):
+        return dict(
+            name="Query test event",
+            description="Created by the query budget check",
+            location="Lagos",
+            venue_id=1,
+            **self.slot(),
+        )
+
+    def run(self, size: str, bulk_size: int):
+        """Call every route once, sending bulk_size items to the bulk routes.
+        Returns the counts by route."""
+        self.counts = {}
+        self.bulk_size = bulk_size
+        self.headers = self.login("user0")
+        self.users(size)
+        self.events()
+        self.venues()
+        return self.counts
+
+    def users(self, size: str):
+        user = dict(
+            email=f"signup-{size}@example.org",
+            first_name="Query",
+            last_name="Signup",
+            username=f"signup-{size}",
+        )
+        self.call("POST", "/users/", headers={}, json=user | dict(password=PASSWORD))
+        self.call("GET", "/users/", params=dict(limit=PAGE_SIZE))
+        self.call("GET", "/users/me/")
+        self.call("GET", "/users/{user_id}/", user_id=1)
+        # The token names the user, keep the username
+        headers = self.login(f"editor-{size}")
+        user = dict(user, email=f"edited-{size}@example.org", username=f"editor-{size}")
+        self.call("PUT", "/users/me/", headers=headers, json=user)
+        self.call("PATCH", "/users/me/", headers=headers, json=dict(first_name="P"))
+        self.call("DELETE", "/users/me/", headers=headers)
+
+    def events(self):
+        event = self.event()
+        response = self.call("POST", "/users/me/events", json=event)
+        self.call("GET", "/users/me/events", params=dict(limit=PAGE_SIZE))
+        self.call("GET", "/users/me/events/{event_id}/", event_id=1)
+        if response.is_success:
+            event_id = response.json()["id"]
+            self.call(
+                "PUT",
+                "/users/me/events/{event_id}/",
+                event_id=event_id,
+                json=event | dict(name="Updated"),
+            )
+            self.call(
+                "PATCH",
+                "/users/me/events/{event_id}/",
+                event_id=event_id,
+                json=self.slot(),
+            )
+            self.speakers(event_id)
+            self.call("DELETE", "/users/me/events/{event_id}/", event_id=event_id)
+
+        response = self.call(
+            "POST",
+            "/users/me/events/bulk/",
+            json=[self.event() for _ in range(self.bulk_size)],
+            params=dict(ids_only=True),
+        )
+        if response.is_success:
+            event_ids = [result["id"] for result in response.json()["results"]]
+            self.call(
+                "PUT",
+                "/users/me/events/bulk/",
+                json=[
+                    self.event() | dict(id=event_id, name="Updated")
+                    for event_id in event_ids
+                ],
+                params=dict(ids_only=True),
+            )
+            self.call("DELETE", "/users/me/events/bulk/", json=event_ids)
+
+    def speakers(self, event_id: int):
+        speaker = dict(
+            first_name="Ada",
+            last_name="Lovelace",
+            contact_info="ada@example.org",
+            bio="Speaks about engines",
+            event_id=event_id,
+        )
+        response = self.call("POST", "/users/me/speakers/", json=speaker)
+        self.call("GET", "/users/me/speakers/", params=dict(limit=PAGE_SIZE))
+        self.call("GET", "/users/me/events/{event_id}/speakers", event_id=event_id)
+        self.call(
+            "GET", "/users/me/events/speakers", params=dict(event_ids=[1, event_id])
+        )
+        if response.is_success:
+            speaker_id = response.json()["id"]
+            self.call("GET", "/users/me/speakers/{speaker_id}/", speaker_id=speaker_id)
+            self.call(
+                "PUT",
+                "/users/me/speakers/{speaker_id}/",
+                speaker_id=speaker_id,
+                json=speaker | dict(bio="Updated"),
+            )
+            self.call(
+                "PATCH",
+                "/users/me/speakers/{speaker_id}/",
+                speaker_id=speaker_id,
+                json=dict(bio="Patched"),
+            )
+            self.call(
+                "DELETE", "/users/me/speakers/{speaker_id}/", speaker_id=speaker_id
+            )
+
+        response = self.call(
+            "POST",
+            "/users/me/speakers/bulk/",
+            json=[speaker] * self.bulk_size,
+            params=dict(ids_only=True),
+        )
+        if response.is_success:
+            speaker_ids = [result["id"] for result in response.json()["results"]]
+            self.call(
+                "PUT",
+                "/users/me/speakers/bulk/",
+                json=[speaker | dict(id=speaker_id) for speaker_id in speaker_ids],
+                params=dict(ids_only=True),
+            )
+            self.call("DELETE", "/users/me/speakers/bulk/", json=speaker_ids)
+
+    def venues(self):
+        venue = dict(name="Query venue", location="Abuja", capacity=50, description="")
+        response = self.call("POST", "/venues/", json=venue)
+        self.call("GET", "/venues/", params=dict(limit=PAGE_SIZE))
+        self.call("GET", "/venues/{venue_id}/", venue_id=1)
+        self.call(
+            "GET",
+            "/venues/{venue_id}/availability",
+            venue_id=1,
+            params=dict(
+                start=SEEDED_START.isoformat(),
+                end=(SEEDED_START + timedelta(days=365)).isoformat(),
+            ),
+        )
+        self.call("GET", "/venues/{venue_id}/conflicts", venue_id=1)
+        if response.is_success:
+            venue_id = response.json()["id"]
+            self.call(
+                "PUT",
+                "/venues/{venue_id}/",
+                venue_id=venue_id,
+                json=venue | dict(capacity=60),
+            )
+            self.call(
+                "PATCH", "/venues/{venue_id}/", venue_id=venue_id, json=dict(capacity=7)
+            )
+            self.call("DELETE", "/venues/{venue_id}/", venue_id=venue_id)
+
+        response = self.call(
+            "POST",
+            "/venues/bulk/",
+            json=[venue] * self.bulk_size,
+            params=dict(ids_only=True),
+        )
+        if response.is_success:
+            venue_ids = [result["id"] for result in response.json()["results"]]
+            self.call(
+                "PUT",
+                "/venues/bulk/",
+                json=[venue | dict(id=venue_id) for venue_id in venue_ids],
+                params=dict(ids_only=True),
+            )
+            self.call("DELETE", "/venues/bulk/", json=venue_ids)
+
+
+def check(small: dict, large: dict):
+    """Compare the counts of every route with its budget and between sizes.
+    Returns:
+    dict: The report of every route, with the reasons it failed.
+    """
+    report = {}
+    for route in sorted({*BUDGETS, *small, *large}):
+        budget = BUDGETS.get(route)
+        small_count, small_status = small.get(route, (None, None))
+        large_count, large_status = large.get(route, (None, None))
+        failures = []
+        if budget is None:
+            failures.append("no budget")
+        for count, status in ((small_count, small_status), (large_count, large_status)):
+            if count is None:
+                failures.append("not called")
+            elif not 200 <= status < 300:
+                failures.append(f"answered {status}")
+            elif budget is not None and count > budget:
+                failures.append(f"{count} statements over the budget")
+        if None not in (small_count, large_count) and large_count > small_count:
+            failures.append("grows with the data or the items")
+        report[route] = {
+            "budget": budget,
+            "small": small_count,
+            "large": large_count,
+            "failures": sorted(set(failures)),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--small", type=int, default=1, help="events per user")
+    parser.add_argument("--large", type=int, default=500, help="events per user")
+    parser.add_argument(
+        "--small-bulk", type=int, default=2, help="items per bulk request"
+    )
+    parser.add_argument(
+        "--large-bulk", type=int, default=50, help="items per bulk request"
+    )
+    parser.add_argument("--output", help="also write the report there as JSON")
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the statements of the failures"
+    )
+    args = parser.parse_args()
+    if not 0 < args.small < args.large:
+        sys.exit("--large must be above --small, and --small above 0")
+    if not 0 < args.small_bulk < args.large_bulk:
+        sys.exit("--large-bulk must be above --small-bulk, and --small-bulk above 0")
+
+    seed_users(bcrypt_hash(PASSWORD))
+    seed_events(0, args.small)
+    # A failing route is reported with its 500, not raised
+    with TestClient(app, raise_server_exceptions=False) as client:
+        counter = Counter(client)
+        small = counter.run("small", args.small_bulk)
+        seed_events(args.small, args.large)
+        large = counter.run("large", args.large_bulk)
+    report = check(small, large)
+
+    print(f"{'route':<48}{'budget':>8}{'small':>8}{'large':>8}  failures")
+    for route, result in report.items():
+        print(
+            f"{route:<48}{result['budget'] or '-':>8}{result['small'] or '-':>8}"
+            f"{result['large'] or '-':>8}  {', '.join(result['failures'])}"
+        )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    failed = [route for route, result in report.items() if result["failures"]]
+    if args.verbose:
+        for route in failed:
+            print(f"\n{route}, at the large size:")
+            for statement in counter.sent.get(route, []):
+                print("   ", " ".join(statement.split()))
+    if failed:
+        sys.exit(f"{len(failed)} routes failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
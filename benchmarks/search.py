@@ -0,0 +1,184 @@
+"""Measure the latency of the event search on a large synthetic table.
+
+Events are seeded with names, descriptions and locations drawn from a
+Zipf-distributed vocabulary, so a few words match a large share of the
+table and most match few events, spread over organizers and two years of
+start times. The search (query, speakers and JSON encoding, as served by
+GET /events/search) is then timed for a mix of searches: common, rare and
+two-word searches, with and without time range and organizer filters, and
+the page following each of them through its cursor.
+
+The database is the one of DATABASE_URL (a SQLite file in the temporary
+directory by default), it has to have no events. Seeding a million events
+takes a few minutes, pass --reuse to run again on an already seeded database.
+
+Usage:
+    python benchmarks/search.py [--rows 1000000] [--iterations 500]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/benchmark-search.db"
+)
+
+from sqlalchemy import func, select  # noqa: E402
+from tim_events_api.main import app  # noqa: E402,F401
+from tim_events_api.database import Base, SessionLocal, engine  # noqa: E402
+from tim_events_api.crud.search import search_events  # noqa: E402
+from tim_events_api.models import models_event, models_user  # noqa: E402
+from tim_events_api.serialization import page_response  # noqa: E402
+from percentiles import percentile  # noqa: E402
+
+VOCABULARY_SIZE = 5000
+ORGANIZERS = 1000
+CITIES = [f"city{i}" for i in range(200)]
+START = datetime(2030, 1, 1)
+BATCH_SIZE = 10000
+
+
+def vocabulary(rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    words = sorted(words)
+    # Zipf-like weights, the first words are the most common
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def seed(rows: int, words: list, weights: list, rng: random.Random):
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.scalar(select(models_event.Event.id).limit(1)) is not None:
+            sys.exit(f"{engine.url} already has events, pass --reuse or empty it")
+    with engine.begin() as connection:
+        connection.execute(
+            models_user.User.__table__.insert(),
+            [
+                dict(username=f"organizer{i}", email=f"organizer{i}@example.org")
+                for i in range(ORGANIZERS)
+            ],
+        )
+    for offset in range(0, rows, BATCH_SIZE):
+        events = []
+        for _ in range(min(BATCH_SIZE, rows - offset)):
+            start_time = START + timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+            events.append(
+                dict(
+                    name=" ".join(rng.choices(words, weights, k=rng.randint(2, 5))),
+                    description=" ".join(
+                        rng.choices(words, weights, k=rng.randint(10, 40))
+                    ),
+                    location=rng.choice(CITIES),
+                    start_time=start_time,
+                    end_time=start_time + timedelta(hours=rng.randint(1, 48)),
+                    organizer_id=rng.randint(1, ORGANIZERS),
+                )
+            )
+        with engine.begin() as connection:
+            connection.execute(models_event.Event.__table__.insert(), events)
+        print(f"\rseeded {offset + len(events)}/{rows} events", end="", flush=True)
+    print()
+
+
+def searches(words: list, rng: random.Random, count: int):
+    """Build a mix of searches, as keyword arguments of search_events."""
+    common, rare = words[:20], words[200:]
+
+    def in_month():
+        starts_after = START + timedelta(days=rng.randrange(700))
+        return dict(
+            q=rng.choice(words[:500]),
+            starts_after=starts_after,
+            ends_before=starts_after + timedelta(days=30),
+        )
+
+    kinds = {
+        "common word": lambda: dict(q=rng.choice(common)),
+        "rare word": lambda: dict(q=rng.choice(rare)),
+        "two words": lambda: dict(q=f"{rng.choice(words[:500])} {rng.choice(words)}"),
+        "word + month": in_month,
+        "word + organizer": lambda: dict(
+            q=rng.choice(words[:500]), organizer_id=rng.randint(1, ORGANIZERS)
+        ),
+    }
+    return [
+        (kind, build()) for kind, build in rng.choices(list(kinds.items()), k=count)
+    ]
+
+
+def run(search: dict, limit: int):
+    """Get the first page of a search and the next one, like a client would."""
+    with SessionLocal() as db:
+        started = time.perf_counter()
+        page = search_events(db=db, limit=limit, **search)
+        page_response(page)
+        first = time.perf_counter() - started
+        if page.next_cursor is None:
+            return first, None
+        started = time.perf_counter()
+        page_response(
+            search_events(db=db, limit=limit, after=page.next_cursor, **search)
+        )
+        return first, time.perf_counter() - started
+
+
+def percentiles(timings: list):
+    timings = sorted(timing * 1000 for timing in timings)
+    return (
+        statistics.median(timings),
+        percentile(timings, 0.95),
+        percentile(timings, 0.99),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20, help="results per page")
+    parser.add_argument("--target-ms", type=float, default=50, help="p95 target")
+    parser.add_argument("--reuse", action="store_true", help="skip the seeding")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words, weights = vocabulary(rng)
+    if not args.reuse:
+        seed(args.rows, words, weights, rng)
+    with SessionLocal() as db:
+        rows = db.scalar(select(func.count()).select_from(models_event.Event))
+
+    timings = {}
+    for kind, search in searches(words, rng, args.iterations):
+        first, following = run(search, args.limit)
+        timings.setdefault(kind, []).append(first)
+        timings.setdefault("(next page)", [])
+        if following is not None:
+            timings["(next page)"].append(following)
+    every = [timing for kind_timings in timings.values() for timing in kind_timings]
+
+    print(f"{rows} events, {args.iterations} searches, times in ms")
+    print(f"{'search':<20}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for kind, kind_timings in sorted(timings.items()) + [("all", every)]:
+        if kind_timings:
+            p50, p95, p99 = percentiles(kind_timings)
+            print(f"{kind:<20}{len(kind_timings):>7}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+    p95 = percentiles(every)[1]
+    if p95 > args.target_ms:
+        sys.exit(f"p95 {p95:.2f} ms is above the {args.target_ms:g} ms target")
+    print(f"p95 {p95:.2f} ms is within the {args.target_ms:g} ms target")
+
+
+if __name__ == "__main__":
+    main()
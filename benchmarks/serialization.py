@@ -0,0 +1,174 @@
+"""Compare the fast serialization path of the list endpoints with the ORM one.
+
+For each list endpoint, one page is built both ways against a seeded SQLite
+database:
+- orm: ORM objects, validated through the response_model with pydantic
+  orm_mode, encoded with jsonable_encoder and json (the previous path).
+- fast: column tuples zipped into dicts and encoded with orjson.
+Both bodies are checked to decode to the same document before timing.
+
+Usage:
+    python benchmarks/serialization.py [--limit 100] [--iterations 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark-serialization.db"
+)
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from tim_events_api.main import app  # noqa: E402,F401
+from tim_events_api.database import Base, SessionLocal, engine  # noqa: E402
+from tim_events_api.dependencies import to_schema  # noqa: E402
+from tim_events_api.serialization import page_response  # noqa: E402
+from tim_events_api.models import (  # noqa: E402
+    models_event,
+    models_speaker,
+    models_user,
+    models_venue,
+)
+from tim_events_api.schemas import (  # noqa: E402
+    schema_events,
+    schema_speakers,
+    schema_venues,
+)
+from tim_events_api.crud import events, speakers, venues  # noqa: E402
+from percentiles import percentile  # noqa: E402
+
+
+def seed(rows: int, speakers_per_event: int):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            models_user.User.__table__.insert(),
+            [dict(username="organizer", email="organizer@example.org")],
+        )
+        start = datetime(2030, 1, 1)
+        connection.execute(
+            models_event.Event.__table__.insert(),
+            [
+                dict(
+                    name=f"Event {i}",
+                    description="A conference about things " * 4,
+                    location="Lagos",
+                    start_time=start + timedelta(hours=i),
+                    end_time=start + timedelta(hours=i + 2),
+                    organizer_id=1,
+                )
+                for i in range(rows)
+            ],
+        )
+        connection.execute(
+            models_speaker.Speaker.__table__.insert(),
+            [
+                dict(
+                    first_name="Ada",
+                    last_name=f"Speaker {i}",
+                    contact_info="ada@example.org",
+                    bio="Speaks about things " * 8,
+                    event_id=i % rows + 1,
+                )
+                for i in range(rows * speakers_per_event)
+            ],
+        )
+        connection.execute(
+            models_venue.Venue.__table__.insert(),
+            [
+                dict(
+                    name=f"Venue {i}",
+                    location="Abuja",
+                    capacity=100 + i,
+                    description="A large hall " * 4,
+                )
+                for i in range(rows)
+            ],
+        )
+
+
+def orm_path(crud_function, schema, **kwargs):
+    """Build a page the way the endpoints did before the fast path."""
+    field = create_response_field(name="benchmark", type_=list[schema])
+    with SessionLocal() as db:
+        page = to_schema(schema, crud_function(db=db, **kwargs))
+    content = asyncio.run(serialize_response(field=field, response_content=page.items))
+    return JSONResponse(content).body
+
+
+def fast_path(crud_function, **kwargs):
+    with SessionLocal() as db:
+        page = crud_function(db=db, **kwargs)
+    return page_response(page).body
+
+
+def measure(function, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), percentile(timings, 0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=100, help="rows per page")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--speakers-per-event", type=int, default=3)
+    args = parser.parse_args()
+
+    seed(max(args.limit, 1) * 2, args.speakers_per_event)
+    endpoints = {
+        "GET /users/me/events": (
+            lambda: orm_path(
+                events.get_events,
+                schema_events.Event,
+                user_id=1,
+                limit=args.limit,
+                with_speakers=True,
+            ),
+            lambda: fast_path(events.get_event_rows, user_id=1, limit=args.limit),
+        ),
+        "GET /users/me/speakers": (
+            lambda: orm_path(
+                speakers.get_speakers,
+                schema_speakers.Speaker,
+                user_id=1,
+                limit=args.limit,
+            ),
+            lambda: fast_path(speakers.get_speaker_rows, user_id=1, limit=args.limit),
+        ),
+        "GET /venues/": (
+            lambda: orm_path(venues.get_venues, schema_venues.Venue, limit=args.limit),
+            lambda: fast_path(venues.get_venue_rows, limit=args.limit),
+        ),
+    }
+
+    print(f"{args.limit} rows per page, {args.iterations} iterations, times in ms")
+    print(f"{'endpoint':<24}{'path':<6}{'p50':>9}{'p95':>9}{'speedup':>9}")
+    for name, (orm, fast) in endpoints.items():
+        if json.loads(orm()) != json.loads(fast()):
+            sys.exit(f"{name}: the fast path does not match the orm path")
+        orm_p50, orm_p95 = measure(orm, args.iterations)
+        fast_p50, fast_p95 = measure(fast, args.iterations)
+        print(f"{name:<24}{'orm':<6}{orm_p50:>9.2f}{orm_p95:>9.2f}")
+        print(
+            f"{'':<24}{'fast':<6}{fast_p50:>9.2f}{fast_p95:>9.2f}"
+            f"{orm_p50 / fast_p50:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
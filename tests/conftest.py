@@ -0,0 +1,49 @@
+"""The app is tested in process, against a SQLite database made for the run."""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/tests.db")
+os.environ.setdefault("SECRET_KEY", os.urandom(16).hex())
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The signups use example.org, which accepts no mail (null MX)
+os.environ.setdefault("EMAIL_DELIVERABILITY", "off")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from tim_events_api.database import Base, engine  # noqa: E402
+from tim_events_api.main import app  # noqa: E402
+
+PASSWORD = "password"
+
+
+@pytest.fixture(scope="session")
+def client():
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def signup(client):
+    """Sign a user up and log them in, returning their Authorization header."""
+
+    def signup(username: str):
+        user = dict(
+            username=username,
+            email=f"{username}@example.org",
+            first_name="Ada",
+            last_name="Lovelace",
+            password=PASSWORD,
+        )
+        assert client.post("/users/", json=user).status_code == 200
+        response = client.post(
+            "/token", data=dict(username=username, password=PASSWORD)
+        )
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return signup
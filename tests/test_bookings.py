@@ -0,0 +1,129 @@
+def event(start: str, end: str, venue_id):
+    return dict(
+        name="Meetup",
+        description="Talks",
+        location="Lagos",
+        start_time=f"2030-01-01T{start}:00",
+        end_time=f"2030-01-01T{end}:00",
+        venue_id=venue_id,
+    )
+
+
+def test_patch_null_venue_unbooks_the_event(client, signup):
+    organizer = signup("unbooking-organizer")
+    other = signup("unbooking-other")
+    venue = dict(name="Hall", location="Lagos", capacity=100, description="A hall")
+    venue_id = client.post("/venues/", json=venue, headers=organizer).json()["id"]
+    booked = client.post(
+        "/users/me/events", json=event("10:00", "12:00", venue_id), headers=organizer
+    ).json()
+    taken = client.post(
+        "/users/me/events", json=event("11:00", "12:00", venue_id), headers=other
+    )
+    assert taken.status_code == 409
+
+    response = client.patch(
+        f"/users/me/events/{booked['id']}/", json=dict(venue_id=None), headers=organizer
+    )
+    assert response.status_code == 200
+    assert response.json()["venue_id"] is None
+
+    freed = client.post(
+        "/users/me/events", json=event("11:00", "12:00", venue_id), headers=other
+    )
+    assert freed.status_code == 200
+    assert freed.json()["venue_id"] == venue_id
+
+
+def test_patch_null_other_fields_is_refused(client, signup):
+    organizer = signup("null-name-organizer")
+    created = client.post(
+        "/users/me/events", json=event("10:00", "11:00", None), headers=organizer
+    ).json()
+    response = client.patch(
+        f"/users/me/events/{created['id']}/", json=dict(name=None), headers=organizer
+    )
+    assert response.status_code == 422
+
+
+def bulk_event(start: str, end: str, venue_id, **fields):
+    return dict(event(start, end, venue_id), **fields)
+
+
+def venue(client, headers):
+    hall = dict(name="Hall", location="Lagos", capacity=100, description="A hall")
+    return client.post("/venues/", json=hall, headers=headers).json()["id"]
+
+
+def test_bulk_bookings_conflict_within_the_request(client, signup):
+    organizer = signup("bulk-booking-organizer")
+    venue_id = venue(client, organizer)
+    existing = client.post(
+        "/users/me/events", json=event("09:00", "10:00", venue_id), headers=organizer
+    ).json()["id"]
+    events = [
+        event("10:00", "12:00", venue_id),
+        event("11:00", "13:00", venue_id),
+        event("09:30", "10:30", venue_id),
+        event("12:00", "13:00", venue_id),
+    ]
+    created = client.post(
+        "/users/me/events/bulk/", json=events, headers=organizer
+    ).json()
+    errors = [result.get("error") for result in created["results"]]
+    assert errors == [
+        None,
+        "venue is already booked by item 0 of the request",
+        f"venue is already booked by event {existing} and item 0 of the request",
+        None,
+    ]
+
+
+def test_bulk_bookings_swap_two_events(client, signup):
+    organizer = signup("swap-organizer")
+    venue_id = venue(client, organizer)
+    first, second = (
+        client.post(
+            "/users/me/events", json=event(start, end, venue_id), headers=organizer
+        ).json()["id"]
+        for start, end in (("10:00", "11:00"), ("11:00", "12:00"))
+    )
+    swap = [
+        bulk_event("11:00", "12:00", venue_id, id=first),
+        bulk_event("10:00", "11:00", venue_id, id=second),
+    ]
+    updated = client.put("/users/me/events/bulk/", json=swap, headers=organizer)
+    assert updated.json()["succeeded"] == 2
+    stored = client.get(f"/users/me/events/{first}/", headers=organizer).json()
+    assert stored["start_time"] == "2030-01-01T11:00:00"
+
+
+def test_bulk_bookings_refused_move_keeps_its_slot(client, signup):
+    organizer = signup("refused-move-organizer")
+    other = signup("refused-move-other")
+    venue_id = venue(client, organizer)
+    first, second, taken = (
+        client.post(
+            "/users/me/events", json=event(start, end, venue_id), headers=organizer
+        ).json()["id"]
+        for start, end in (("10:00", "11:00"), ("11:00", "12:00"), ("13:00", "14:00"))
+    )
+    moves = [
+        bulk_event("11:00", "12:00", venue_id, id=first),
+        bulk_event("13:00", "14:00", venue_id, id=second),
+        bulk_event("10:00", "11:00", venue_id, id=first),
+    ]
+    results = client.put(
+        "/users/me/events/bulk/", json=moves, headers=organizer
+    ).json()["results"]
+    # The second event stays at 11:00, where the first one was being moved
+    assert [result.get("error") for result in results] == [
+        f"venue is already booked by event {second}",
+        f"venue is already booked by event {taken}",
+        "event is already in the request",
+    ]
+    # The first event kept its slot as well
+    response = client.post(
+        "/users/me/events", json=event("10:00", "11:00", venue_id), headers=other
+    )
+    assert response.status_code == 409
@@ -0,0 +1,124 @@
+def event(name: str):
+    return dict(
+        name=name,
+        description="Talks",
+        location="Lagos",
+        start_time="2032-01-01T10:00:00",
+        end_time="2032-01-01T11:00:00",
+    )
+
+
+def speaker(last_name: str, event_id: int):
+    return dict(
+        first_name="Ada",
+        last_name=last_name,
+        contact_info="ada@example.org",
+        bio="Engines",
+        event_id=event_id,
+    )
+
+
+def bulk_delete(client, url: str, ids: list, headers: dict):
+    return client.request("DELETE", url, json=ids, headers=headers).json()
+
+
+def test_bulk_venues_return_the_ids_of_the_stored_rows(client, signup):
+    organizer = signup("bulk-venues")
+    venues = [
+        dict(name=f"Hall {n}", location="Lagos", capacity=n, description="A hall")
+        for n in range(1, 4)
+    ]
+    created = client.post("/venues/bulk/", json=venues, headers=organizer).json()
+    assert (created["succeeded"], created["failed"]) == (3, 0)
+    assert [result["index"] for result in created["results"]] == [0, 1, 2]
+    for venue, result in zip(venues, created["results"]):
+        stored = client.get(f"/venues/{result['id']}/", headers=organizer).json()
+        assert stored == {**venue, "id": result["id"]} == result["item"]
+
+    ids = [result["id"] for result in created["results"]]
+    updates = [dict(venues[0], id=ids[0], capacity=50), dict(venues[1], id=0)]
+    updated = client.put("/venues/bulk/", json=updates, headers=organizer).json()
+    assert (updated["succeeded"], updated["failed"]) == (1, 1)
+    assert updated["results"][1]["error"] == "venue does not exist"
+    stored = client.get(f"/venues/{ids[0]}/", headers=organizer).json()
+    assert stored["capacity"] == 50
+
+    deleted = bulk_delete(client, "/venues/bulk/", [ids[2], 0], organizer)
+    assert (deleted["succeeded"], deleted["failed"]) == (1, 1)
+    assert client.get(f"/venues/{ids[2]}/", headers=organizer).status_code == 400
+
+
+def test_bulk_events_skip_the_events_of_other_organizers(client, signup):
+    alice, bob = signup("bulk-alice"), signup("bulk-bob")
+    names = ["Opening", "Keynote", "Closing"]
+    created = client.post(
+        "/users/me/events/bulk/", json=[event(name) for name in names], headers=alice
+    ).json()
+    assert created["succeeded"] == 3
+    ids = [result["id"] for result in created["results"]]
+    assert len(set(ids)) == 3
+    for name, event_id in zip(names, ids):
+        stored = client.get(f"/users/me/events/{event_id}/", headers=alice).json()
+        assert (stored["id"], stored["name"]) == (event_id, name)
+
+    bobs = client.post(
+        "/users/me/events/bulk/",
+        json=[event("Workshop")],
+        params=dict(ids_only="true"),
+        headers=bob,
+    ).json()
+    (result,) = bobs["results"]
+    assert "item" not in result
+    bob_id = result["id"]
+
+    updates = [dict(event("Hijacked"), id=ids[0]), dict(event("Hackathon"), id=bob_id)]
+    updated = client.put("/users/me/events/bulk/", json=updates, headers=bob).json()
+    assert updated["results"][0] == dict(
+        index=0, id=ids[0], error="event does not exist"
+    )
+    assert updated["results"][1]["item"]["name"] == "Hackathon"
+    stored = client.get(f"/users/me/events/{ids[0]}/", headers=alice).json()
+    assert stored["name"] == "Opening"
+
+    deleted = bulk_delete(client, "/users/me/events/bulk/", [ids[1], bob_id], bob)
+    assert [result.get("error") for result in deleted["results"]] == [
+        "event does not exist",
+        None,
+    ]
+    assert client.get(f"/users/me/events/{ids[1]}/", headers=alice).status_code == 200
+    assert client.get(f"/users/me/events/{bob_id}/", headers=bob).status_code == 400
+
+
+def test_bulk_speakers_report_the_error_on_the_item(client, signup):
+    alice, bob = signup("bulk-speakers-alice"), signup("bulk-speakers-bob")
+    alice_event = client.post(
+        "/users/me/events", json=event("Panel"), headers=alice
+    ).json()["id"]
+    bob_event = client.post(
+        "/users/me/events", json=event("Panel"), headers=bob
+    ).json()["id"]
+    speakers = [
+        speaker("Lovelace", alice_event),
+        speaker("Babbage", bob_event),
+        speaker("Hopper", alice_event),
+    ]
+    created = client.post(
+        "/users/me/speakers/bulk/", json=speakers, headers=alice
+    ).json()
+    assert (created["succeeded"], created["failed"]) == (2, 1)
+    assert created["results"][1] == dict(index=1, error="event does not exist")
+
+    stored = client.get(f"/users/me/events/{alice_event}/speakers", headers=alice)
+    by_id = {item["id"]: item["last_name"] for item in stored.json()}
+    assert by_id == {
+        created["results"][0]["id"]: "Lovelace",
+        created["results"][2]["id"]: "Hopper",
+    }
+
+    ids = list(by_id)
+    deleted = bulk_delete(client, "/users/me/speakers/bulk/", ids, bob)
+    assert deleted["failed"] == 2
+    deleted = bulk_delete(client, "/users/me/speakers/bulk/", ids, alice)
+    assert deleted["succeeded"] == 2
+    stored = client.get(f"/users/me/events/{alice_event}/speakers", headers=alice)
+    assert stored.json() == []
@@ -0,0 +1,65 @@
+import zlib
+
+import brotli
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from tim_events_api.compression import (
+    CompressionMiddleware,
+    available_encodings,
+    negotiate,
+)
+
+ROWS = [{"id": n, "name": f"Event {n}", "location": "Lagos"} for n in range(500)]
+LINES = [f'{{"id": {n}, "name": "Event {n}"}}\n'.encode() for n in range(500)]
+
+DECODERS = {
+    "gzip": lambda data: zlib.decompress(data, 31),
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+async def page(request):
+    return JSONResponse(ROWS)
+
+
+async def export(request):
+    async def lines():
+        for start in range(0, len(LINES), 100):
+            yield b"".join(LINES[start : start + 100])
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+app = CompressionMiddleware(
+    Starlette(routes=[Route("/page", page), Route("/export", export)])
+)
+
+
+def test_every_coding_is_installed():
+    assert available_encodings() == ["zstd", "br", "gzip"]
+
+
+def test_negotiate_prefers_the_highest_weight():
+    encodings = available_encodings()
+    assert negotiate("gzip, br, zstd", encodings) == "zstd"
+    assert negotiate("gzip, br;q=0.5", encodings) == "gzip"
+    assert negotiate("identity", encodings) is None
+
+
+@pytest.mark.parametrize("coding", ["zstd", "br", "gzip"])
+@pytest.mark.parametrize("path", ["/page", "/export"])
+def test_responses_are_compressed_with_the_coding(coding, path):
+    client = TestClient(app)
+    identity = client.get(path, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    with client.stream("GET", path, headers={"Accept-Encoding": coding}) as response:
+        assert response.headers["content-encoding"] == coding
+        assert response.headers["vary"] == "Accept-Encoding"
+        body = b"".join(response.iter_raw())
+    assert len(body) < len(identity.content)
+    assert DECODERS[coding](body) == identity.content
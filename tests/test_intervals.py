@@ -0,0 +1,63 @@
+import random
+
+from tim_events_api.intervals import IntervalTree
+
+
+def test_overlapping_is_half_open():
+    tree = IntervalTree([(10, 12, 1), (12, 14, 2), (20, 30, 3)])
+    assert tree.overlapping(11, 13) == [(10, 12, 1), (12, 14, 2)]
+    assert tree.overlapping(14, 20) == []
+    assert tree.overlapping(0, 10) == []
+    assert tree.overlapping(0, 100) == [(10, 12, 1), (12, 14, 2), (20, 30, 3)]
+
+
+def test_add_replaces_the_interval_of_a_key():
+    tree = IntervalTree([(10, 12, 1)])
+    tree.add(20, 22, 1)
+    assert len(tree) == 1
+    assert tree.overlapping(10, 12) == []
+    assert tree.overlapping(21, 22) == [(20, 22, 1)]
+
+
+def test_remove_returns_the_interval():
+    tree = IntervalTree([(10, 12, 1), (10, 11, -1)])
+    assert tree.remove(1) == (10, 12)
+    assert tree.remove(1) is None
+    assert 1 not in tree and -1 in tree
+    # The greatest end of the subtree no longer counts the removed interval
+    assert tree.overlapping(11, 12) == []
+
+
+def test_keys_break_the_ties_of_the_starts():
+    # The event ids and the negative keys of the items of a request
+    tree = IntervalTree([(10, 11, 7), (10, 12, -1), (10, 13, 3), (10, 14, -2)])
+    assert [key for _, _, key in tree.overlapping(10, 11)] == [-2, -1, 3, 7]
+    tree.remove(-1)
+    tree.remove(7)
+    assert [key for _, _, key in tree.overlapping(10, 11)] == [-2, 3]
+
+
+def test_matches_a_linear_scan():
+    rng = random.Random(0)
+    tree = IntervalTree()
+    intervals = {}
+    for _ in range(2000):
+        key = rng.randrange(-50, 50)
+        if rng.random() < 0.3:
+            assert tree.remove(key) == intervals.pop(key, None)
+        else:
+            start = rng.randrange(1000)
+            intervals[key] = (start, start + rng.randrange(1, 50))
+            tree.add(*intervals[key], key)
+        start = rng.randrange(1000)
+        end = start + rng.randrange(1, 100)
+        expected = sorted(
+            (
+                (low, high, key)
+                for key, (low, high) in intervals.items()
+                if low < end and high > start
+            ),
+            key=lambda interval: (interval[0], interval[2]),
+        )
+        assert tree.overlapping(start, end) == expected
+    assert len(tree) == len(intervals)
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("use_async_db", ["false", "true"])
+def test_routes_stay_within_their_query_budgets(use_async_db, tmp_path):
+    """Run benchmarks/queries.py, in a process of its own as it seeds its own
+    database, at two data sizes and two bulk sizes."""
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if name not in ("DATABASE_URL", "ASYNC_DATABASE_URL", "DATABASE_REPLICA_URLS")
+    }
+    env["DATABASE_URL"] = f"sqlite:///{tmp_path}/queries.db"
+    env["USE_ASYNC_DB"] = use_async_db
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "queries.py"),
+            "--small",
+            "1",
+            "--large",
+            "50",
+            "--small-bulk",
+            "2",
+            "--large-bulk",
+            "20",
+            "--verbose",
+        ],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=600,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
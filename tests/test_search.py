@@ -0,0 +1,68 @@
+from tim_events_api.crud import search
+
+
+def test_search_caps_and_selects_the_speakers(client, signup):
+    organizer = signup("search-organizer")
+    event = dict(
+        name="Quasar telescopes",
+        description="Talks",
+        location="Lagos",
+        start_time="2031-01-01T10:00:00",
+        end_time="2031-01-01T11:00:00",
+    )
+    event_id = client.post("/users/me/events", json=event, headers=organizer).json()[
+        "id"
+    ]
+    speaker = dict(
+        first_name="Ada",
+        last_name="Lovelace",
+        contact_info="ada@example.org",
+        bio="Engines",
+        event_id=event_id,
+    )
+    response = client.post(
+        "/users/me/speakers/bulk/", json=[speaker] * 5, headers=organizer
+    )
+    assert response.json()["succeeded"] == 5
+
+    (found,) = client.get(
+        "/events/search", params=dict(q="quasar"), headers=organizer
+    ).json()
+    assert len(found["speakers"]) == 5
+
+    (found,) = client.get(
+        "/events/search",
+        params=dict(q="quasar", fields="name,speakers.last_name", expand="speakers:2"),
+        headers=organizer,
+    ).json()
+    assert set(found) == {"id", "name", "score", "speakers"}
+    assert [set(item) for item in found["speakers"]] == [{"id", "last_name"}] * 2
+
+    (found,) = client.get(
+        "/events/search", params=dict(q="quasar", expand=""), headers=organizer
+    ).json()
+    assert "speakers" not in found
+
+
+def test_search_filters_before_capping_the_candidates(client, signup, monkeypatch):
+    alice, bob = signup("search-alice"), signup("search-bob")
+    event = dict(
+        name="Pulsar timing",
+        description="Talks",
+        location="Abuja",
+        start_time="2031-02-01T10:00:00",
+        end_time="2031-02-01T11:00:00",
+    )
+    client.post("/users/me/events", json=event, headers=alice)
+    for _ in range(5):
+        client.post("/users/me/events", json=event, headers=bob)
+    alice_id = client.get("/users/me", headers=alice).json()["id"]
+    monkeypatch.setattr(search, "SEARCH_MAX_CANDIDATES", 3)
+
+    found = client.get(
+        "/events/search", params=dict(q="pulsar", organizer_id=alice_id), headers=bob
+    ).json()
+    assert [item["organizer_id"] for item in found] == [alice_id]
+
+    found = client.get("/events/search", params=dict(q="pulsar"), headers=bob).json()
+    assert len(found) == 3
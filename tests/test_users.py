@@ -0,0 +1,16 @@
+from sqlalchemy import delete
+from tim_events_api.database import SessionLocal
+from tim_events_api.models.models_user import User
+
+
+def test_me_of_a_user_gone_from_the_database(client, signup):
+    headers = signup("gone-user")
+    assert client.get("/users/me/", headers=headers).status_code == 200
+    # Deleted behind the authentication cache, which still holds the user
+    with SessionLocal() as db:
+        db.execute(delete(User).where(User.username == "gone-user"))
+        db.commit()
+
+    response = client.get("/users/me/", headers=headers)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "user does not exist"}
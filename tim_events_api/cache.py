@@ -0,0 +1,110 @@
+"""This module contains the in-process caches shared by the app.
+The classes are:
+- TTLCache: A bounded mapping whose entries expire after a time to live.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+import time
+
+_MISSING = object()
+
+
+class TTLCache:
+    """A bounded mapping whose entries expire after a time to live.
+
+    When the cache is full the least recently used entry is evicted.
+    Hits and misses are counted so the hit ratio can be monitored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Get the value of a key.
+        Args:
+        key: The key to look up.
+        default: The value returned when the key is missing or expired.
+
+        Returns:
+        The cached value or the default.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        """Set the value of a key.
+        Args:
+        key: The key to set.
+        value: The value to cache.
+        ttl (float): Seconds the entry lives, defaults to the cache's ttl.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key from the cache.
+        Args:
+        key: The key to remove.
+        default: The value returned when the key is missing.
+
+        Returns:
+        The removed value or the default.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def discard_where(self, predicate):
+        """Remove every entry matching a predicate.
+        Args:
+        predicate: A function called with (key, value), returning True to remove.
+
+        Returns:
+        int: The number of removed entries.
+        """
+        with self._lock:
+            keys = [
+                key
+                for key, (_, value) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def hit_ratio(self):
+        """Get the share of lookups that were served from the cache.
+        Returns:
+        float: The hit ratio, 0.0 when nothing was looked up yet.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,120 @@
+"""This module coalesces the concurrent identical reads (single-flight), so
+that a burst of requests for the same resource runs its query and
+serialization once.
+
+The first request for a key leads a flight running the fetch, the ones for the
+same key arriving while it runs (and up to COALESCE_WINDOW seconds after it
+returned) follow it and get its result, or its error. A flight is followed by
+at most COALESCE_MAX_WAITERS requests, the next one leads a new flight, which
+bounds how many requests fail together if the fetch does. Failed flights are
+never joined after they fail.
+
+A leader whose request is cancelled (eg. the client went away) cancels its
+flight, its followers then fetch again instead of failing. The flights are
+kept in-process and run on the event loop thread, so they need no lock.
+
+The classes are:
+- Flight: A fetch shared by the requests for the same key.
+- SingleFlight: Coalesce the concurrent calls made for the same key.
+"""
+
+import asyncio
+import os
+import time
+
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0.05"))
+COALESCE_MAX_WAITERS = int(os.getenv("COALESCE_MAX_WAITERS", "1000"))
+
+
+class Flight:
+    """A fetch shared by the requests for the same key."""
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.returned_at = None
+
+
+class SingleFlight:
+    """Coalesce the concurrent calls made for the same key.
+    Args:
+    window (float): Seconds a returned flight can still be followed.
+    max_waiters (int): Requests that may follow a flight.
+    """
+
+    def __init__(
+        self, window: float = COALESCE_WINDOW, max_waiters: int = COALESCE_MAX_WAITERS
+    ):
+        self.window = window
+        self.max_waiters = max_waiters
+        # key: Flight
+        self._flights = {}
+        # The calls that ran the fetch, and those that got the result of another
+        self.leaders = 0
+        self.coalesced = 0
+        # The calls that started a new flight because the current one was full
+        self.overflows = 0
+
+    def in_flight(self):
+        """Count the flights still fetching."""
+        return sum(1 for flight in self._flights.values() if not flight.future.done())
+
+    def joinable(self, flight: Flight):
+        if flight.future.done():
+            if flight.future.cancelled() or flight.future.exception() is not None:
+                return False
+            if time.monotonic() - flight.returned_at > self.window:
+                return False
+        if flight.waiters >= self.max_waiters:
+            self.overflows += 1
+            return False
+        return True
+
+    def forget(self, key, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key, fetch):
+        """Run a fetch, or share the result of the one running for the key.
+        Args:
+        key: What the fetch reads, equal keys must give equal results.
+        fetch: A coroutine function without arguments.
+
+        Returns:
+        The result of the fetch.
+        """
+        flight = self._flights.get(key)
+        if flight is not None and self.joinable(flight):
+            flight.waiters += 1
+            self.coalesced += 1
+            try:
+                # Shielded, a follower going away must not cancel the flight
+                return await asyncio.shield(flight.future)
+            except asyncio.CancelledError:
+                if not flight.future.cancelled():
+                    raise
+            # The leader was cancelled, fetch again
+            return await self.run(key, fetch)
+
+        flight = Flight()
+        self._flights[key] = flight
+        self.leaders += 1
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            self.forget(key, flight)
+            raise
+        except Exception as error:
+            flight.future.set_exception(error)
+            # Marks the error as retrieved, a flight may have no follower
+            flight.future.exception()
+            self.forget(key, flight)
+            raise
+        flight.future.set_result(result)
+        flight.returned_at = time.monotonic()
+        if self.window > 0:
+            asyncio.get_running_loop().call_later(self.window, self.forget, key, flight)
+        else:
+            self.forget(key, flight)
+        return result
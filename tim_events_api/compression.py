@@ -0,0 +1,298 @@
+"""This module compresses the responses, negotiated with the Accept-Encoding
+header of the request among zstd, br (brotli) and gzip.
+
+Only the text content types are compressed (JSON, NDJSON, CSV, plain text),
+each with levels of its own, see LEVELS. Responses smaller than
+COMPRESSION_MIN_SIZE bytes, empty ones, 304s and responses already encoded
+are sent as they are. Compressed responses get a weak ETag, their bytes
+differ from the identity ones the ETag was computed from, and every
+compressible response gets `Vary: Accept-Encoding`.
+
+Streamed responses (the exports) are compressed as they are sent, the
+compressor is flushed after each chunk so that the client receives every
+batch of rows as soon as it is read. Bodies larger than THREADPOOL_SIZE are
+compressed in the threadpool, the compressors release the GIL.
+
+brotli and zstd need the Brotli and zstandard packages, both pinned in the
+requirements. The codings whose package is missing are left out by default,
+COMPRESSION_ENCODINGS lists the codings offered, most preferred first.
+
+The classes are:
+- CompressionMiddleware: Compress the responses of an ASGI application.
+
+The functions are:
+- negotiate: Pick the coding of a response from the Accept-Encoding header.
+"""
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS")
+
+# Compressing a larger body would hold the event loop for milliseconds
+THREADPOOL_SIZE = 256 * 1024
+
+# The level of each coding by content type, see benchmarks/compression.py.
+# On a page of 100 events with their speakers (127kB), gzip 6 compresses 19x
+# in 0.9ms where gzip 9 takes twice the time for nothing, brotli 5 26x in
+# 1.4ms and zstd 1 23x in 0.15ms (zstd 3 does no better on these pages). The
+# exports stream megabytes with a flush per batch, where the fast levels
+# compress nearly as well: zstd 1 and brotli 1 above 600MB/s, gzip 3 180MB/s.
+LEVELS = {
+    "application/json": {"zstd": 1, "br": 5, "gzip": 6},
+    "application/x-ndjson": {"zstd": 1, "br": 1, "gzip": 3},
+    "text/csv": {"zstd": 1, "br": 1, "gzip": 3},
+    "text/plain": {"zstd": 1, "br": 5, "gzip": 6},
+}
+
+# Counted by coding, for the compression ratio in /metrics
+bytes_in = {}
+bytes_out = {}
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        # wbits 31: a deflate stream with the gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=level)
+
+    def compress(self, data: bytes):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+ENCODERS = {"zstd": ZstdEncoder, "br": BrotliEncoder, "gzip": GzipEncoder}
+PACKAGES = {"zstd": zstandard, "br": brotli, "gzip": zlib}
+
+
+def available_encodings(setting: str | None = COMPRESSION_ENCODINGS):
+    """Get the codings offered, most preferred first.
+    Args:
+    setting (str): Comma separated codings, every installed one when None.
+
+    Returns:
+    list: The codings.
+
+    Raises:
+    RuntimeError: When a coding set needs a package that is not installed.
+    """
+    if setting is None:
+        return [name for name, package in PACKAGES.items() if package is not None]
+    encodings = [name.strip() for name in setting.split(",") if name.strip()]
+    for name in encodings:
+        if name not in ENCODERS:
+            raise RuntimeError(f"COMPRESSION_ENCODINGS: unknown coding {name}")
+        if PACKAGES[name] is None:
+            package = "zstandard" if name == "zstd" else "brotli"
+            raise RuntimeError(f"the {name} coding needs the {package} package")
+    return encodings
+
+
+def negotiate(accept_encoding: str | None, encodings: list):
+    """Pick the coding of a response from the Accept-Encoding header.
+    Args:
+    accept_encoding (str): The header, eg. `gzip, br;q=0.8`.
+    encodings (list): The codings offered, most preferred first.
+
+    Returns:
+    str: The coding with the highest weight, the most preferred one among
+    equals, or None for the identity.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *parameters = item.split(";")
+        weight = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    chosen, chosen_weight = None, 0.0
+    for coding in encodings:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > chosen_weight:
+            chosen, chosen_weight = coding, weight
+    return chosen
+
+
+def content_levels(content_type: str):
+    """Get the levels of a content type, None when it is not compressed."""
+    media_type = content_type.partition(";")[0].strip().lower()
+    if media_type in LEVELS:
+        return LEVELS[media_type]
+    if media_type.startswith("text/"):
+        return LEVELS["text/plain"]
+    return None
+
+
+def weaken_etag(headers: MutableHeaders):
+    """Make the ETag of a compressed response weak, its bytes are not the
+    ones it was computed from. If-None-Match uses the weak comparison."""
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class CompressedResponse:
+    """The compression of one response, wrapping the send callable."""
+
+    def __init__(self, send, encoding: str | None, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.levels = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def encode(self, body: bytes, more_body: bool):
+        def run():
+            data = self.encoder.compress(body)
+            return data + (self.encoder.flush() if more_body else self.encoder.finish())
+
+        data = run() if len(body) < THREADPOOL_SIZE else await run_in_threadpool(run)
+        bytes_in[self.encoding] = bytes_in.get(self.encoding, 0) + len(body)
+        bytes_out[self.encoding] = bytes_out.get(self.encoding, 0) + len(data)
+        return data
+
+    async def __call__(self, message):
+        if self.passthrough:
+            await self.send(message)
+        elif message["type"] == "http.response.start":
+            status_code = message["status"]
+            headers = Headers(raw=message["headers"])
+            if status_code == 304 and self.encoding is not None:
+                # The headers of the compressed response the client revalidates
+                not_modified = MutableHeaders(raw=message["headers"])
+                not_modified.add_vary_header("Accept-Encoding")
+                weaken_etag(not_modified)
+            levels = content_levels(headers.get("content-type", ""))
+            if (
+                status_code < 200
+                or status_code in (204, 304)
+                or levels is None
+                or "content-encoding" in headers
+            ):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                # Held until the first chunk of the body tells its size
+                self.start = message
+                self.levels = levels
+        elif message["type"] != "http.response.body":
+            await self.send(message)
+        elif self.encoder is None:
+            await self.start_body(message)
+        else:
+            more_body = message.get("more_body", False)
+            body = await self.encode(message.get("body", b""), more_body)
+            await self.send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+    async def start_body(self, message):
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if more_body:
+            length = headers.get("content-length")
+            size = None if length is None else int(length)
+        else:
+            size = len(body)
+        if self.encoding is None or (size is not None and size < self.minimum_size):
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        self.encoder = ENCODERS[self.encoding](self.levels[self.encoding])
+        body = await self.encode(body, more_body)
+        headers["Content-Encoding"] = self.encoding
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        weaken_etag(headers)
+        await self.send(self.start)
+        await self.send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
+
+
+class CompressionMiddleware:
+    """Compress the responses of an ASGI application.
+    Args:
+    app (ASGIApp): The wrapped application.
+    minimum_size (int): The size under which the responses are not compressed.
+    encodings (list): The codings offered, most preferred first.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        encodings: list | None = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings() if encodings is None else encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(
+            Headers(scope=scope).get("accept-encoding"), self.encodings
+        )
+        response = CompressedResponse(send, encoding, self.minimum_size)
+        await self.app(scope, receive, response)
@@ -0,0 +1,343 @@
+"""This module contains the venue booking conflict checks.
+An event booked into a venue (its venue_id is set) holds the venue over
+[start_time, end_time), and no two events of a venue may overlap.
+
+The checks read the index on (venue_id, start_time, end_time). Since the
+bookings of a venue never overlap, at most one of them starts before a time
+range and runs into it: the last one starting before it. The bookings
+overlapping a range are that one (when it ends after the range starts) and
+those starting within the range, found with two index seeks instead of
+scanning the venue's past events.
+
+A booking is made atomically: the venue row is locked (a no-op UPDATE, which
+also takes the write lock of SQLite) before the check, and the lock is held
+until the caller commits the event, so concurrent bookings of a venue are
+checked one after the other. The reads made under the lock are locking reads
+(SELECT ... FOR UPDATE), which see the rows committed while the lock was
+awaited: on MySQL (REPEATABLE READ) a plain SELECT would read the snapshot
+taken at the first read of the transaction, eg. the authentication of the
+request, and miss them. Batches of bookings are checked against each
+other and the venue's bookings in their time range with an interval tree per
+venue, in the transaction of the chunk they are written in. The events moved
+by a batch free their bookings before the others are checked, so that two of
+them can swap time slots, and a refused move keeps its booking, refusing the
+bookings of the batch made over it. An event is moved at most once per batch.
+
+The classes are:
+- BookingError: A booking that cannot be made.
+
+The functions are:
+- lock_venues: Lock venue rows until the end of the transaction.
+- venue_bookings: Get the bookings of a venue overlapping a time range.
+- book: Lock a venue and check that it is free over a time range.
+- check_bookings: Check many bookings against each other and the venues.
+- get_availability: Tell whether a venue is free over a time range.
+- get_conflicts: Find the overlapping bookings of a venue.
+"""
+
+from datetime import datetime
+from heapq import heappop, heappush
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from ..intervals import IntervalTree
+from ..models import models_event, models_venue
+
+# Documents the error of the writes booking a venue in the OpenAPI schema
+BOOKING_RESPONSES = {
+    409: {"description": "The venue is already booked over that time."},
+}
+
+
+class BookingError(Exception):
+    """A booking that cannot be made, its message is the error to report.
+    Args:
+    message (str): The error.
+    conflicts (list): The ids of the events already booked over that time.
+    """
+
+    def __init__(self, message: str, conflicts: list = ()):
+        super().__init__(message)
+        self.conflicts = list(conflicts)
+        self.status_code = 409 if self.conflicts else 400
+
+
+def naive(value: datetime):
+    # The times are stored without their UTC offset
+    if value is not None and value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    return value
+
+
+def conflict_message(keys: list):
+    """Describe what a booking conflicts with, events by id and the items of
+    the same request (negative keys) by index."""
+    events = [str(key) for key in keys if key >= 0]
+    items = [str(-key - 1) for key in keys if key < 0]
+    parts = []
+    if events:
+        parts.append(f"event {', '.join(events)}")
+    if items:
+        parts.append(f"item {', '.join(items)} of the request")
+    return f"venue is already booked by {' and '.join(parts)}"
+
+
+def lock_venues(db: Session, venue_ids: list):
+    """Lock venue rows until the end of the transaction, with a no-op UPDATE.
+    Args:
+    db (Session): The database session.
+    venue_ids (list): The ids of the venues, locked in id order.
+
+    Returns:
+    set: The ids of the venues that exist.
+    """
+    venue = models_venue.Venue
+    db.execute(
+        update(venue)
+        .where(venue.id.in_(venue_ids))
+        # Set to itself, so that the onupdate timestamp is left alone
+        .values(updated_at=venue.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    return set(
+        db.scalars(select(venue.id).where(venue.id.in_(venue_ids)).with_for_update())
+    )
+
+
+def venue_bookings(
+    db: Session,
+    venue_id: int,
+    start: datetime,
+    end: datetime,
+    exclude_id=None,
+    lock: bool = False,
+):
+    """Get the bookings of a venue overlapping a time range, in two index seeks.
+    Args:
+    db (Session): The database session.
+    venue_id (int): The id of the venue.
+    start (datetime): The start of the time range.
+    end (datetime): The end of the time range, excluded.
+    exclude_id (int): The id of an event to leave out, eg. the one being moved.
+    lock (bool): Read with FOR UPDATE, the latest committed bookings rather
+    than the transaction's snapshot. Set by the checks made under the venue
+    lock.
+
+    Returns:
+    list: The (start_time, end_time, id) of the bookings, ordered by start.
+    """
+    event = models_event.Event
+    criteria = [event.venue_id == venue_id]
+    if exclude_id is not None:
+        criteria.append(event.id != exclude_id)
+    columns = (event.start_time, event.end_time, event.id)
+    running = (
+        select(*columns)
+        .where(*criteria, event.start_time < start)
+        .order_by(event.start_time.desc())
+        .limit(1)
+    )
+    starting = (
+        select(*columns)
+        .where(*criteria, event.start_time >= start, event.start_time < end)
+        .order_by(event.start_time)
+    )
+    if lock:
+        running, starting = running.with_for_update(), starting.with_for_update()
+    running, starting = db.execute(running).all(), db.execute(starting).all()
+    return [tuple(row) for row in running if row.end_time > start] + [
+        tuple(row) for row in starting
+    ]
+
+
+def book(db: Session, venue_id: int, start: datetime, end: datetime, exclude_id=None):
+    """Lock a venue and check that it is free over a time range.
+    The lock is held until the caller commits the booking.
+    Args:
+    db (Session): The database session.
+    venue_id (int): The id of the venue.
+    start (datetime): The start of the booking.
+    end (datetime): The end of the booking, excluded.
+    exclude_id (int): The id of the event being moved, if any.
+
+    Raises:
+    BookingError: When the times are invalid, the venue does not exist or is
+    already booked, after rolling the transaction back.
+    """
+    start, end = naive(start), naive(end)
+    error = None
+    if end <= start:
+        error = BookingError("end_time must be after start_time")
+    elif not lock_venues(db, [venue_id]):
+        error = BookingError("venue does not exist")
+    else:
+        conflicts = [
+            row[2]
+            for row in venue_bookings(db, venue_id, start, end, exclude_id, lock=True)
+        ]
+        if conflicts:
+            error = BookingError(conflict_message(conflicts), conflicts)
+    if error is not None:
+        db.rollback()
+        raise error
+
+
+def check_bookings(db: Session, bookings: list):
+    """Check many bookings against each other and the venues' bookings, with
+    an interval tree per venue. The venues are locked until the caller commits.
+    Args:
+    db (Session): The database session.
+    bookings (list): (index, event_id, venue_id, start, end) tuples, in the
+    order of the request. event_id is None for new events and venue_id None
+    for events booked into no venue (which frees their previous booking).
+
+    Returns:
+    dict: The errors of the refused bookings, by index.
+    """
+    bookings = [
+        (index, event_id, venue_id, naive(start), naive(end))
+        for index, event_id, venue_id, start, end in bookings
+    ]
+    errors = {}
+    windows = {}
+    for index, _, venue_id, start, end in bookings:
+        if venue_id is None:
+            continue
+        if end <= start:
+            errors[index] = "end_time must be after start_time"
+            continue
+        window = windows.get(venue_id, (start, end))
+        windows[venue_id] = (min(window[0], start), max(window[1], end))
+    existing = lock_venues(db, sorted(windows)) if windows else set()
+    trees = {
+        venue_id: IntervalTree(venue_bookings(db, venue_id, *window, lock=True))
+        for venue_id, window in windows.items()
+        if venue_id in existing
+    }
+    # The index of every event moved by the batch
+    moves = {}
+    for index, event_id, venue_id, _, _ in bookings:
+        if index in errors:
+            continue
+        if event_id in moves:
+            errors[index] = "event is already in the request"
+        elif venue_id is not None and venue_id not in existing:
+            errors[index] = "venue does not exist"
+        elif event_id is not None:
+            moves[event_id] = index
+    # The events moved free their previous bookings first, so that they can
+    # swap time slots
+    previous = {}
+    for event_id in moves:
+        for tree_venue_id, tree in trees.items():
+            interval = tree.remove(event_id)
+            if interval is not None:
+                previous[event_id] = (tree_venue_id, *interval)
+    # The index of every booking made, by its key in the trees
+    made = {}
+    for index, event_id, venue_id, start, end in bookings:
+        if index in errors or venue_id is None:
+            continue
+        key = event_id if event_id is not None else -index - 1
+        conflicts = [found[2] for found in trees[venue_id].overlapping(start, end)]
+        if conflicts:
+            errors[index] = conflict_message(conflicts)
+        else:
+            trees[venue_id].add(start, end, key)
+            made[key] = index
+    # A refused move keeps its previous booking, which refuses the bookings
+    # made over it in turn
+    kept = [event_id for event_id in previous if moves[event_id] in errors]
+    while kept:
+        event_id = kept.pop()
+        venue_id, start, end = previous[event_id]
+        for _, _, key in trees[venue_id].overlapping(start, end):
+            if key in made:
+                trees[venue_id].remove(key)
+                errors[made.pop(key)] = conflict_message([event_id])
+                if key in previous:
+                    kept.append(key)
+        trees[venue_id].add(start, end, event_id)
+    return errors
+
+
+def get_availability(db: Session, venue_id: int, start: datetime, end: datetime):
+    """Tell whether a venue is free over a time range.
+    Args:
+    db (Session): The database session.
+    venue_id (int): The id of the venue.
+    start (datetime): The start of the time range.
+    end (datetime): The end of the time range, excluded.
+
+    Returns:
+    dict: The time range, whether the venue is free and the ids of the events
+    booked over it, or None when the venue does not exist.
+    """
+    venue = models_venue.Venue
+    if db.scalar(select(venue.id).where(venue.id == venue_id)) is None:
+        return None
+    conflicts = [
+        row[2] for row in venue_bookings(db, venue_id, naive(start), naive(end))
+    ]
+    return {
+        "venue_id": venue_id,
+        "start": start,
+        "end": end,
+        "free": not conflicts,
+        "conflicts": conflicts,
+    }
+
+
+def get_conflicts(
+    db: Session,
+    venue_id: int,
+    starts_after: datetime | None = None,
+    ends_before: datetime | None = None,
+    limit: int = 100,
+):
+    """Find the overlapping bookings of a venue, eg. booked before the checks
+    existed. The bookings are swept in start order through an interval tree
+    holding the ones still running.
+    Args:
+    db (Session): The database session.
+    venue_id (int): The id of the venue.
+    starts_after (datetime): Only the bookings running at or after this time.
+    ends_before (datetime): Only the bookings starting before this time.
+    limit (int): The maximum number of conflicts to return.
+
+    Returns:
+    list: The conflicts, dicts with the ids of both events and the time range
+    they overlap over, or None when the venue does not exist.
+    """
+    venue = models_venue.Venue
+    if db.scalar(select(venue.id).where(venue.id == venue_id)) is None:
+        return None
+    event = models_event.Event
+    query = select(event.start_time, event.end_time, event.id).where(
+        event.venue_id == venue_id
+    )
+    if starts_after is not None:
+        query = query.where(event.end_time > naive(starts_after))
+    if ends_before is not None:
+        query = query.where(event.start_time < naive(ends_before))
+    running = IntervalTree()
+    ends = []
+    conflicts = []
+    for start, end, event_id in db.execute(query.order_by(event.start_time, event.id)):
+        # The bookings ended before this one starts cannot overlap the next ones
+        while ends and ends[0][0] <= start:
+            running.remove(heappop(ends)[1])
+        for other_start, other_end, other_id in running.overlapping(start, end):
+            conflicts.append(
+                {
+                    "event_id": other_id,
+                    "other_event_id": event_id,
+                    "start": max(start, other_start),
+                    "end": min(end, other_end),
+                }
+            )
+            if len(conflicts) >= limit:
+                return conflicts
+        if end > start:
+            running.add(start, end, event_id)
+            heappush(ends, (end, event_id))
+    return conflicts
@@ -0,0 +1,334 @@
+"""This module contains the helpers shared by the bulk CRUD operations.
+Rows are written in chunks of BULK_CHUNK_SIZE, one transaction per chunk.
+The rows of a chunk are inserted with one multi-row INSERT and updated with
+one executemany. When a chunk fails its rows are retried one by one so that the error is
+reported on the item that caused it, and the other items are still written.
+
+The functions are:
+- chunked: Split a list into chunks.
+- insert_values: Insert rows with one statement and get their ids.
+- insert_rows: Insert rows chunk by chunk.
+- update_rows: Update rows by id chunk by chunk.
+- delete_rows: Delete rows by id chunk by chunk.
+- bulk_result: Summarize per-item results.
+- written_ids: Get the ids of the items that succeeded.
+"""
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+import os
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+
+
+def chunked(items: list, size: int = BULK_CHUNK_SIZE):
+    """Split a list into chunks.
+    Args:
+    items (list): The items to split.
+    size (int): The maximum size of a chunk.
+
+    Returns:
+    Generator: The chunks.
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def database_error(error: SQLAlchemyError):
+    return f"could not be written: {getattr(error, 'orig', None) or error}"
+
+
+def existing_ids(db: Session, model, ids: list, scope=()):
+    """Get the ids that exist, and are visible in the scope.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    ids (list): The ids to look up.
+    scope (tuple): Extra filter criteria, eg. the ownership of the rows.
+
+    Returns:
+    set: The ids found.
+    """
+    return set(db.scalars(select(model.id).where(model.id.in_(ids), *scope)))
+
+
+def check_rows(db: Session, rows: list, before_write=None):
+    """Run the before_write hook of a write on rows, if any.
+    Returns:
+    dict: The errors of the rows to leave out, by index.
+    """
+    if before_write is None or not rows:
+        return {}
+    return before_write(db, rows)
+
+
+def load_items(db: Session, model, ids: list, options=()):
+    """Load rows by id, in one query.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    ids (list): The ids to load.
+    options (tuple): Loader options, eg. selectinload of a relationship.
+
+    Returns:
+    dict: The objects by id.
+    """
+    if not ids:
+        return {}
+    objects = db.query(model).options(*options).filter(model.id.in_(ids)).all()
+    return {obj.id: obj for obj in objects}
+
+
+def auto_increment_step(db: Session):
+    """Get the auto_increment_increment of the MySQL connection of a session,
+    read once per connection."""
+    info = db.connection().info
+    if "auto_increment_increment" not in info:
+        info["auto_increment_increment"] = db.scalar(
+            text("SELECT @@auto_increment_increment")
+        )
+    return info["auto_increment_increment"]
+
+
+def insert_values(db: Session, model, values: list):
+    """Insert rows with one multi-row INSERT and get their ids.
+
+    The ids come from RETURNING where the database has it. MySQL and SQLite
+    give the ids of the rows of one INSERT in a sequence, the lastrowid of the
+    statement being the first one on MySQL and the last one on SQLite. The
+    ids are consecutive on SQLite, and auto_increment_increment apart on MySQL
+    (more than 1 on multi-primary setups, eg. Galera). Other databases insert
+    the rows through the ORM, which reads the id of each.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    values (list): The columns of each row, all with the same keys.
+
+    Returns:
+    list: The ids, in the order of the rows.
+    """
+    if not values:
+        return []
+    dialect = db.get_bind().dialect
+    statement = insert(model).values(values)
+    if dialect.full_returning:
+        return list(db.scalars(statement.returning(model.id)))
+    if dialect.name == "mysql":
+        step = auto_increment_step(db)
+        first = db.execute(statement).lastrowid
+        return list(range(first, first + len(values) * step, step))
+    if dialect.name == "sqlite":
+        last = db.execute(statement).lastrowid
+        return list(range(last - len(values) + 1, last + 1))
+    objects = [model(**row) for row in values]
+    db.add_all(objects)
+    db.flush()
+    return [obj.id for obj in objects]
+
+
+def insert_rows(
+    db: Session, model, rows: list, ids_only: bool = False, before_write=None
+):
+    """Insert rows chunk by chunk.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    rows (list): (index, values) pairs, the values are the model's columns.
+    ids_only (bool): Leave the written rows out of the results.
+    before_write: Called with the session and the rows of a chunk in its
+    transaction, before they are written, eg. to check them against the rows
+    already written. Returns the errors of the rows to leave out, by index.
+
+    Returns:
+    list: The result of every row, see bulk_result.
+    """
+    results = []
+    for chunk in chunked(rows):
+        try:
+            refused = check_rows(db, chunk, before_write)
+            inserts = [row for row in chunk if row[0] not in refused]
+            ids = insert_values(db, model, [values for _, values in inserts])
+            written = [
+                (index, row_id, values) for (index, values), row_id in zip(inserts, ids)
+            ]
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            refused = {}
+            written = []
+            for row in chunk:
+                index, values = row
+                try:
+                    error = check_rows(db, [row], before_write).get(index)
+                    if error is not None:
+                        db.rollback()
+                        refused[index] = error
+                        continue
+                    obj = model(**values)
+                    db.add(obj)
+                    db.flush()
+                    written.append((index, obj.id, values))
+                    db.commit()
+                except SQLAlchemyError as error:
+                    db.rollback()
+                    results.append({"index": index, "error": database_error(error)})
+        results.extend(
+            {"index": index, "error": error} for index, error in refused.items()
+        )
+        for index, row_id, values in written:
+            item = None if ids_only else {**values, "id": row_id}
+            results.append({"index": index, "id": row_id, "item": item})
+    return results
+
+
+def update_rows(
+    db: Session,
+    model,
+    rows: list,
+    scope=(),
+    not_found: str = "does not exist",
+    ids_only: bool = False,
+    load_options=(),
+    before_write=None,
+):
+    """Update rows by id chunk by chunk, with one executemany per chunk.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    rows (list): (index, id, values) triples.
+    scope (tuple): Extra filter criteria the rows must match to be updated.
+    not_found (str): The error of the rows that do not exist or are out of scope.
+    ids_only (bool): Leave the updated rows out of the results.
+    load_options (tuple): Loader options used to read the updated rows back.
+    before_write: Called with the session and the rows of a chunk found in
+    the scope, like the one of insert_rows.
+
+    Returns:
+    list: The result of every row, see bulk_result.
+    """
+    results = []
+    for chunk in chunked(rows):
+        found = existing_ids(db, model, [row_id for _, row_id, _ in chunk], scope)
+        updates = [row for row in chunk if row[1] in found]
+        results.extend(
+            {"index": index, "id": row_id, "error": not_found}
+            for index, row_id, _ in chunk
+            if row_id not in found
+        )
+        try:
+            failed = check_rows(db, updates, before_write)
+            db.bulk_update_mappings(
+                model,
+                [
+                    {**values, "id": row_id}
+                    for index, row_id, values in updates
+                    if index not in failed
+                ],
+            )
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            failed = {}
+            for row in updates:
+                index, row_id, values = row
+                try:
+                    error = check_rows(db, [row], before_write).get(index)
+                    if error is not None:
+                        db.rollback()
+                        failed[index] = error
+                        continue
+                    db.bulk_update_mappings(model, [{**values, "id": row_id}])
+                    db.commit()
+                except SQLAlchemyError as error:
+                    db.rollback()
+                    failed[index] = database_error(error)
+        results.extend(
+            {"index": index, "id": row_id, "error": failed[index]}
+            for index, row_id, _ in updates
+            if index in failed
+        )
+        updates = [row for row in updates if row[0] not in failed]
+        items = {}
+        if not ids_only:
+            items = load_items(db, model, [row[1] for row in updates], load_options)
+        results.extend(
+            {"index": index, "id": row_id, "item": items.get(row_id)}
+            for index, row_id, _ in updates
+        )
+    return results
+
+
+def delete_rows(
+    db: Session,
+    model,
+    ids: list,
+    scope=(),
+    not_found: str = "does not exist",
+    before_delete=None,
+):
+    """Delete rows by id chunk by chunk, with one DELETE ... IN per chunk.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    ids (list): The ids to delete.
+    scope (tuple): Extra filter criteria the rows must match to be deleted.
+    not_found (str): The error of the rows that do not exist or are out of scope.
+    before_delete: Called with the session and the ids of a chunk before it is
+    deleted, eg. to detach the rows referencing them.
+
+    Returns:
+    list: The result of every id, see bulk_result.
+    """
+    results = []
+    for chunk_start, chunk in zip(range(0, len(ids), BULK_CHUNK_SIZE), chunked(ids)):
+        found = existing_ids(db, model, chunk, scope)
+        deletes = [row_id for row_id in chunk if row_id in found]
+        error = None
+        try:
+            if deletes:
+                if before_delete is not None:
+                    before_delete(db, deletes)
+                db.query(model).filter(model.id.in_(deletes)).delete(
+                    synchronize_session=False
+                )
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            error = database_error(exc)
+        for index, row_id in enumerate(chunk, start=chunk_start):
+            if row_id not in found:
+                results.append({"index": index, "id": row_id, "error": not_found})
+            else:
+                results.append({"index": index, "id": row_id, "error": error})
+    return results
+
+
+def bulk_result(results: list):
+    """Summarize per-item results.
+    Args:
+    results (list): The result of every item, a dict with the index of the item
+    in the request, its id, the written row (item) and the error if it failed.
+
+    Returns:
+    dict: The number of succeeded and failed items and the results by index.
+    """
+    results.sort(key=lambda result: result["index"])
+    failed = sum(1 for result in results if result.get("error"))
+    return {
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
+
+
+def written_ids(result: dict):
+    """Get the ids of the items that succeeded.
+    Args:
+    result (dict): The summary made by bulk_result.
+
+    Returns:
+    list: The ids of the written or deleted rows.
+    """
+    return [item["id"] for item in result["results"] if not item.get("error")]
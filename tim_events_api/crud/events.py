@@ -1,10 +1,19 @@
 """This module defines the CRUD operations for the events table.
 The functions are:
 - get_event: Get a single event by its id.
+- get_event_fields: Get the selected fields of a single event, as a plain dict.
 - get_events: Get all events for a user.
 - add_event: Add an event to the database.
 - edit_event: Edit an event in the database.
 - remove_event: Remove an event from the database.
+- get_event_owner: Get the organizer of an event.
+- add_events: Add many events to the database.
+- edit_events: Edit many events in the database.
+- remove_events: Remove many events from the database.
+- get_event_rows: Get events as plain dicts, for the fast list path.
+
+The events booked into a venue are checked against the venue's other
+bookings before they are written, see bookings.py.
 
 each function interacts with the database session object to perform the CRUD operations.
 For more information on how to perform CRUD operations,
@@ -12,41 +21,119 @@ see: https://fastapi.tiangolo.com/tutorial/sql-databases/#create-the-crud-utilit
 
 """
 
-from sqlalchemy.orm import Session
-from ..models import models_event, models_user
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from ..models import models_event, models_speaker, models_user
 from ..schemas import schema_events
+from ..fieldsets import FieldSet, fieldset, get_one, load_nested
+from ..pagination import Page, paginate
+from ..serialization import paginate_rows
+from .. import response_cache
+from . import bookings, bulk, writes
+
+# The fields and expand query parameters of the event endpoints
+event_fields = fieldset(schema_events.Event, models_event.Event)
 
 
-def get_event(db: Session, event_id: int):
+def get_event(db: Session, event_id: int, with_speakers: bool = False):
     """Get a single event by its id.
     Args:
     db (Session): The database session.
     event_id (int): The id of the event.
+    with_speakers (bool): Load the event's speakers in the same query.
     Returns:
     Event: The event object.
     """
-    return (
-        db.query(models_event.Event).filter(models_event.Event.id == event_id).first()
+    query = db.query(models_event.Event)
+    if with_speakers:
+        query = query.options(joinedload(models_event.Event.speakers))
+    return query.filter(models_event.Event.id == event_id).first()
+
+
+def get_event_fields(db: Session, event_id: int, selected: FieldSet):
+    """Get the selected fields of a single event, and of its speakers, as a
+    plain dict read as column tuples.
+    Args:
+    db (Session): The database session.
+    event_id (int): The id of the event.
+    selected (FieldSet): The fields and collections selected, see event_fields.
+
+    Returns:
+    dict: The event, shaped like the Event schema, or None.
+    """
+    return get_one(db, selected, event_id)
+
+
+def get_events(
+    user_id: int,
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    with_speakers: bool = False,
+    order_by: str = "id",
+    after: str | None = None,
+):
+    """Get a page of events for a user.
+    Args:
+    user_id (int): The id of the user.
+    db (Session): The database session.
+    skip (int): The number of events to skip, only used without a cursor.
+    limit (int): The number of events to return.
+    with_speakers (bool): Load the speakers of all events in one extra query.
+    order_by (str): id, created_at or start_time.
+    after (str): The cursor of the previous page.
+    Returns:
+    Page: The event objects and the cursor of the next page.
+    """
+    query = db.query(models_event.Event)
+    if with_speakers:
+        query = query.options(selectinload(models_event.Event.speakers))
+    query = query.filter(models_event.Event.organizer_id == user_id)
+    return paginate(
+        query,
+        models_event.Event,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
     )
 
 
-def get_events(user_id: int, db: Session, skip: int = 0, limit: int = 100):
-    """Get all events for a user.
+def get_event_rows(
+    user_id: int,
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "id",
+    after: str | None = None,
+    selected: FieldSet | None = None,
+):
+    """Get a page of events for a user as plain dicts, with their speakers.
+    The events and then the speakers of all of them are read as column tuples,
+    in two queries.
     Args:
     user_id (int): The id of the user.
     db (Session): The database session.
-    skip (int): The number of events to skip.
+    skip (int): The number of events to skip, only used without a cursor.
     limit (int): The number of events to return.
+    order_by (str): id, created_at or start_time.
+    after (str): The cursor of the previous page.
+    selected (FieldSet): The fields and collections selected, all by default.
     Returns:
-    List[Event]: A list of event objects.
+    Page: The events, shaped like the Event schema, and the cursor of the next page.
     """
-    return (
-        db.query(models_event.Event)
-        .filter(models_event.Event.organizer_id == user_id)
-        .offset(skip)
-        .limit(limit)
-        .all()
+    if selected is None:
+        selected = FieldSet.full(schema_events.Event, models_event.Event)
+    page = paginate_rows(
+        db.query(*selected.columns).filter(models_event.Event.organizer_id == user_id),
+        models_event.Event,
+        selected.columns,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
     )
+    return Page(load_nested(db, selected, page.items), page.next_cursor)
 
 
 def add_event(db: Session, event: schema_events.EventCreate, user_id: int):
@@ -57,7 +144,12 @@ def add_event(db: Session, event: schema_events.EventCreate, user_id: int):
     user_id (int): The id of the user.
     Returns:
     Event: The event object.
+
+    Raises:
+    BookingError: When the venue of the event is not free at its time.
     """
+    if event.venue_id is not None:
+        bookings.book(db, event.venue_id, event.start_time, event.end_time)
     db_event = models_event.Event(**event.dict(), organizer_id=user_id)
     db.add(db_event)
     db.commit()
@@ -65,38 +157,225 @@ def add_event(db: Session, event: schema_events.EventCreate, user_id: int):
     return db_event
 
 
-def edit_event(db: Session, event_id: int, event: schema_events.EventUpdate):
-    """Edit an event in the database.
+def edit_event(
+    db: Session,
+    event_id: int,
+    event: schema_events.EventUpdate | schema_events.EventPatch,
+    user_id: int,
+):
+    """Edit an event of an organizer in the database, in one UPDATE of the
+    fields set in the event data, scoped to the organizer.
     Args:
     db (Session): The database session.
     event_id (int): The id of the event.
-    event (EventUpdate): The event data.
+    event (EventUpdate | EventPatch): The event data.
+    user_id (int): The id of the organizer.
     Returns:
-    Event: The event object.
+    Event: The event object with its speakers, or None when the event does
+    not exist or is another organizer's, see get_event_owner.
+
+    Raises:
+    BookingError: When the event would be booked into a venue not free at
+    its time.
+    """
+    values = event.dict(exclude_unset=True)
+    if any(name in values for name in BOOKING_FIELDS):
+        # The booking is the stored one with the fields sent applied, read
+        # with FOR UPDATE like the checks of bookings.book
+        current = db.execute(
+            select(*(getattr(models_event.Event, name) for name in BOOKING_FIELDS))
+            .where(models_event.Event.id == event_id, *owned_by(user_id))
+            .with_for_update()
+        ).first()
+        if current is None:
+            return None
+        booking = {**current._mapping, **values}
+        if booking["venue_id"] is not None:
+            bookings.book(
+                db,
+                booking["venue_id"],
+                booking["start_time"],
+                booking["end_time"],
+                exclude_id=event_id,
+            )
+    if not writes.update_row(
+        db, models_event.Event, event_id, values, criteria=owned_by(user_id)
+    ):
+        return None
+    response_cache.invalidate(response_cache.event_tag(event_id))
+    return get_event(db, event_id, with_speakers=True)
+
+
+def remove_event(db: Session, event_id: int, user_id: int):
+    """Remove an event of an organizer from the database, without loading it.
+    Its speakers are detached first, like the ORM did.
+    Args:
+    db (Session): The database session.
+    event_id (int): The id of the event.
+    user_id (int): The id of the organizer.
+    Returns:
+    dict: An empty dictionary, or None when the event does not exist or is
+    another organizer's, see get_event_owner.
     """
-    db_event = (
-        db.query(models_event.Event).filter(models_event.Event.id == event_id).first()
+    criteria = owned_by(user_id)
+    detach_speakers(db, [event_id], criteria=criteria)
+    if not writes.delete_row(db, models_event.Event, event_id, criteria=criteria):
+        return None
+    response_cache.invalidate(response_cache.event_tag(event_id))
+    return {}
+
+
+# The fields of an event its booking depends on
+BOOKING_FIELDS = ("venue_id", "start_time", "end_time")
+
+
+def book_new_events(db: Session, rows: list):
+    """Check the bookings of events about to be inserted, the before_write
+    hook of add_events."""
+    return bookings.check_bookings(
+        db,
+        [
+            (index, None, values["venue_id"], values["start_time"], values["end_time"])
+            for index, values in rows
+        ],
     )
-    event_dict = event.dict()
 
-    for key, value in event_dict.items():
-        setattr(db_event, key, value)
-    db.commit()
-    db.refresh(db_event)
-    return db_event
+
+def book_edited_events(db: Session, rows: list):
+    """Check the bookings of events about to be updated, the before_write hook
+    of edit_events. The events sent without a venue_id keep their venue."""
+    event = models_event.Event
+    venue_ids = dict(
+        db.execute(
+            select(event.id, event.venue_id)
+            .where(event.id.in_([row_id for _, row_id, _ in rows]))
+            .with_for_update()
+        ).all()
+    )
+    return bookings.check_bookings(
+        db,
+        [
+            (
+                index,
+                row_id,
+                values.get("venue_id", venue_ids.get(row_id)),
+                values["start_time"],
+                values["end_time"],
+            )
+            for index, row_id, values in rows
+        ],
+    )
+
+
+def owned_by(user_id: int):
+    """The criteria of the events organized by a user."""
+    return (models_event.Event.organizer_id == user_id,)
 
 
-def remove_event(db: Session, event_id: int):
-    """Remove an event from the database.
+def get_event_owner(db: Session, event_id: int):
+    """Get the organizer of an event, by its primary key.
+    Used to tell a missing event from another organizer's one once an owned
+    write matched nothing.
     Args:
     db (Session): The database session.
     event_id (int): The id of the event.
     Returns:
-    dict: An empty dictionary.
+    Row: The row with the organizer_id of the event, or None when the event
+    does not exist.
     """
-    db_event = (
-        db.query(models_event.Event).filter(models_event.Event.id == event_id).first()
+    return db.execute(
+        select(models_event.Event.organizer_id).where(models_event.Event.id == event_id)
+    ).first()
+
+
+def add_events(db: Session, events: list, user_id: int, ids_only: bool = False):
+    """Add many events to the database, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    events (List[EventCreate]): The event data.
+    user_id (int): The id of the organizer.
+    ids_only (bool): Leave the events out of the results.
+    Returns:
+    dict: The per-event results, see bulk.bulk_result.
+    """
+    rows = [
+        (index, {**event.dict(), "organizer_id": user_id})
+        for index, event in enumerate(events)
+    ]
+    results = bulk.insert_rows(
+        db,
+        models_event.Event,
+        rows,
+        ids_only=ids_only,
+        before_write=book_new_events,
     )
-    db.delete(db_event)
-    db.commit()
-    return {}
+    for result in results:
+        if result.get("item") is not None:
+            result["item"]["speakers"] = []
+    return bulk.bulk_result(results)
+
+
+def edit_events(db: Session, events: list, user_id: int, ids_only: bool = False):
+    """Edit many events of an organizer, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    events (List[EventBulkUpdate]): The event data, with the id of each event.
+    user_id (int): The id of the organizer, other organizers' events are skipped.
+    ids_only (bool): Leave the events out of the results.
+    Returns:
+    dict: The per-event results, see bulk.bulk_result.
+    """
+    # The venue_id is only written when sent, like with PATCH
+    rows = [
+        (index, event.id, event.dict(exclude={"id"}, exclude_unset=True))
+        for index, event in enumerate(events)
+    ]
+    result = bulk.bulk_result(
+        bulk.update_rows(
+            db,
+            models_event.Event,
+            rows,
+            scope=owned_by(user_id),
+            not_found="event does not exist",
+            ids_only=ids_only,
+            load_options=(selectinload(models_event.Event.speakers),),
+            before_write=book_edited_events,
+        )
+    )
+    response_cache.invalidate(*map(response_cache.event_tag, bulk.written_ids(result)))
+    return result
+
+
+def detach_speakers(db: Session, event_ids: list, criteria=()):
+    """Unlink the speakers of events about to be deleted, like the ORM does.
+    With criteria, only the speakers of the events matching them are."""
+    if criteria:
+        event_ids = select(models_event.Event.id).where(
+            models_event.Event.id.in_(event_ids), *criteria
+        )
+    db.query(models_speaker.Speaker).filter(
+        models_speaker.Speaker.event_id.in_(event_ids)
+    ).update({models_speaker.Speaker.event_id: None}, synchronize_session=False)
+
+
+def remove_events(db: Session, event_ids: list, user_id: int):
+    """Remove many events of an organizer, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    event_ids (List[int]): The ids of the events.
+    user_id (int): The id of the organizer, other organizers' events are skipped.
+    Returns:
+    dict: The per-event results, see bulk.bulk_result.
+    """
+    result = bulk.bulk_result(
+        bulk.delete_rows(
+            db,
+            models_event.Event,
+            event_ids,
+            scope=owned_by(user_id),
+            not_found="event does not exist",
+            before_delete=detach_speakers,
+        )
+    )
+    response_cache.invalidate(*map(response_cache.event_tag, bulk.written_ids(result)))
+    return result
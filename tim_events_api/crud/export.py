@@ -0,0 +1,142 @@
+"""This module reads the full tables for the exports, in constant memory.
+Rows are read as column tuples through a server-side cursor (yield_per, which
+implies stream_results) and handed out in batches of EXPORT_BATCH_SIZE, so
+neither the driver nor the ORM ever hold the whole result.
+
+The functions are:
+- stream_rows: Stream the rows of a query in batches.
+- stream_events: Stream events with their speakers.
+- stream_speakers: Stream speakers.
+- stream_venues: Stream venues.
+"""
+
+from itertools import chain
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from ..models import models_event, models_speaker, models_venue
+from ..schemas import schema_events, schema_speakers, schema_venues
+from ..serialization import rows_to_dicts, schema_columns
+import os
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def export_columns(schema, model):
+    """The columns of the response schema plus the timestamps."""
+    return schema_columns(schema, model) + [model.created_at, model.updated_at]
+
+
+EVENT_COLUMNS = export_columns(schema_events.Event, models_event.Event)
+SPEAKER_COLUMNS = export_columns(schema_speakers.Speaker, models_speaker.Speaker)
+VENUE_COLUMNS = export_columns(schema_venues.Venue, models_venue.Venue)
+
+
+def stream_rows(db: Session, columns: list, criteria=(), order_by=()):
+    """Stream the rows of a query in batches, on a server-side cursor.
+    Args:
+    db (Session): The database session, its connection is busy until the
+    generator is exhausted or closed.
+    columns (list): The columns to select.
+    criteria (tuple): The filter criteria.
+    order_by (tuple): The columns to order by.
+
+    Returns:
+    Generator: Lists of at most EXPORT_BATCH_SIZE rows, as dicts.
+    """
+    query = (
+        select(*columns)
+        .where(*criteria)
+        .order_by(*order_by)
+        # yield_per makes the ORM fetch in batches and implies stream_results
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    result = db.execute(query)
+    try:
+        for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield rows_to_dicts(rows, columns)
+    finally:
+        result.close()
+
+
+def stream_events(db: Session, speakers_db: Session, since=None):
+    """Stream events with their speakers, ordered by id.
+    The speakers are streamed ordered by event at the same time and merged in,
+    so no query is made per event or per batch.
+    Args:
+    db (Session): The database session the events are read on.
+    speakers_db (Session): A second session the speakers are read on, a
+    connection cannot run a query while it streams another one.
+    since (datetime): Only the events updated at or after this time, or whose
+    speakers were.
+
+    Returns:
+    Generator: Lists of events, as dicts with their speakers.
+    """
+    criteria = ()
+    if since is not None:
+        changed_speakers = select(models_speaker.Speaker.event_id).where(
+            models_speaker.Speaker.updated_at >= since
+        )
+        criteria = (
+            or_(
+                models_event.Event.updated_at >= since,
+                models_event.Event.id.in_(changed_speakers),
+            ),
+        )
+    exported_events = select(models_event.Event.id).where(*criteria)
+    speaker_batches = stream_rows(
+        speakers_db,
+        SPEAKER_COLUMNS,
+        criteria=(models_speaker.Speaker.event_id.in_(exported_events),),
+        order_by=(models_speaker.Speaker.event_id, models_speaker.Speaker.id),
+    )
+    event_batches = stream_rows(
+        db, EVENT_COLUMNS, criteria, order_by=(models_event.Event.id,)
+    )
+    try:
+        speakers = chain.from_iterable(speaker_batches)
+        speaker = next(speakers, None)
+        for events in event_batches:
+            for event in events:
+                event["speakers"] = []
+                # Speakers of events written after the events were read are skipped
+                while speaker is not None and speaker["event_id"] <= event["id"]:
+                    if speaker["event_id"] == event["id"]:
+                        event["speakers"].append(speaker)
+                    speaker = next(speakers, None)
+            yield events
+    finally:
+        event_batches.close()
+        speaker_batches.close()
+
+
+def stream_speakers(db: Session, since=None):
+    """Stream speakers, ordered by id.
+    Args:
+    db (Session): The database session.
+    since (datetime): Only the speakers updated at or after this time.
+
+    Returns:
+    Generator: Lists of speakers, as dicts.
+    """
+    criteria = ()
+    if since is not None:
+        criteria = (models_speaker.Speaker.updated_at >= since,)
+    return stream_rows(
+        db, SPEAKER_COLUMNS, criteria, order_by=(models_speaker.Speaker.id,)
+    )
+
+
+def stream_venues(db: Session, since=None):
+    """Stream venues, ordered by id.
+    Args:
+    db (Session): The database session.
+    since (datetime): Only the venues updated at or after this time.
+
+    Returns:
+    Generator: Lists of venues, as dicts.
+    """
+    criteria = ()
+    if since is not None:
+        criteria = (models_venue.Venue.updated_at >= since,)
+    return stream_rows(db, VENUE_COLUMNS, criteria, order_by=(models_venue.Venue.id,))
@@ -0,0 +1,178 @@
+"""This module contains the full-text search of events.
+Events are matched on their name, description and location through the
+full-text index of the database, see models_event.SEARCH_INDEX_DDL: the
+FULLTEXT index in boolean mode on MySQL, the FTS5 table on SQLite. Other
+databases fall back to an unranked LIKE scan.
+Every word of the search has to match. Results are ordered by relevance, the
+id breaking ties, and paginated with a cursor holding the score and id of the
+last result of a page. Scores depend on the whole table, a page requested
+after many writes may repeat or skip a few results.
+
+Scoring a match costs about as much as reading it, so a word found in most
+events would make a search scan the whole table. Only the
+SEARCH_MAX_CANDIDATES most recently created events matching the words and
+the filters are ranked: the id of the oldest of them is found first, walking
+the index from the newest match, and bounds the ranked query. Searches with
+more matches than that miss the older ones, more words or filters narrow
+them down.
+
+The results take the fields and expand query parameters of the event
+endpoints (see fieldsets), their speakers are capped per event like there.
+
+The functions are:
+- search_terms: Split a search into words.
+- search_events: Get a page of events matching a search.
+"""
+
+from datetime import datetime
+from sqlalchemy import Float, and_, column, func, literal, or_, select, table
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+from ..fieldsets import FieldSet, fieldset, load_nested
+from ..models import models_event
+from ..pagination import Page, decode_cursor, encode_cursor
+from ..schemas import schema_events
+from ..serialization import rows_to_dicts
+import os
+import re
+
+SEARCH_MAX_TERMS = 10
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "5000"))
+
+SCORE = column("score", Float)
+# The fields and expand query parameters of the search, the score is always
+# returned as the cursor needs it
+search_fields = fieldset(schema_events.EventSearchResult, models_event.Event)
+
+# The FTS5 table of the SQLite index, its hidden rank column is the bm25 score
+events_fts = table("events_fts", column("rowid"), column("rank"), column("events_fts"))
+
+
+def search_terms(q: str):
+    """Split a search into words, leaving out the operators of the full-text
+    query syntaxes."""
+    return re.findall(r"\w+", q)[:SEARCH_MAX_TERMS]
+
+
+def bounded(query, row_id, criteria, source=None):
+    """Restrict a query to the SEARCH_MAX_CANDIDATES newest rows matching
+    criteria, through a range on their id. The criteria hold the filters too,
+    the rows they leave out must not take the place of older matches."""
+    newest = select(row_id.label("id"))
+    if source is not None:
+        newest = newest.select_from(source)
+    newest = (
+        newest.where(*criteria)
+        .order_by(row_id.desc())
+        .limit(SEARCH_MAX_CANDIDATES)
+        .subquery()
+    )
+    return query.where(row_id >= select(func.min(newest.c.id)).scalar_subquery())
+
+
+def ranked_query(dialect: str, terms: list, columns: list, filters: list = ()):
+    """Select the candidate events matching every term and filter with their
+    score.
+    Args:
+    dialect (str): The name of the database dialect.
+    terms (list): The words to match.
+    columns (list): The columns of the events to select.
+    filters (list): The criteria on the events the results must meet.
+
+    Returns:
+    tuple: The select of the columns and the score, and the score
+    expression, higher for more relevant events.
+    """
+    event = models_event.Event
+    if dialect == "mysql":
+        score = match(
+            event.name,
+            event.description,
+            event.location,
+            against=" ".join(f"+{term}" for term in terms),
+        ).in_boolean_mode()
+        query = select(*columns, score.label("score")).where(score, *filters)
+        return bounded(query, event.id, (score, *filters)), score
+    if dialect == "sqlite":
+        # The FTS5 table is joined directly, a subquery would hide the rowid
+        # range from it and have it score every match
+        matches = events_fts.c.events_fts.match(" ".join(f'"{term}"' for term in terms))
+        score = -events_fts.c.rank
+        query = (
+            select(*columns, score.label("score"))
+            .join_from(event, events_fts, events_fts.c.rowid == event.id)
+            .where(matches, *filters)
+        )
+        # The events are only joined to the candidates when they are filtered
+        source = None
+        if filters:
+            source = events_fts.join(event, events_fts.c.rowid == event.id)
+        return bounded(query, events_fts.c.rowid, (matches, *filters), source), score
+    score = literal(0.0, Float)
+    criteria = [
+        or_(
+            event.name.ilike(f"%{term}%"),
+            event.description.ilike(f"%{term}%"),
+            event.location.ilike(f"%{term}%"),
+        )
+        for term in terms
+    ] + list(filters)
+    query = select(*columns, score.label("score")).where(*criteria)
+    return bounded(query, event.id, criteria), score
+
+
+def search_events(
+    db: Session,
+    q: str,
+    starts_after: datetime | None = None,
+    ends_before: datetime | None = None,
+    organizer_id: int | None = None,
+    limit: int = 20,
+    after: str | None = None,
+    selected: FieldSet | None = None,
+):
+    """Get a page of events matching a search, most relevant first, as plain
+    dicts with their speakers.
+    Args:
+    db (Session): The database session.
+    q (str): The search, every word of it has to match.
+    starts_after (datetime): Only the events starting at or after this time.
+    ends_before (datetime): Only the events ending at or before this time.
+    organizer_id (int): Only the events of this organizer.
+    limit (int): The number of events to return.
+    after (str): The cursor of the previous page.
+    selected (FieldSet): The fields and collections selected, all by default.
+
+    Returns:
+    Page: The events, shaped like the EventSearchResult schema, and the
+    cursor of the next page.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return Page([], None)
+    if selected is None:
+        selected = FieldSet.full(schema_events.EventSearchResult, models_event.Event)
+    event = models_event.Event
+    filters = []
+    if starts_after is not None:
+        filters.append(event.start_time >= starts_after)
+    if ends_before is not None:
+        filters.append(event.end_time <= ends_before)
+    if organizer_id is not None:
+        filters.append(event.organizer_id == organizer_id)
+    query, score = ranked_query(
+        db.get_bind().dialect.name, terms, selected.columns, filters
+    )
+    if after:
+        last_score, last_id = decode_cursor(after, "score", SCORE)
+        query = query.where(
+            or_(score < last_score, and_(score == last_score, event.id > last_id))
+        )
+    rows = db.execute(query.order_by(score.desc(), event.id).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor("score", rows[-1].score, rows[-1].id)
+    events = rows_to_dicts(rows, selected.columns + [SCORE])
+    return Page(load_nested(db, selected, events), next_cursor)
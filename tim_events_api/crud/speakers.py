@@ -1,19 +1,35 @@
 """This module contains functions that interact with the database to perform CRUD operations on the speakers table.
 The functions are:
 - get_speaker: Get a single speaker by its id.
+- get_speaker_fields: Get the selected fields of a single speaker, as a plain dict.
 - get_speakers: Get all speakers for a user.
 - add_speaker: Add a speaker to the database.
 - edit_speaker: Edit a speaker in the database.
 - remove_speaker: Remove a speaker from the database.
+- get_speaker_owner: Get the organizer of a speaker's event.
+- add_speakers: Add many speakers to the database.
+- edit_speakers: Edit many speakers in the database.
+- remove_speakers: Remove many speakers from the database.
+- get_speaker_rows: Get speakers as plain dicts, for the fast list path.
+- get_event_speakers: Get the speakers of many events of an organizer at once.
 
 each function interacts with the database session object to perform the CRUD operations.
 For more information on how to perform CRUD operations,
 see: https://fastapi.tiangolo.com/tutorial/sql-databases/#create-the-crud-utilities
 """
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from ..models import models_speaker, models_user
+from ..models import models_event, models_speaker
 from ..schemas import schema_speakers
+from ..fieldsets import FieldSet, fieldset, get_one
+from ..pagination import paginate
+from ..serialization import paginate_rows, rows_to_dicts, schema_columns
+from .. import response_cache
+from . import bulk, writes
+
+# The fields query parameter of the speaker endpoints
+speaker_fields = fieldset(schema_speakers.Speaker, models_speaker.Speaker)
 
 
 def get_speaker(db: Session, speaker_id: int):
@@ -32,81 +48,384 @@ def get_speaker(db: Session, speaker_id: int):
     )
 
 
-def get_speakers(user_id: int, db: Session, skip: int = 0, limit: int = 100):
-    """Get all speakers for a user.
+def get_speaker_fields(db: Session, speaker_id: int, selected: FieldSet):
+    """Get the selected fields of a single speaker, as a plain dict read as a
+    column tuple.
+    Args:
+    db (Session): The database session.
+    speaker_id (int): The id of the speaker.
+    selected (FieldSet): The fields selected, see speaker_fields.
+
+    Returns:
+    dict: The speaker, shaped like the Speaker schema, or None.
+    """
+    return get_one(db, selected, speaker_id)
+
+
+def get_speakers(
+    user_id: int,
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "id",
+    after: str | None = None,
+):
+    """Get a page of speakers for a user.
     Args:
     user_id (int): The id of the user.
     db (Session): The database session.
-    skip (int): The number of speakers to skip.
+    skip (int): The number of speakers to skip, only used without a cursor.
     limit (int): The number of speakers to return.
+    order_by (str): id or created_at.
+    after (str): The cursor of the previous page.
 
     Returns:
-    List[Speaker]: A list of speaker objects.
+    Page: The speaker objects and the cursor of the next page.
     """
-    return (
+    query = (
         db.query(models_speaker.Speaker)
-        .filter(models_user.User.id == user_id)
-        .offset(skip)
-        .limit(limit)
-        .all()
+        .join(models_speaker.Speaker.event)
+        .filter(*owned_event(user_id))
+    )
+    return paginate(
+        query,
+        models_speaker.Speaker,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
+    )
+
+
+def get_speaker_rows(
+    user_id: int,
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "id",
+    after: str | None = None,
+    selected: FieldSet | None = None,
+):
+    """Get a page of speakers for a user as plain dicts, read as column tuples.
+    Args:
+    user_id (int): The id of the user.
+    db (Session): The database session.
+    skip (int): The number of speakers to skip, only used without a cursor.
+    limit (int): The number of speakers to return.
+    order_by (str): id or created_at.
+    after (str): The cursor of the previous page.
+    selected (FieldSet): The fields selected, all by default.
+
+    Returns:
+    Page: The speakers, shaped like the Speaker schema, and the cursor of the next page.
+    """
+    if selected is None:
+        columns = schema_columns(schema_speakers.Speaker, models_speaker.Speaker)
+    else:
+        columns = selected.columns
+    query = (
+        db.query(*columns)
+        .join(models_speaker.Speaker.event)
+        .filter(*owned_event(user_id))
+    )
+    return paginate_rows(
+        query,
+        models_speaker.Speaker,
+        columns,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
     )
 
 
-def add_speaker(db: Session, speaker: schema_speakers.SpeakerCreate):
-    """Add a speaker to the database.
+def get_event_speakers(db: Session, event_ids: list, user_id: int):
+    """Get the speakers of many events of an organizer as plain dicts, in one
+    query reading the index on speakers (event_id, id).
+    Args:
+    db (Session): The database session.
+    event_ids (list): The ids of the events.
+    user_id (int): The id of the organizer.
+
+    Returns:
+    dict: The speakers of each event, shaped like the Speaker schema, by event
+    id. Events that do not exist or are another organizer's are left out.
+    """
+    columns = schema_columns(schema_speakers.Speaker, models_speaker.Speaker)
+    # Outer joined, so that the events without speakers are returned too
+    rows = db.execute(
+        select(models_event.Event.id, models_speaker.Speaker.id, *columns)
+        .select_from(models_event.Event)
+        .outerjoin(models_event.Event.speakers)
+        .where(models_event.Event.id.in_(event_ids), *owned_event(user_id))
+        .order_by(models_event.Event.id, models_speaker.Speaker.id)
+    ).all()
+    speakers = {}
+    for event_id, speaker_id, *speaker in rows:
+        event_speakers = speakers.setdefault(event_id, [])
+        if speaker_id is not None:
+            event_speakers.append(speaker)
+    return {
+        event_id: rows_to_dicts(event_speakers, columns)
+        for event_id, event_speakers in speakers.items()
+    }
+
+
+def add_speaker(db: Session, speaker: schema_speakers.SpeakerCreate, user_id: int):
+    """Add a speaker to an event of an organizer.
     Args:
     db (Session): The database session.
     speaker (SpeakerCreate): The speaker data.
-    event_id (int): The id of the event.
+    user_id (int): The id of the organizer.
 
     Returns:
-    Speaker: The speaker object.
+    Speaker: The speaker object, or None when the event does not exist or is
+    another organizer's.
     """
+    if not writes.row_exists(
+        db, models_event.Event, speaker.event_id, criteria=owned_event(user_id)
+    ):
+        return None
     db_speaker = models_speaker.Speaker(**speaker.dict())
     db.add(db_speaker)
     db.commit()
+    # The speakers are part of their event's cached responses
+    response_cache.invalidate(response_cache.event_tag(speaker.event_id))
     db.refresh(db_speaker)
     return db_speaker
 
 
-def edit_speaker(db: Session, speaker_id: int, speaker: schema_speakers.SpeakerUpdate):
-    """Edit a speaker in the database.
+def edit_speaker(
+    db: Session,
+    speaker_id: int,
+    speaker: schema_speakers.SpeakerUpdate | schema_speakers.SpeakerPatch,
+    user_id: int,
+):
+    """Edit a speaker of an organizer's event in the database, in one UPDATE
+    of the fields set in the speaker data, scoped to the organizer.
     Args:
     db (Session): The database session.
     speaker_id (int): The id of the speaker.
-    speaker (SpeakerUpdate): The speaker data.
+    speaker (SpeakerUpdate | SpeakerPatch): The speaker data.
+    user_id (int): The id of the organizer, the speaker and the event it is
+    moved to must belong to the organizer.
 
     Returns:
-    Speaker: The speaker object.
+    Speaker: The speaker object, or None when the speaker or the event it is
+    moved to does not exist or is another organizer's.
     """
-    db_speaker = (
-        db.query(models_speaker.Speaker)
-        .filter(models_speaker.Speaker.id == speaker_id)
-        .first()
+    values = speaker.dict(exclude_unset=True)
+    criteria = owned_speaker(user_id)
+    previous_event_id = None
+    if "event_id" in values:
+        criteria += (
+            select(models_event.Event.id)
+            .where(models_event.Event.id == values["event_id"], *owned_event(user_id))
+            .exists(),
+        )
+        # The event the speaker leaves is only known before the update
+        previous_event_id = event_ids_of(db, [speaker_id]).get(speaker_id)
+    if not writes.update_row(
+        db, models_speaker.Speaker, speaker_id, values, criteria=criteria
+    ):
+        return None
+    db_speaker = get_speaker(db, speaker_id)
+    response_cache.invalidate(
+        response_cache.event_tag(previous_event_id),
+        response_cache.event_tag(db_speaker.event_id),
     )
-    speaker_dict = speaker.dict()
-
-    for key, value in speaker_dict.items():
-        setattr(db_speaker, key, value)
-    db.commit()
-    db.refresh(db_speaker)
     return db_speaker
 
 
-def remove_speaker(db: Session, speaker_id: int):
-    """Remove a speaker from the database.
+def remove_speaker(db: Session, speaker_id: int, user_id: int):
+    """Remove a speaker of an organizer's event from the database, without
+    loading it.
     Args:
     db (Session): The database session.
     speaker_id (int): The id of the speaker.
+    user_id (int): The id of the organizer.
 
     Returns:
-    Dict: An empty dictionary.
+    Dict: An empty dictionary, or None when the speaker does not exist or is
+    another organizer's.
     """
-    db_speaker = (
-        db.query(models_speaker.Speaker)
-        .filter(models_speaker.Speaker.id == speaker_id)
-        .first()
-    )
-    db.delete(db_speaker)
-    db.commit()
+    # Read for the invalidation of the event's cached responses
+    event_id = event_ids_of(db, [speaker_id]).get(speaker_id)
+    if not writes.delete_row(
+        db, models_speaker.Speaker, speaker_id, criteria=owned_speaker(user_id)
+    ):
+        return None
+    response_cache.invalidate(response_cache.event_tag(event_id))
     return {}
+
+
+def get_speaker_owner(db: Session, speaker_id: int):
+    """Get the organizer of a speaker's event, by the speaker's primary key.
+    Used to tell a missing speaker from another organizer's one once an
+    owned write matched nothing.
+    Args:
+    db (Session): The database session.
+    speaker_id (int): The id of the speaker.
+
+    Returns:
+    Row: The row with the organizer_id of the speaker's event (None for a
+    speaker without event), or None when the speaker does not exist.
+    """
+    return db.execute(
+        select(models_event.Event.organizer_id)
+        .select_from(models_speaker.Speaker)
+        .outerjoin(models_speaker.Speaker.event)
+        .where(models_speaker.Speaker.id == speaker_id)
+    ).first()
+
+
+def owned_event(user_id: int):
+    """The criteria of the events organized by a user."""
+    return (models_event.Event.organizer_id == user_id,)
+
+
+def owned_speaker(user_id: int):
+    """The criteria of the speakers of the events organized by a user."""
+    return (models_speaker.Speaker.event_id.in_(owned_event_ids(user_id)),)
+
+
+def owned_event_ids(user_id: int):
+    """Select the ids of the events organized by a user."""
+    return select(models_event.Event.id).where(*owned_event(user_id))
+
+
+def event_ids_of(db: Session, speaker_ids: list):
+    """Get the event ids of speakers, by speaker id."""
+    event_ids = {}
+    for chunk in bulk.chunked(speaker_ids):
+        event_ids.update(
+            db.execute(
+                select(
+                    models_speaker.Speaker.id, models_speaker.Speaker.event_id
+                ).where(models_speaker.Speaker.id.in_(chunk))
+            ).all()
+        )
+    return event_ids
+
+
+def add_speakers(db: Session, speakers: list, user_id: int, ids_only: bool = False):
+    """Add many speakers to the events of an organizer, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    speakers (List[SpeakerCreate]): The speaker data.
+    user_id (int): The id of the organizer, speakers of other organizers'
+    events are skipped.
+    ids_only (bool): Leave the speakers out of the results.
+
+    Returns:
+    Dict: The per-speaker results, see bulk.bulk_result.
+    """
+    event_ids = {speaker.event_id for speaker in speakers}
+    owned = set()
+    for chunk in bulk.chunked(list(event_ids)):
+        owned |= bulk.existing_ids(
+            db,
+            models_event.Event,
+            chunk,
+            scope=owned_event(user_id),
+        )
+    rows = []
+    results = []
+    for index, speaker in enumerate(speakers):
+        if speaker.event_id in owned:
+            rows.append((index, speaker.dict()))
+        else:
+            results.append({"index": index, "error": "event does not exist"})
+    results += bulk.insert_rows(db, models_speaker.Speaker, rows, ids_only=ids_only)
+    result = bulk.bulk_result(results)
+    # The results are sorted by index, one per speaker
+    response_cache.invalidate(
+        *(
+            response_cache.event_tag(speaker.event_id)
+            for speaker, item in zip(speakers, result["results"])
+            if not item.get("error")
+        )
+    )
+    return result
+
+
+def edit_speakers(db: Session, speakers: list, user_id: int, ids_only: bool = False):
+    """Edit many speakers of an organizer's events, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    speakers (List[SpeakerBulkUpdate]): The speaker data, with the id of each speaker.
+    user_id (int): The id of the organizer, the speakers and the events they
+    are moved to must belong to the organizer.
+    ids_only (bool): Leave the speakers out of the results.
+
+    Returns:
+    Dict: The per-speaker results, see bulk.bulk_result.
+    """
+    event_ids = list({speaker.event_id for speaker in speakers})
+    owned = set()
+    for chunk in bulk.chunked(event_ids):
+        owned |= bulk.existing_ids(
+            db,
+            models_event.Event,
+            chunk,
+            scope=owned_event(user_id),
+        )
+    rows = []
+    results = []
+    for index, speaker in enumerate(speakers):
+        if speaker.event_id in owned:
+            rows.append((index, speaker.id, speaker.dict(exclude={"id"})))
+        else:
+            results.append(
+                {"index": index, "id": speaker.id, "error": "event does not exist"}
+            )
+    previous_event_ids = event_ids_of(db, [row[1] for row in rows])
+    results += bulk.update_rows(
+        db,
+        models_speaker.Speaker,
+        rows,
+        scope=owned_speaker(user_id),
+        not_found="speaker does not exist",
+        ids_only=ids_only,
+    )
+    result = bulk.bulk_result(results)
+    written = set(bulk.written_ids(result))
+    response_cache.invalidate(
+        *(
+            response_cache.event_tag(event_id)
+            for speaker in speakers
+            if speaker.id in written
+            for event_id in (previous_event_ids.get(speaker.id), speaker.event_id)
+        )
+    )
+    return result
+
+
+def remove_speakers(db: Session, speaker_ids: list, user_id: int):
+    """Remove many speakers of an organizer's events, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    speaker_ids (List[int]): The ids of the speakers.
+    user_id (int): The id of the organizer, speakers of other organizers'
+    events are skipped.
+
+    Returns:
+    Dict: The per-speaker results, see bulk.bulk_result.
+    """
+    deleted_event_ids = set()
+
+    def collect_event_ids(db: Session, speaker_ids: list):
+        deleted_event_ids.update(event_ids_of(db, speaker_ids).values())
+
+    result = bulk.bulk_result(
+        bulk.delete_rows(
+            db,
+            models_speaker.Speaker,
+            speaker_ids,
+            scope=owned_speaker(user_id),
+            not_found="speaker does not exist",
+            before_delete=collect_event_ids,
+        )
+    )
+    response_cache.invalidate(*map(response_cache.event_tag, deleted_event_ids))
+    return result
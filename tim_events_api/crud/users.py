@@ -1,13 +1,18 @@
 """ This module contains the CRUD operations for the users table.
 The functions are:
 - get_user: Get a single user by its id.
+- get_user_fields: Get the selected fields of a single user, as a plain dict.
 - get_user_by_username: Get a single user by its username.
 - get_user_by_email: Get a single user by its email.
+- get_user_conflict: Find whether an email or a username is taken.
 - hash_password: Hash a password.
 - verify_password: Verify a password.
+- set_password_hash: Replace the password hash of a user.
 - authenticate_user: Authenticate a user.
 - create_access_token: Create an access token.
+- decode_access_token: Decode an access token to its username.
 - get_current_user: Get the current user.
+- invalidate_user_cache: Drop a user from the authentication cache.
 - get_users: Get all users.
 - add_user: Add a user.
 - edit_user: Edit a user.
@@ -18,32 +23,74 @@ For more information on how to perform CRUD operations,
 see: https://fastapi.tiangolo.com/tutorial/sql-databases/#create-the-crud-utilities
 """
 
-from sqlalchemy.orm import Session
-from ..models import models_user
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from ..models import models_event, models_user
 from ..schemas import schema_users, schema_token
-from passlib.context import CryptContext
-from ..dependencies import SECRET_KEY, ALGORITHM, get_db, oauth2_scheme
+from .. import passwords
+from ..dependencies import (
+    SECRET_KEY,
+    ALGORITHM,
+    AUTH_CACHE_SIZE,
+    AUTH_CACHE_TTL,
+    get_db,
+    oauth2_scheme,
+    run_crud,
+)
+from ..cache import TTLCache
+from ..fieldsets import FieldSet, fieldset, get_one
+from ..pagination import paginate
+from .. import response_cache
+from . import writes
 from datetime import timedelta, datetime, timezone
 from fastapi import Depends, HTTPException, status
-from ..database import SessionLocal
 import jwt
+import time
 from jwt.exceptions import InvalidTokenError
-from email_validator import validate_email, EmailNotValidError
 
+# access token -> username, never kept past the token's expiry
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+# username -> UserIdentity, invalidated by edit_user and remove_user
+user_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+# The fields and expand query parameters of the user endpoints
+user_fields = fieldset(schema_users.User, models_user.User)
 
-pwd_content = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-
-def get_user(db: Session, user_id: int):
+def get_user(db: Session, user_id: int, with_events: bool = False):
     """Get a single user by its id.
     Args:
     db (Session): The database session.
     user_id (int): The id of the user.
+    with_events (bool): Eager load the user's events and their speakers,
+    in one query per level instead of one query per event.
 
     Returns:
     User: The user object.
     """
-    return db.query(models_user.User).filter(models_user.User.id == user_id).first()
+    query = db.query(models_user.User)
+    if with_events:
+        query = query.options(
+            selectinload(models_user.User.events).selectinload(
+                models_event.Event.speakers
+            )
+        )
+    return query.filter(models_user.User.id == user_id).first()
+
+
+def get_user_fields(db: Session, user_id: int, selected: FieldSet):
+    """Get the selected fields of a single user, and of its events and their
+    speakers, as a plain dict read as column tuples.
+    Args:
+    db (Session): The database session.
+    user_id (int): The id of the user.
+    selected (FieldSet): The fields and collections selected, see user_fields.
+
+    Returns:
+    dict: The user, shaped like the User schema, or None.
+    """
+    return get_one(db, selected, user_id)
 
 
 def get_user_by_username(db: Session, username: str):
@@ -70,35 +117,70 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models_user.User).filter(models_user.User.email == email).first()
 
 
-def is_valid_email(email):
-    validate_email(email=email)
-    return True
-
-
-def hash_password(password: str):
-    """Hash a password.
+def get_user_conflict(db: Session, email: str, username: str):
+    """Find whether an email or a username is taken, in one query.
+    Args:
+    db (Session): The database session.
+    email (str): The email of the new user.
+    username (str): The username of the new user.
+    Returns:
+    str: "email" or "username", the email first when both are taken, or None.
+    """
+    taken = db.execute(
+        select(models_user.User.email == email, models_user.User.username == username)
+        .where(
+            or_(models_user.User.email == email, models_user.User.username == username)
+        )
+        .limit(2)
+    ).all()
+    if any(email_taken for email_taken, _ in taken):
+        return "email"
+    if taken:
+        return "username"
+    return None
+
+
+async def hash_password(password: str):
+    """Hash a password on the password hashing pool.
     Args:
     password (str): The password to hash.
     Returns:
     str: The hashed password.
     """
-    return pwd_content.hash(password)
+    return await passwords.run_password_task(passwords.bcrypt_hash, password)
 
 
-def verify_password(plain_password, hashed_password):
-    """Verify a password.
+async def verify_password(plain_password, hashed_password):
+    """Verify a password on the password hashing pool.
     Args:
     plain_password (str): The plain password.
     hashed_password (str): The hashed password.
 
     Returns:
-    bool: True if the password is valid, False otherwise.
+    tuple: True if the password is valid, False otherwise, and the new hash
+    of the password when it was hashed with outdated settings, else None.
+    """
+    return await passwords.run_password_task(
+        passwords.bcrypt_verify, plain_password, hashed_password
+    )
+
+
+def set_password_hash(db: Session, user_id: int, hashed_password: str):
+    """Replace the password hash of a user.
+    Args:
+    db (Session): The database session.
+    user_id (int): The id of the user.
+    hashed_password (str): The new password hash.
     """
-    return pwd_content.verify(plain_password, hashed_password)
+    db.query(models_user.User).filter(models_user.User.id == user_id).update(
+        {models_user.User.hashed_password: hashed_password}
+    )
+    db.commit()
 
 
-def authenticate_user(db: get_db, username: str, password: str):
+async def authenticate_user(db: Session, username: str, password: str):
     """Authenticate a user.
+    The password is rehashed when it was hashed with an outdated bcrypt cost.
     Args:
     db (Session): The database session.
     username (str): The username of the user.
@@ -107,12 +189,14 @@ def authenticate_user(db: get_db, username: str, password: str):
     Returns:
     User: The user object.
     """
-    user = get_user_by_username(db=db, username=username)
+    user = await run_crud(db, get_user_by_username, username=username)
     if not user:
         return False
-    the_password = verify_password(password, user.hashed_password)
+    the_password, new_hash = await verify_password(password, user.hashed_password)
     if not the_password:
         return False
+    if new_hash:
+        await run_crud(db, set_password_hash, user_id=user.id, hashed_password=new_hash)
     return user
 
 
@@ -137,60 +221,113 @@ def create_access_token(data: dict, expire_timdelta: timedelta | None = None):
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+def decode_access_token(token: str):
+    """Decode an access token to its username.
+    Decoded tokens are cached until they expire.
+    Args:
+    token (str): The access token.
+
+    Returns:
+    str: The username of the token, None if the token is invalid.
+    """
+    username = token_cache.get(token)
+    if username is not None:
+        return username
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_data = schema_token.TokenData(username=payload.get("sub"))
+    except (InvalidTokenError, ValueError):
+        return None
+
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    ttl = AUTH_CACHE_TTL if expires_in is None else min(AUTH_CACHE_TTL, expires_in)
+    token_cache.set(token, token_data.username, ttl=ttl)
+    return token_data.username
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+):
     """Get the current user.
+    The user is resolved once per request on the request's session, and
+    cached so that warm requests do not touch the database.
     Args:
     token (str): The access token.
+    db (Session): The database session.
 
     Returns:
-    User: The user object.
+    UserIdentity: The identity of the user.
     """
     credential_error = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credential_error
-        token_data = schema_token.TokenData(username=username)
-
-    except InvalidTokenError:
+    username = decode_access_token(token)
+    if username is None:
         raise credential_error
 
-    user = get_user_by_username(SessionLocal(), username=token_data.username)
-
+    user = user_cache.get(username)
     if user is None:
-        return credential_error
+        user = await run_crud(
+            db,
+            get_user_by_username,
+            schema=schema_users.UserIdentity,
+            username=username,
+        )
+        if user is None:
+            raise credential_error
+        user_cache.set(username, user)
     return user
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    """Get all users.
+def invalidate_user_cache(user_id: int):
+    """Drop a user from the authentication cache.
+    Args:
+    user_id (int): The id of the user.
+    """
+    user_cache.discard_where(lambda username, user: user.id == user_id)
+
+
+def get_users(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "id",
+    after: str | None = None,
+):
+    """Get a page of users.
     Args:
     db (Session): The database session.
-    skip (int): The number of users to skip.
+    skip (int): The number of users to skip, only used without a cursor.
     limit (int): The number of users to return.
+    order_by (str): id or created_at.
+    after (str): The cursor of the previous page.
 
     Returns:
-    List[User]: A list of user objects.
+    Page: The user objects and the cursor of the next page.
     """
-    return db.query(models_user.User).offset(skip).limit(limit).all()
+    return paginate(
+        db.query(models_user.User),
+        models_user.User,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
+    )
 
 
-def add_user(db: Session, user: schema_users.UserCreate):
+def add_user(db: Session, user: schema_users.UserCreate, hashed_password: str):
     """Add a user.
     Args:
     db (Session): The database session.
     user (UserCreate): The user data.
+    hashed_password (str): The password hash, see hash_password.
 
     Returns:
-    User: The user object.
+    User: The user object, or None when its email or username was taken
+    since get_user_conflict checked them.
     """
-    hashed_password = hash_password(user.password)
-    valid_email = is_valid_email(user.email)
     db_user = models_user.User(
         first_name=user.first_name,
         last_name=user.last_name,
@@ -199,41 +336,57 @@ def add_user(db: Session, user: schema_users.UserCreate):
         username=user.username,
     )
     db.add(db_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
     db.refresh(db_user)
+    # A new user has no events, spares their query
+    set_committed_value(db_user, "events", [])
     return db_user
 
 
-def edit_user(db: Session, user_id: int, user: schema_users.UserUpdate):
-    """Edit a user.
+def edit_user(
+    db: Session,
+    user_id: int,
+    user: schema_users.UserUpdate | schema_users.UserPatch,
+):
+    """Edit a user, in one UPDATE of the fields set in the user data.
     Args:
     db (Session): The database session.
     user_id (int): The id of the user.
-    user (UserUpdate): The user data.
+    user (UserUpdate | UserPatch): The user data.
 
     Returns:
-    User: The user object.
+    User: The user object, or None when the user does not exist.
     """
-    db_user = db.query(models_user.User).filter(models_user.User.id == user_id).first()
-    user_dict = user.dict()
-
-    for key, value in user_dict.items():
-        setattr(db_user, key, value)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    values = user.dict(exclude_unset=True)
+    if not writes.update_row(db, models_user.User, user_id, values):
+        return None
+    invalidate_user_cache(user_id)
+    return get_user(db=db, user_id=user_id, with_events=True)
 
 
 def remove_user(db: Session, user_id: int):
-    """Remove a user.
+    """Remove a user, without loading it.
+    Its events are detached first, like the ORM did.
     Args:
     db (Session): The database session.
     user_id (int): The id of the user.
 
     Returns:
-    dict: An empty dictionary.
+    dict: An empty dictionary, or None when the user does not exist.
     """
-    db_user = db.query(models_user.User).filter(models_user.User.id == user_id).first()
-    db.delete(db_user)
-    db.commit()
+    event_ids = db.scalars(
+        select(models_event.Event.id).where(models_event.Event.organizer_id == user_id)
+    ).all()
+    if event_ids:
+        db.query(models_event.Event).filter(
+            models_event.Event.organizer_id == user_id
+        ).update({models_event.Event.organizer_id: None}, synchronize_session=False)
+    if not writes.delete_row(db, models_user.User, user_id):
+        return None
+    invalidate_user_cache(user_id)
+    response_cache.invalidate(*map(response_cache.event_tag, event_ids))
     return {}
@@ -6,15 +6,26 @@ The functions are:
 - add_venue: Add a venue.
 - edit_venue: Edit a venue.
 - remove_venue: Remove a venue.
+- add_venues: Add many venues.
+- edit_venues: Edit many venues.
+- remove_venues: Remove many venues.
+- get_venue_rows: Get venues as plain dicts, for the fast list path.
+
+The availability and booking conflicts of a venue are in bookings.py.
 
 Each function interacts with the database session object to perform the CRUD operations.
 For more information on how to perform CRUD operations,
 see: https://fastapi.tiangolo.com/tutorial/sql-databases/#create-the-crud-utilities
 """
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from ..models import models_venue
+from ..models import models_event, models_venue
 from ..schemas import schema_venues
+from ..pagination import paginate
+from ..serialization import paginate_rows, schema_columns
+from .. import response_cache
+from . import bulk, writes
 
 
 def get_venue(db: Session, venue_id: int):
@@ -31,17 +42,62 @@ def get_venue(db: Session, venue_id: int):
     )
 
 
-def get_venues(db: Session, skip: int = 0, limit: int = 100):
-    """Get all venues.
+def get_venues(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "id",
+    after: str | None = None,
+):
+    """Get a page of venues.
+    Args:
+    db (Session): The database session.
+    skip (int): The number of venues to skip, only used without a cursor.
+    limit (int): The number of venues to return.
+    order_by (str): id or created_at.
+    after (str): The cursor of the previous page.
+
+    Returns:
+    Page: The venue objects and the cursor of the next page.
+    """
+    return paginate(
+        db.query(models_venue.Venue),
+        models_venue.Venue,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
+    )
+
+
+def get_venue_rows(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "id",
+    after: str | None = None,
+):
+    """Get a page of venues as plain dicts, read as column tuples.
     Args:
     db (Session): The database session.
-    skip (int): The number of venues to skip.
+    skip (int): The number of venues to skip, only used without a cursor.
     limit (int): The number of venues to return.
+    order_by (str): id or created_at.
+    after (str): The cursor of the previous page.
 
     Returns:
-    List[Venue]: A list of venue objects.
+    Page: The venues, shaped like the Venue schema, and the cursor of the next page.
     """
-    return db.query(models_venue.Venue).offset(skip).limit(limit).all()
+    columns = schema_columns(schema_venues.Venue, models_venue.Venue)
+    return paginate_rows(
+        db.query(*columns),
+        models_venue.Venue,
+        columns,
+        order_by=order_by,
+        after=after,
+        skip=skip,
+        limit=limit,
+    )
 
 
 def add_venue(db: Session, venue: schema_venues.VenueCreate):
@@ -56,41 +112,145 @@ def add_venue(db: Session, venue: schema_venues.VenueCreate):
     db_venue = models_venue.Venue(**venue.dict())
     db.add(db_venue)
     db.commit()
+    response_cache.invalidate(response_cache.VENUES_TAG)
     db.refresh(db_venue)
     return db_venue
 
 
-def edit_venue(db: Session, venue_id: int, venue: schema_venues.VenueUpdate):
-    """Edit a venue.
+def edit_venue(
+    db: Session,
+    venue_id: int,
+    venue: schema_venues.VenueUpdate | schema_venues.VenuePatch,
+):
+    """Edit a venue, in one UPDATE of the fields set in the venue data.
     Args:
     db (Session): The database session.
     venue_id (int): The id of the venue.
-    venue (VenueUpdate): The venue data.
+    venue (VenueUpdate | VenuePatch): The venue data.
 
     Returns:
-    Venue: The venue object.
+    Venue: The venue object, or None when the venue does not exist.
     """
-    db_venue = (
-        db.query(models_venue.Venue).filter(models_venue.Venue.id == venue_id).first()
+    values = venue.dict(exclude_unset=True)
+    if not writes.update_row(db, models_venue.Venue, venue_id, values):
+        return None
+    response_cache.invalidate(
+        response_cache.VENUES_TAG, response_cache.venue_tag(venue_id)
     )
-    venue_dict = venue.dict()
-
-    for key, value in venue_dict.items():
-        setattr(db_venue, key, value)
-    db.commit()
-    db.refresh(db_venue)
-    return db_venue
+    return get_venue(db, venue_id)
 
 
 def remove_venue(db: Session, venue_id: int):
-    """Remove a venue.
+    """Remove a venue, in one DELETE.
     Args:
     db (Session): The database session.
     venue_id (int): The id of the venue.
+
+    Returns:
+    dict: An empty dictionary, or None when the venue does not exist.
     """
-    db_venue = (
-        db.query(models_venue.venue).filter(models_venue.venue.id == venue_id).first()
+    event_ids = detach_events(db, [venue_id])
+    if not writes.delete_row(db, models_venue.Venue, venue_id):
+        return None
+    response_cache.invalidate(
+        response_cache.VENUES_TAG,
+        response_cache.venue_tag(venue_id),
+        *map(response_cache.event_tag, event_ids),
     )
-    db.delete(db_venue)
-    db.commit()
     return {}
+
+
+def add_venues(db: Session, venues: list, ids_only: bool = False):
+    """Add many venues, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    venues (List[VenueCreate]): The venue data.
+    ids_only (bool): Leave the venues out of the results.
+
+    Returns:
+    dict: The per-venue results, see bulk.bulk_result.
+    """
+    rows = [(index, venue.dict()) for index, venue in enumerate(venues)]
+    result = bulk.bulk_result(
+        bulk.insert_rows(db, models_venue.Venue, rows, ids_only=ids_only)
+    )
+    if result["succeeded"]:
+        response_cache.invalidate(response_cache.VENUES_TAG)
+    return result
+
+
+def edit_venues(db: Session, venues: list, ids_only: bool = False):
+    """Edit many venues, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    venues (List[VenueBulkUpdate]): The venue data, with the id of each venue.
+    ids_only (bool): Leave the venues out of the results.
+
+    Returns:
+    dict: The per-venue results, see bulk.bulk_result.
+    """
+    rows = [
+        (index, venue.id, venue.dict(exclude={"id"}))
+        for index, venue in enumerate(venues)
+    ]
+    result = bulk.bulk_result(
+        bulk.update_rows(
+            db,
+            models_venue.Venue,
+            rows,
+            not_found="venue does not exist",
+            ids_only=ids_only,
+        )
+    )
+    invalidate_venues(bulk.written_ids(result))
+    return result
+
+
+def remove_venues(db: Session, venue_ids: list):
+    """Remove many venues, in chunked transactions.
+    Args:
+    db (Session): The database session.
+    venue_ids (List[int]): The ids of the venues.
+
+    Returns:
+    dict: The per-venue results, see bulk.bulk_result.
+    """
+    event_ids = []
+    result = bulk.bulk_result(
+        bulk.delete_rows(
+            db,
+            models_venue.Venue,
+            venue_ids,
+            not_found="venue does not exist",
+            before_delete=lambda db, ids: event_ids.extend(detach_events(db, ids)),
+        )
+    )
+    invalidate_venues(bulk.written_ids(result))
+    response_cache.invalidate(*map(response_cache.event_tag, event_ids))
+    return result
+
+
+def detach_events(db: Session, venue_ids: list):
+    """Unbook the events of venues about to be deleted.
+    Args:
+    db (Session): The database session.
+    venue_ids (list): The ids of the venues.
+
+    Returns:
+    list: The ids of the events unbooked.
+    """
+    event = models_event.Event
+    event_ids = list(db.scalars(select(event.id).where(event.venue_id.in_(venue_ids))))
+    if event_ids:
+        db.query(event).filter(event.id.in_(event_ids)).update(
+            {event.venue_id: None}, synchronize_session=False
+        )
+    return event_ids
+
+
+def invalidate_venues(venue_ids: list):
+    """Invalidate the cached responses of written venues."""
+    if venue_ids:
+        response_cache.invalidate(
+            response_cache.VENUES_TAG, *map(response_cache.venue_tag, venue_ids)
+        )
@@ -0,0 +1,78 @@
+"""This module contains the single-row writes shared by the crud modules.
+Rows are updated and deleted by primary key in one statement, without being
+loaded first, and whether the row existed is told by the affected-row count.
+The MySQL dialects of SQLAlchemy connect with the FOUND_ROWS flag, so an
+UPDATE matching a row without changing it still counts it.
+
+The functions are:
+- row_exists: Tell whether a row exists, by its id.
+- update_row: Update the columns of a row by its id.
+- delete_row: Delete a row by its id.
+"""
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+
+def row_exists(db: Session, model, row_id: int, criteria=()):
+    """Tell whether a row exists, by its id, in one SELECT of the id.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    row_id (int): The id of the row.
+    criteria (tuple): Extra filter criteria the row must match.
+
+    Returns:
+    bool: Whether a row matched.
+    """
+    return db.scalar(select(model.id).where(model.id == row_id, *criteria)) is not None
+
+
+def update_row(db: Session, model, row_id: int, values: dict, criteria=()):
+    """Update the columns of a row by its id, in one UPDATE, and commit.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    row_id (int): The id of the row.
+    values (dict): The new values by column name, eg. the set fields of a
+    patch. Without values the row is only looked up.
+    criteria (tuple): Extra filter criteria the row must match.
+
+    Returns:
+    bool: Whether a row matched.
+    """
+    if not values:
+        return row_exists(db, model, row_id, criteria)
+    result = db.execute(
+        update(model)
+        .where(model.id == row_id, *criteria)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def delete_row(db: Session, model, row_id: int, criteria=()):
+    """Delete a row by its id, in one DELETE, and commit.
+    Rows referencing it have to be detached in the same transaction first,
+    that transaction is rolled back when no row is deleted.
+    Args:
+    db (Session): The database session.
+    model: The model class.
+    row_id (int): The id of the row.
+    criteria (tuple): Extra filter criteria the row must match.
+
+    Returns:
+    bool: Whether a row was deleted.
+    """
+    result = db.execute(
+        delete(model)
+        .where(model.id == row_id, *criteria)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
+        return False
+    db.commit()
+    return True
@@ -1,23 +1,279 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, pool
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 import os
+import ssl
+import time
 from dotenv import load_dotenv
+from .metrics import Histogram
+from . import profiling
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 CA_CERT_PATH = os.getenv("CA_CERT_PATH")
-engine = create_engine(
-    url=SQLALCHEMY_DATABASE_URL,
-    connect_args={
-        "ssl": {
-            "sslmode": "REQUIRED",
-            "ca": CA_CERT_PATH,
-        },
-    },
-)
+
+# Set USE_ASYNC_DB=true to serve requests through the asyncio engine below.
+# ASYNC_DATABASE_URL defaults to DATABASE_URL with its driver swapped for the
+# matching asyncio driver (aiomysql for MySQL, aiosqlite for SQLite).
+USE_ASYNC_DB = os.getenv("USE_ASYNC_DB", "false").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+# Comma separated urls of read replicas of DATABASE_URL, see replicas.py. Their
+# asyncio urls are derived like ASYNC_DATABASE_URL's default.
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+
+# Connection pool settings, shared by the sync and the asyncio engine.
+# DB_POOL_CLASS is one of: queue, null, static, singleton.
+DB_POOL_CLASS = os.getenv("DB_POOL_CLASS", "queue")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+POOL_CLASSES = {
+    "queue": pool.QueuePool,
+    "null": pool.NullPool,
+    "static": pool.StaticPool,
+    "singleton": pool.SingletonThreadPool,
+}
+
+# Time spent in Pool.connect(), waiting for a free connection or opening one
+pool_wait_seconds = {"engine": Histogram(), "async_engine": Histogram()}
+
+
+def instrument_pool_class(pool_class, wait_histogram: Histogram):
+    """Subclass a pool class so that every checkout is timed.
+    Args:
+    pool_class (type): The SQLAlchemy pool class.
+    wait_histogram (Histogram): The histogram receiving the checkout wait times.
+
+    Returns:
+    type: The instrumented pool class.
+    """
+
+    class InstrumentedPool(pool_class):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                waited = time.perf_counter() - started
+                wait_histogram.observe(waited)
+                profiling.record("pool", waited)
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def engine_options(url, pool_class, wait_histogram: Histogram):
+    """Build the create_engine keyword arguments for the configured pool.
+    Args:
+    url (URL): The database url.
+    pool_class (type): The SQLAlchemy pool class to use.
+    wait_histogram (Histogram): The histogram receiving the checkout wait times.
+
+    Returns:
+    dict: The keyword arguments for create_engine / create_async_engine.
+    """
+    options = {
+        "poolclass": instrument_pool_class(pool_class, wait_histogram),
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if issubclass(pool_class, pool.QueuePool):
+        options["pool_size"] = DB_POOL_SIZE
+        options["max_overflow"] = DB_MAX_OVERFLOW
+        options["pool_timeout"] = DB_POOL_TIMEOUT
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+def create_sync_engine(url, wait_histogram: Histogram):
+    """Create an engine with the configured pool, over SSL for MySQL.
+    Args:
+    url (URL): The database url.
+    wait_histogram (Histogram): The histogram receiving the checkout wait times.
+
+    Returns:
+    Engine: The engine.
+    """
+    engine_kwargs = engine_options(url, POOL_CLASSES[DB_POOL_CLASS], wait_histogram)
+    if url.get_backend_name() == "mysql":
+        engine_kwargs["connect_args"] = {
+            "ssl": {
+                "sslmode": "REQUIRED",
+                "ca": CA_CERT_PATH,
+            },
+        }
+    return create_engine(url=url, **engine_kwargs)
+
+
+database_url = make_url(SQLALCHEMY_DATABASE_URL)
+engine = create_sync_engine(database_url, pool_wait_seconds["engine"])
 
 Base = declarative_base()
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+def to_async_url(url: str):
+    """Swap the driver of a database url for its asyncio counterpart.
+    Args:
+    url (str): The synchronous database url.
+
+    Returns:
+    str: The database url using an asyncio driver.
+    """
+    sync_url = make_url(url)
+    async_driver = ASYNC_DRIVERS.get(sync_url.get_backend_name())
+    if async_driver is None:
+        raise ValueError(
+            f"No asyncio driver known for {sync_url.drivername}, set ASYNC_DATABASE_URL"
+        )
+    return str(sync_url.set(drivername=async_driver))
+
+
+def create_asyncio_engine(url, wait_histogram: Histogram):
+    """Create an asyncio engine with the configured pool, over SSL for MySQL.
+    Args:
+    url (URL): The database url, with an asyncio driver.
+    wait_histogram (Histogram): The histogram receiving the checkout wait times.
+
+    Returns:
+    AsyncEngine: The engine.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_pool_class = POOL_CLASSES[DB_POOL_CLASS]
+    if async_pool_class is pool.QueuePool:
+        async_pool_class = pool.AsyncAdaptedQueuePool
+    async_engine_kwargs = engine_options(url, async_pool_class, wait_histogram)
+    if url.get_backend_name() == "mysql":
+        async_engine_kwargs["connect_args"] = {
+            "ssl": ssl.create_default_context(cafile=CA_CERT_PATH)
+        }
+    return create_async_engine(url=url, **async_engine_kwargs)
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+if USE_ASYNC_DB:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    async_url = make_url(ASYNC_DATABASE_URL or to_async_url(SQLALCHEMY_DATABASE_URL))
+    async_engine = create_asyncio_engine(async_url, pool_wait_seconds["async_engine"])
+    AsyncSessionLocal = sessionmaker(
+        bind=async_engine, class_=AsyncSession, autoflush=False, autocommit=False
+    )
+
+
+def create_replica_engines(urls: list):
+    """Create the engines of the read replicas, named by position so that
+    their urls (and passwords) stay out of the metrics.
+    Args:
+    urls (list): The database urls of the replicas.
+
+    Returns:
+    list: The (name, engine, asyncio engine or None) of every replica.
+    """
+    engines = []
+    for index, url in enumerate(urls):
+        name = f"replica{index}"
+        pool_wait_seconds[name] = Histogram()
+        replica_async_engine = None
+        if USE_ASYNC_DB:
+            pool_wait_seconds[f"async_{name}"] = Histogram()
+            replica_async_engine = create_asyncio_engine(
+                make_url(to_async_url(url)), pool_wait_seconds[f"async_{name}"]
+            )
+        replica_engine = create_sync_engine(make_url(url), pool_wait_seconds[name])
+        engines.append((name, replica_engine, replica_async_engine))
+    return engines
+
+
+replica_engines = create_replica_engines(DATABASE_REPLICA_URLS)
+
+
+def sync_engines():
+    """Get the engines of the primary and the replicas, the asyncio ones as
+    their sync_engine, eg. to listen to their events.
+    Returns:
+    list: The engines.
+    """
+    engines = [engine]
+    if async_engine is not None:
+        engines.append(async_engine.sync_engine)
+    for _, replica_engine, replica_async_engine in replica_engines:
+        engines.append(replica_engine)
+        if replica_async_engine is not None:
+            engines.append(replica_async_engine.sync_engine)
+    return engines
+
+
+async def dispose_engines():
+    """Close the pooled connections of the engines, on shutdown.
+    The aiosqlite connections run on threads that would keep the process alive.
+    """
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+    for _, replica_engine, replica_async_engine in replica_engines:
+        if replica_async_engine is not None:
+            await replica_async_engine.dispose()
+        replica_engine.dispose()
+
+
+def pool_status(db_engine, wait_histogram: Histogram):
+    """Get the live statistics of an engine's connection pool.
+    Args:
+    db_engine (Engine): The engine owning the pool.
+    wait_histogram (Histogram): The checkout wait times of the pool.
+
+    Returns:
+    dict: The pool class, its counters and the checkout wait histogram.
+    """
+    db_pool = db_engine.pool
+    status = {"pool_class": type(db_pool).__name__}
+    if isinstance(db_pool, pool.QueuePool):
+        status.update(
+            size=db_pool.size(),
+            checked_out=db_pool.checkedout(),
+            idle=db_pool.checkedin(),
+            overflow=max(db_pool.overflow(), 0),
+            max_overflow=db_pool._max_overflow,
+        )
+    status["wait_seconds"] = wait_histogram.snapshot()
+    return status
+
+
+def pool_stats():
+    """Get the live statistics of every connection pool of the app.
+    Returns:
+    dict: The pool statistics by engine name.
+    """
+    stats = {"engine": pool_status(engine, pool_wait_seconds["engine"])}
+    if async_engine is not None:
+        stats["async_engine"] = pool_status(
+            async_engine.sync_engine, pool_wait_seconds["async_engine"]
+        )
+    for name, replica_engine, replica_async_engine in replica_engines:
+        stats[name] = pool_status(replica_engine, pool_wait_seconds[name])
+        if replica_async_engine is not None:
+            stats[f"async_{name}"] = pool_status(
+                replica_async_engine.sync_engine, pool_wait_seconds[f"async_{name}"]
+            )
+    return stats
@@ -1,16 +1,86 @@
+from fastapi import Request
 from fastapi.security import OAuth2PasswordBearer
-from .database import SessionLocal
+from starlette.concurrency import run_in_threadpool
+from .database import SessionLocal, AsyncSessionLocal, USE_ASYNC_DB
+from .pagination import Page
+from . import profiling, replicas
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Decoded access tokens and authenticated users are cached in-process
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def get_sync_db(request: Request):
+    # Read-only requests are served by a replica, see replicas.py
+    with replicas.routed(request) as replica:
+        db = SessionLocal() if replica is None else SessionLocal(bind=replica.engine)
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+async def get_async_db(request: Request):
+    with replicas.routed(request) as replica:
+        bind = {} if replica is None else {"bind": replica.async_engine}
+        async with AsyncSessionLocal(**bind) as db:
+            yield db
+
+
+get_db = get_async_db if USE_ASYNC_DB else get_sync_db
+
+
+def to_schema(schema, result):
+    """Convert the result of a crud function to its response schema.
+    Args:
+    schema (BaseModel): The pydantic schema with orm_mode enabled.
+    result: An ORM object, a list or Page of ORM objects, a dict to parse
+    (ORM objects nested in it are converted too) or None.
+
+    Returns:
+    The schema object(s), or None.
+    """
+    if isinstance(result, Page):
+        return Page(to_schema(schema, result.items), result.next_cursor)
+    if isinstance(result, list):
+        return [schema.from_orm(item) for item in result]
+    if result is None:
+        return result
+    if isinstance(result, dict):
+        return schema.parse_obj(result)
+    return schema.from_orm(result)
+
+
+async def run_crud(db, crud_function, schema=None, **kwargs):
+    """Run a crud function on the request's session without blocking the event loop.
+
+    With an AsyncSession the function runs through AsyncSession.run_sync, so the
+    queries go over the asyncio driver. With a plain Session it runs in the
+    threadpool, exactly like a sync path operation would.
+    When a schema is given the result is converted while the session is still
+    usable, so relationships are never lazy loaded after the call returns.
+
+    Args:
+    db (Session | AsyncSession): The database session.
+    crud_function: The crud function to call, it receives the session as `db`.
+    schema (BaseModel): The response schema to convert the result to.
+    kwargs: The remaining arguments of the crud function.
+
+    Returns:
+    The result of the crud function.
+    """
+
+    def call(session):
+        result = crud_function(db=session, **kwargs)
+        if schema is not None:
+            result = to_schema(schema, result)
+        return result
+
+    if USE_ASYNC_DB:
+        return await db.run_sync(call)
+    return await run_in_threadpool(profiling.profile_thread(call), db)
@@ -0,0 +1,163 @@
+"""This module checks the email addresses of the signups without waiting for
+the network.
+
+The syntax of an address is checked inline. Whether its domain accepts mail
+(an MX record other than a null MX, or an A or AAAA record without MX) is
+looked up in DNS, but by default never on the request path: the results are
+kept by domain in a bounded TTLCache, a domain missing from it is accepted and
+queued, and background tasks look the queued domains up. A cached domain past
+half of its EMAIL_DOMAIN_CACHE_TTL is queued again, so the domains in use are
+refreshed before they expire. An address whose domain is known not to accept
+mail is rejected.
+
+A lookup that fails (a timeout, no nameserver reachable) leaves its domain
+unknown rather than undeliverable, so the signups keep working without a
+network. The cache and the queue are kept in-process, like the other caches.
+
+EMAIL_DELIVERABILITY is one of:
+- cached: Check the domains in the background, as above (the default).
+- inline: Look the domains missing from the cache up before answering.
+- off: Check the syntax only.
+
+The functions are:
+- lookup_domain: Look up whether a domain accepts mail.
+- check_email: Check an email address.
+- start_lookups: Look the queued domains up in the background.
+- stop_lookups: Stop the background lookups.
+"""
+
+from email_validator import EmailUndeliverableError, validate_email
+from starlette.concurrency import run_in_threadpool
+from .cache import TTLCache
+import asyncio
+import dns.exception
+import dns.resolver
+import logging
+import os
+import time
+
+EMAIL_DELIVERABILITY = os.getenv("EMAIL_DELIVERABILITY", "cached")
+EMAIL_DOMAIN_CACHE_TTL = float(os.getenv("EMAIL_DOMAIN_CACHE_TTL", "86400"))
+EMAIL_DOMAIN_CACHE_SIZE = int(os.getenv("EMAIL_DOMAIN_CACHE_SIZE", "10000"))
+EMAIL_DNS_TIMEOUT = float(os.getenv("EMAIL_DNS_TIMEOUT", "5"))
+
+MODES = ("cached", "inline", "off")
+if EMAIL_DELIVERABILITY not in MODES:
+    raise RuntimeError(f"EMAIL_DELIVERABILITY must be one of: {', '.join(MODES)}")
+
+# Lookups running at once, each holds a threadpool thread for up to
+# EMAIL_DNS_TIMEOUT seconds per record type
+LOOKUP_WORKERS = 4
+# Domains waiting for a lookup, the next ones are left unknown until a later
+# signup queues them again
+LOOKUP_QUEUE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+# domain: (accepts mail, when it was looked up)
+domain_cache = TTLCache(maxsize=EMAIL_DOMAIN_CACHE_SIZE, ttl=EMAIL_DOMAIN_CACHE_TTL)
+_queue = None
+_queued = set()
+_workers = []
+
+
+def resolves(domain: str, record_type: str):
+    try:
+        return dns.resolver.resolve(domain, record_type, lifetime=EMAIL_DNS_TIMEOUT)
+    except dns.resolver.NoAnswer:
+        return None
+
+
+def lookup_domain(domain: str):
+    """Look up whether a domain accepts mail, blocking on DNS.
+    Args:
+    domain (str): The ASCII domain of an email address.
+
+    Returns:
+    bool: Whether it accepts mail, None when the lookup failed.
+    """
+    try:
+        answer = resolves(domain, "MX")
+        if answer is not None:
+            # A null MX (RFC 7505) declares that the domain accepts no mail
+            return any(str(record.exchange) != "." for record in answer)
+        return resolves(domain, "A") is not None or resolves(domain, "AAAA") is not None
+    except dns.resolver.NXDOMAIN:
+        return False
+    except dns.exception.DNSException as error:
+        logger.info("the lookup of the domain %s failed: %s", domain, error)
+        return None
+
+
+def remember(domain: str, deliverable: bool | None):
+    # An unknown result keeps the previous one until it expires
+    if deliverable is not None:
+        domain_cache.set(domain, (deliverable, time.monotonic()))
+
+
+def queue_lookup(domain: str):
+    if _queue is None or domain in _queued or len(_queued) >= LOOKUP_QUEUE_SIZE:
+        return
+    _queued.add(domain)
+    _queue.put_nowait(domain)
+
+
+async def run_lookups():
+    while True:
+        domain = await _queue.get()
+        try:
+            remember(domain, await run_in_threadpool(lookup_domain, domain))
+        except Exception:
+            logger.exception("the lookup of the domain %s failed", domain)
+        finally:
+            _queued.discard(domain)
+
+
+async def check_email(email: str):
+    """Check the syntax of an email address and, from the cache unless
+    EMAIL_DELIVERABILITY is inline, that its domain accepts mail.
+    Args:
+    email (str): The email address.
+
+    Raises:
+    EmailNotValidError: When the syntax is invalid (EmailSyntaxError), or the
+    domain is known not to accept mail (EmailUndeliverableError).
+    """
+    validated = validate_email(email, check_deliverability=False)
+    if EMAIL_DELIVERABILITY == "off":
+        return
+    domain = validated.ascii_domain.lower()
+    entry = domain_cache.get(domain)
+    if entry is not None:
+        deliverable, looked_up_at = entry
+        if time.monotonic() - looked_up_at > domain_cache.ttl / 2:
+            queue_lookup(domain)
+    elif EMAIL_DELIVERABILITY == "inline":
+        deliverable = await run_in_threadpool(lookup_domain, domain)
+        remember(domain, deliverable)
+    else:
+        queue_lookup(domain)
+        return
+    if deliverable is False:
+        raise EmailUndeliverableError(
+            f"The domain name {validated.domain} does not accept email."
+        )
+
+
+async def start_lookups():
+    """Look the queued domains up in the background, on startup."""
+    global _queue
+    if EMAIL_DELIVERABILITY != "off" and _queue is None:
+        _queue = asyncio.Queue()
+        for _ in range(LOOKUP_WORKERS):
+            _workers.append(asyncio.create_task(run_lookups()))
+
+
+async def stop_lookups():
+    """Stop the background lookups, on shutdown."""
+    global _queue
+    for worker in _workers:
+        worker.cancel()
+    _workers.clear()
+    _queued.clear()
+    _queue = None
@@ -0,0 +1,330 @@
+"""This module implements the sparse fieldsets of the read endpoints of users,
+events and speakers: their fields and expand query parameters.
+
+`fields` lists the fields to return, comma separated, the fields of nested
+objects by their path (eg. `first_name,events.name`). The id of every object
+is always returned, and a level without any field listed returns all of its
+fields.
+
+`expand` lists the nested collections to embed (eg. `events.speakers`, which
+embeds `events` too), each capped to `:<count>` objects per parent (eg.
+`events:10`). Without fields nor expand every collection is embedded, as
+before. With them, only the collections named in either are. Collections are
+always capped to NESTED_ITEMS_LIMIT objects per parent, the paginated list
+endpoints serve the rest.
+
+The selected fields are read as column tuples, so the columns left out (eg.
+the description and bio text columns) are never read from the database. Each
+level of nested collections is read in one query for all of its parents,
+capped per parent with a ROW_NUMBER() window.
+
+The classes are:
+- FieldSet: The fields and nested collections selected from a schema.
+
+The functions are:
+- fieldset: Build the dependency parsing fields and expand for a schema.
+- sparse_schema: Get the schema documenting the sparse responses.
+- get_one: Get a single object as a dict, with the selected fields.
+- load_nested: Read the nested collections of objects read as dicts.
+"""
+
+from functools import lru_cache
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel, create_model
+from pydantic.fields import SHAPE_LIST
+from pydantic.utils import lenient_issubclass
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from .serialization import rows_to_dicts
+import os
+
+NESTED_ITEMS_LIMIT = int(os.getenv("NESTED_ITEMS_LIMIT", "1000"))
+
+
+def collections(schema):
+    """Get the nested collections of a schema.
+    Returns:
+    dict: The schema of their items, by field name.
+    """
+    return {
+        name: field.type_
+        for name, field in schema.__fields__.items()
+        if field.shape == SHAPE_LIST and lenient_issubclass(field.type_, BaseModel)
+    }
+
+
+def related_model(model, name: str):
+    return getattr(model, name).property.mapper.class_
+
+
+class FieldSet:
+    """The fields and nested collections selected from a schema.
+    Args:
+    schema (BaseModel): The response schema.
+    model: The model class backing it.
+    names (set): The fields selected, all of them when empty.
+    """
+
+    def __init__(self, schema, model, names=()):
+        self.schema = schema
+        self.model = model
+        table_columns = model.__table__.columns
+        self.columns = [
+            getattr(model, name)
+            for name in schema.__fields__
+            if name in table_columns and (not names or name in names or name == "id")
+        ]
+        # name: (FieldSet, limit per parent)
+        self.nested = {}
+
+    @classmethod
+    def full(cls, schema, model):
+        """Select every field and collection of a schema."""
+        selected = cls(schema, model)
+        for name, item_schema in collections(schema).items():
+            selected.nested[name] = (
+                cls.full(item_schema, related_model(model, name)),
+                NESTED_ITEMS_LIMIT,
+            )
+        return selected
+
+
+def invalid(detail: str):
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def schema_at(schema, path: tuple):
+    """Get the schema of the items of a nested collection, by its path."""
+    for name in path:
+        nested = collections(schema)
+        if name not in nested:
+            raise invalid(f"unknown collection: {'.'.join(path)}")
+        schema = nested[name]
+    return schema
+
+
+def split(value: str | None):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def parse_limit(text: str, path: str):
+    try:
+        limit = int(text)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= NESTED_ITEMS_LIMIT:
+        raise invalid(f"the limit of {path} must be between 1 and {NESTED_ITEMS_LIMIT}")
+    return limit
+
+
+def parse_fieldset(schema, model, fields: str | None, expand: str | None):
+    """Parse the fields and expand query parameters of a request.
+    Args:
+    schema (BaseModel): The response schema.
+    model: The model class backing it.
+    fields (str): The fields parameter, see the module's docstring.
+    expand (str): The expand parameter.
+
+    Returns:
+    FieldSet: The selection.
+
+    Raises:
+    HTTPException: 400 when a field or collection is unknown, or a limit invalid.
+    """
+    if fields is None and expand is None:
+        return FieldSet.full(schema, model)
+    # path of the collection: names of its selected fields
+    names = {}
+    # path of the collection: limit per parent
+    expanded = {}
+    for item in split(fields):
+        *path, name = item.split(".")
+        path = tuple(path)
+        item_schema = schema_at(schema, path)
+        if name in collections(item_schema):
+            path += (name,)
+        elif name in item_schema.__fields__:
+            names.setdefault(path, set()).add(name)
+        else:
+            raise invalid(f"unknown field: {item}")
+        # The collections holding the field are embedded
+        for end in range(1, len(path) + 1):
+            expanded.setdefault(path[:end], NESTED_ITEMS_LIMIT)
+    for item in split(expand):
+        path_text, _, limit_text = item.partition(":")
+        path = tuple(path_text.split("."))
+        schema_at(schema, path)
+        if limit_text:
+            expanded[path] = parse_limit(limit_text, path_text)
+        else:
+            expanded.setdefault(path, NESTED_ITEMS_LIMIT)
+        for end in range(1, len(path)):
+            expanded.setdefault(path[:end], NESTED_ITEMS_LIMIT)
+
+    def build(schema, model, path: tuple):
+        selected = FieldSet(schema, model, names.get(path, ()))
+        for name, item_schema in collections(schema).items():
+            if path + (name,) in expanded:
+                selected.nested[name] = (
+                    build(item_schema, related_model(model, name), path + (name,)),
+                    expanded[path + (name,)],
+                )
+        return selected
+
+    return build(schema, model, ())
+
+
+def field_paths(schema, prefix: str = ""):
+    """List the fields of a schema and of its nested objects, by path."""
+    nested = collections(schema)
+    paths = []
+    for name in schema.__fields__:
+        paths.append(prefix + name)
+        if name in nested:
+            paths += field_paths(nested[name], f"{prefix}{name}.")
+    return paths
+
+
+def collection_paths(schema, prefix: str = ""):
+    """List the nested collections of a schema, by path."""
+    paths = []
+    for name, item_schema in collections(schema).items():
+        paths.append(prefix + name)
+        paths += collection_paths(item_schema, f"{prefix}{name}.")
+    return paths
+
+
+def fieldset(schema, model):
+    """Build the dependency parsing the fields and expand query parameters of
+    a request for a schema, documenting the accepted values. A schema without
+    collections only gets fields.
+    Args:
+    schema (BaseModel): The response schema.
+    model: The model class backing it.
+
+    Returns:
+    The dependency, returning a FieldSet.
+    """
+    fields_description = (
+        "Comma separated fields to return, all of them by default. "
+        f"Any of: {', '.join(field_paths(schema))}. The ids are always returned."
+    )
+    nested_paths = collection_paths(schema)
+    if not nested_paths:
+
+        def parse_fields(
+            fields: str | None = Query(None, description=fields_description)
+        ):
+            return parse_fieldset(schema, model, fields, None)
+
+        return parse_fields
+
+    expand_description = (
+        "Comma separated collections to embed, each optionally followed by "
+        f"`:<count>` to cap it per parent (at most {NESTED_ITEMS_LIMIT}). "
+        f"Any of: {', '.join(nested_paths)}. Without `fields` nor `expand` "
+        "all of them are embedded."
+    )
+
+    def parse_fields_expand(
+        fields: str | None = Query(None, description=fields_description),
+        expand: str | None = Query(None, description=expand_description),
+    ):
+        return parse_fieldset(schema, model, fields, expand)
+
+    return parse_fields_expand
+
+
+@lru_cache(maxsize=None)
+def sparse_schema(schema):
+    """Get the schema documenting the sparse responses of a schema, in which
+    every field but the id may be left out.
+    Args:
+    schema (BaseModel): The response schema.
+
+    Returns:
+    BaseModel: The Sparse<schema> schema.
+    """
+    nested = collections(schema)
+    fields = {}
+    for name, field in schema.__fields__.items():
+        if name == "id":
+            fields[name] = (field.outer_type_, ...)
+        elif name in nested:
+            fields[name] = (list[sparse_schema(nested[name])], None)
+        else:
+            fields[name] = (field.outer_type_ | None, None)
+    return create_model(f"Sparse{schema.__name__}", **fields)
+
+
+def get_one(db: Session, fieldset: FieldSet, object_id: int):
+    """Get a single object as a dict, with the selected fields and nested
+    collections.
+    Args:
+    db (Session): The database session.
+    fieldset (FieldSet): The selection.
+    object_id (int): The id of the object.
+
+    Returns:
+    dict: The object, or None when it does not exist.
+    """
+    row = db.execute(
+        select(*fieldset.columns).where(fieldset.model.id == object_id)
+    ).first()
+    if row is None:
+        return None
+    return load_nested(db, fieldset, rows_to_dicts([row], fieldset.columns))[0]
+
+
+def load_nested(db: Session, fieldset: FieldSet, parents: list):
+    """Read the nested collections of objects read as dicts, one query per
+    level of collections, capped per parent.
+    Args:
+    db (Session): The database session.
+    fieldset (FieldSet): The selection the parents were read with.
+    parents (list): The objects, as dicts with their id.
+
+    Returns:
+    list: The parents, each with its collections as lists of dicts.
+    """
+    for name, (selected, limit) in fieldset.nested.items():
+        items_by_parent = {parent["id"]: [] for parent in parents}
+        for parent in parents:
+            parent[name] = items_by_parent[parent["id"]]
+        if not items_by_parent:
+            continue
+        # eg. events.organizer_id for the events of a user
+        ((_, foreign_key),) = getattr(fieldset.model, name).property.local_remote_pairs
+        item_id = selected.model.id
+        if len(items_by_parent) == 1:
+            statement = (
+                select(foreign_key, *selected.columns)
+                .where(foreign_key == next(iter(items_by_parent)))
+                .order_by(item_id)
+                .limit(limit)
+            )
+        else:
+            position = (
+                func.row_number()
+                .over(partition_by=foreign_key, order_by=item_id)
+                .label("position")
+            )
+            ranked = (
+                select(foreign_key.label("parent_id"), *selected.columns, position)
+                .where(foreign_key.in_(list(items_by_parent)))
+                .subquery()
+            )
+            statement = (
+                select(*(column for column in ranked.c if column.name != "position"))
+                .where(ranked.c.position <= limit)
+                .order_by(ranked.c.parent_id, ranked.c.id)
+            )
+        names = [column.key for column in selected.columns]
+        items = []
+        for parent_id, *values in db.execute(statement):
+            item = dict(zip(names, values))
+            items_by_parent[parent_id].append(item)
+            items.append(item)
+        if selected.nested:
+            load_nested(db, selected, items)
+    return parents
@@ -0,0 +1,132 @@
+"""This module implements an interval tree, used to check many venue bookings
+against each other in memory.
+
+The tree is a treap ordered by the start of the intervals (their key breaking
+ties) whose nodes also hold the greatest end of their subtree, so that an
+overlap query skips every subtree ending before the queried interval.
+Adding, removing and querying take O(log n) on average, plus the number of
+intervals found.
+
+The classes are:
+- IntervalTree: A set of half-open intervals answering overlap queries.
+"""
+
+import random
+
+
+class Node:
+    __slots__ = ("start", "end", "key", "priority", "max_end", "left", "right")
+
+    def __init__(self, start, end, key):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.priority = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+
+def update(node: Node):
+    """Recompute the greatest end of a node's subtree from its children."""
+    node.max_end = node.end
+    for child in (node.left, node.right):
+        if child is not None and child.max_end > node.max_end:
+            node.max_end = child.max_end
+    return node
+
+
+def split(node: Node, position: tuple):
+    """Split a subtree into the nodes before a (start, key) position and the
+    others."""
+    if node is None:
+        return None, None
+    if (node.start, node.key) < position:
+        node.right, right = split(node.right, position)
+        return update(node), right
+    left, node.left = split(node.left, position)
+    return left, update(node)
+
+
+def merge(left: Node, right: Node):
+    """Merge two subtrees, every node of left being before those of right."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return update(left)
+    right.left = merge(left, right.left)
+    return update(right)
+
+
+def delete(node: Node, position: tuple):
+    """Delete the node at a (start, key) position from a subtree."""
+    if node is None:
+        return None
+    node_position = (node.start, node.key)
+    if position == node_position:
+        return merge(node.left, node.right)
+    if position < node_position:
+        node.left = delete(node.left, position)
+    else:
+        node.right = delete(node.right, position)
+    return update(node)
+
+
+class IntervalTree:
+    """A set of half-open [start, end) intervals, each with a unique key.
+    Args:
+    intervals (Iterable): (start, end, key) triples to add. The starts and ends
+    must be comparable with each other, and so must the keys.
+    """
+
+    def __init__(self, intervals=()):
+        self.root = None
+        self.intervals = {}
+        for start, end, key in intervals:
+            self.add(start, end, key)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __contains__(self, key):
+        return key in self.intervals
+
+    def add(self, start, end, key):
+        """Add an interval, replacing the one with the same key."""
+        self.remove(key)
+        self.intervals[key] = (start, end)
+        left, right = split(self.root, (start, key))
+        self.root = merge(merge(left, Node(start, end, key)), right)
+
+    def remove(self, key):
+        """Remove the interval of a key.
+        Returns:
+        tuple: The (start, end) of the removed interval, or None when the key
+        has none.
+        """
+        interval = self.intervals.pop(key, None)
+        if interval is not None:
+            self.root = delete(self.root, (interval[0], key))
+        return interval
+
+    def overlapping(self, start, end):
+        """Find the intervals overlapping [start, end).
+        Returns:
+        list: The (start, end, key) triples of the intervals, ordered by start.
+        """
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.start < end:
+                if node.end > start:
+                    found.append((node.start, node.end, node.key))
+                stack.append(node.right)
+        found.sort(key=lambda interval: (interval[0], interval[2]))
+        return found
@@ -1,7 +1,18 @@
 import uvicorn
 from fastapi import FastAPI
-from .routers import router_events, router_speaker, router_users, router_venue
-from .database import Base, engine
+from fastapi.responses import PlainTextResponse
+from .routers import (
+    router_events,
+    router_export,
+    router_search,
+    router_speaker,
+    router_users,
+    router_venue,
+)
+from .compression import CompressionMiddleware
+from .database import dispose_engines, pool_stats
+from .metrics import Exposition
+from . import emails, monitoring, passwords, profiling, replicas
 
 
 description = """
@@ -17,6 +28,7 @@ It also supports CRUD operations
 
 You will be able to:
 Perform CRUD Operations on Events
+and search the events of every organizer
 
 ## Speakers.
 You will be able to perform CRUD operations on Speakers
@@ -41,6 +53,10 @@ tags_metadata = [
         "name": "venues",
         "description": "Manage venues. Manages CRUD operation for venues.",
     },
+    {
+        "name": "export",
+        "description": "Stream full or incremental dumps as NDJSON or CSV. Admins only.",
+    },
 ]
 
 app = FastAPI(
@@ -51,17 +67,50 @@ app = FastAPI(
     openapi_tags=tags_metadata
 )
 
-Base.metadata.create_all(bind=engine)
 
+app.add_event_handler("startup", replicas.start_health_checks)
+app.add_event_handler("startup", emails.start_lookups)
+app.add_event_handler("shutdown", replicas.stop_health_checks)
+app.add_event_handler("shutdown", emails.stop_lookups)
+app.add_event_handler("shutdown", passwords.shutdown)
+app.add_event_handler("shutdown", dispose_engines)
 
 app.include_router(router_users.router)
 app.include_router(router_events.router)
+app.include_router(router_search.router)
 app.include_router(router_speaker.router)
 app.include_router(router_venue.router)
+app.include_router(router_export.router)
 
 @app.get("/")
 def read_root():
     return {"Welcome to the app"}
 
+
+@app.get("/health/db")
+def read_db_health():
+    """Live connection pool statistics: checked out, idle and overflow
+    connections and a histogram of the time spent waiting for a connection,
+    and the health of the read replicas."""
+    return {**pool_stats(), "replicas": replicas.status()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Request, connection pool, password hashing and cache metrics, in the
+    prometheus text format. Async, so it reads the counters from the event
+    loop thread that updates them."""
+    return PlainTextResponse(monitoring.collect(), media_type=Exposition.content_type)
+
+
+# Once every route is added
+monitoring.install(app)
+
+app.add_middleware(CompressionMiddleware)
+
+# Opt-in, see profiling.py. Last, so that every route is profiled
+if profiling.PROFILING:
+    profiling.install(app)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
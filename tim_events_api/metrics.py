@@ -0,0 +1,125 @@
+"""This module contains the in-process metric types used across the app.
+The types are:
+- Histogram: Count observations into cumulative buckets.
+- Exposition: Write metrics in the prometheus text format.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+
+# Bucket upper bounds in seconds, from sub-millisecond to the pool timeout range
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    """Count observations into buckets, prometheus style."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        """Record one observation.
+        Args:
+        value (float): The observed value.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """Get the current state of the histogram.
+        Returns:
+        dict: The cumulative count per bucket upper bound, the count and the sum.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "count": cumulative, "sum": total}
+
+
+def format_labels(labels: dict):
+    """Format labels as a prometheus label set, eg. {route="/venues/"}."""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        value = value.replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Exposition:
+    """Write metrics in the prometheus text format (version 0.0.4).
+    Each metric is declared once, with its type and help, then its samples.
+    """
+
+    # The responses add the charset
+    content_type = "text/plain; version=0.0.4"
+
+    def __init__(self):
+        self._lines = []
+
+    def declare(self, name: str, metric_type: str, help_text: str):
+        """Declare a metric, before its samples.
+        Args:
+        name (str): The name of the metric.
+        metric_type (str): counter, gauge or histogram.
+        help_text (str): What the metric measures.
+        """
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, value: float, labels: dict | None = None):
+        """Add a sample of a declared metric.
+        Args:
+        name (str): The name of the metric.
+        value (float): The value of the sample.
+        labels (dict): The labels of the sample.
+        """
+        self._lines.append(f"{name}{format_labels(labels)} {value}")
+
+    def histogram(self, name: str, snapshot: dict, labels: dict | None = None):
+        """Add the buckets, count and sum of a declared histogram.
+        Args:
+        name (str): The name of the metric.
+        snapshot (dict): The snapshot of the histogram.
+        labels (dict): The labels of the histogram.
+        """
+        labels = labels or {}
+        for bound, count in snapshot["buckets"].items():
+            self.sample(f"{name}_bucket", count, {**labels, "le": bound})
+        self.sample(f"{name}_count", snapshot["count"], labels)
+        self.sample(f"{name}_sum", snapshot["sum"], labels)
+
+    def render(self):
+        """Get the text of the metrics.
+        Returns:
+        str: The metrics, one sample per line.
+        """
+        return "\n".join(self._lines) + "\n"
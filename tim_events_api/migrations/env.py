@@ -0,0 +1,60 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from tim_events_api.database import Base, engine
+from tim_events_api.models import (  # noqa: F401, registers the tables on Base
+    models_event,
+    models_speaker,
+    models_user,
+    models_venue,
+)
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave the full-text index of the event search out of the comparison,
+    it is created outside of the metadata, see models_event.SEARCH_INDEX_DDL."""
+    return name != "ix_events_search" and not (
+        type_ == "table" and name.startswith("events_fts")
+    )
+
+
+def run_migrations_offline() -> None:
+    """Emit the migrations as SQL to stdout (alembic upgrade head --sql)."""
+    context.configure(
+        url=engine.url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        include_object=include_object,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Run the migrations on the application's engine."""
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite",
+            include_object=include_object,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,95 @@
+"""initial schema
+
+The tables as Base.metadata.create_all created them before migrations were
+introduced. Databases created that way are marked as migrated with:
+
+    alembic stamp 0001
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 15:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("first_name", sa.String(length=60), nullable=True),
+        sa.Column("username", sa.String(length=70), nullable=True),
+        sa.Column("last_name", sa.String(length=60), nullable=True),
+        sa.Column("email", sa.String(length=60), nullable=True),
+        sa.Column("hashed_password", sa.String(length=60), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_organizer", sa.Boolean(), nullable=True),
+        sa.Column("is_admin", sa.Boolean(), nullable=True),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_users_id"), "users", ["id"], unique=False)
+    op.create_table(
+        "venues",
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.Column("location", sa.String(length=255), nullable=True),
+        sa.Column("capacity", sa.Integer(), nullable=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_venues_id"), "venues", ["id"], unique=False)
+    op.create_table(
+        "events",
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("location", sa.String(length=255), nullable=True),
+        sa.Column("start_time", sa.DateTime(), nullable=True),
+        sa.Column("end_time", sa.DateTime(), nullable=True),
+        sa.Column("organizer_id", sa.Integer(), nullable=True),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["organizer_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_events_id"), "events", ["id"], unique=False)
+    op.create_table(
+        "speakers",
+        sa.Column("first_name", sa.String(length=60), nullable=True),
+        sa.Column("last_name", sa.String(length=60), nullable=True),
+        sa.Column("bio", sa.Text(), nullable=True),
+        sa.Column("profile_picture", sa.String(length=255), nullable=True),
+        sa.Column("contact_info", sa.String(length=255), nullable=True),
+        sa.Column("event_id", sa.Integer(), nullable=True),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["event_id"], ["events.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_speakers_id"), "speakers", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_speakers_id"), table_name="speakers")
+    op.drop_table("speakers")
+    op.drop_index(op.f("ix_events_id"), table_name="events")
+    op.drop_table("events")
+    op.drop_index(op.f("ix_venues_id"), table_name="venues")
+    op.drop_table("venues")
+    op.drop_index(op.f("ix_users_id"), table_name="users")
+    op.drop_table("users")
@@ -0,0 +1,58 @@
+"""add lookup indexes
+
+Unique indexes for the username (every authentication) and email (signup)
+lookups, and composite indexes for the per-organizer event listing, the
+per-event speaker listing and the created_at ordered pages.
+Creating the unique indexes fails if duplicate usernames or emails exist,
+those have to be resolved first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 15:06:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f("ix_users_username"), "users", ["username"], unique=True)
+    op.create_index(op.f("ix_users_email"), "users", ["email"], unique=True)
+    op.create_index(
+        "ix_events_organizer_id_start_time",
+        "events",
+        ["organizer_id", "start_time"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_events_organizer_id_created_at",
+        "events",
+        ["organizer_id", "created_at"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_speakers_event_id_id", "speakers", ["event_id", "id"], unique=False
+    )
+    for table in ("users", "events", "speakers", "venues"):
+        op.create_index(
+            op.f(f"ix_{table}_created_at"), table, ["created_at"], unique=False
+        )
+
+
+def downgrade() -> None:
+    for table in ("users", "events", "speakers", "venues"):
+        op.drop_index(op.f(f"ix_{table}_created_at"), table_name=table)
+    op.drop_index("ix_speakers_event_id_id", table_name="speakers")
+    op.drop_index("ix_events_organizer_id_created_at", table_name="events")
+    op.drop_index("ix_events_organizer_id_start_time", table_name="events")
+    op.drop_index(op.f("ix_users_email"), table_name="users")
+    op.drop_index(op.f("ix_users_username"), table_name="users")
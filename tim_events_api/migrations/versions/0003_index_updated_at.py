@@ -0,0 +1,43 @@
+"""index updated_at
+
+updated_at was only set on update, with the time the app started instead of
+the time of the write. It is now set on insert and update. Rows that were
+never updated get their created_at, and the column is indexed for the
+incremental exports.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 15:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("users", "events", "speakers", "venues")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.execute(
+            sa.text(
+                f"UPDATE {table} SET updated_at = created_at "
+                "WHERE updated_at IS NULL OR updated_at < created_at"
+            )
+        )
+        op.create_index(
+            op.f(f"ix_{table}_updated_at"), table, ["updated_at"], unique=False
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(op.f(f"ix_{table}_updated_at"), table_name=table)
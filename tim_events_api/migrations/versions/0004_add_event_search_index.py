@@ -0,0 +1,70 @@
+"""add event search index
+
+The full-text index of the event search: a FULLTEXT index on MySQL, an FTS5
+table indexing the events table on SQLite, kept in sync by triggers and
+filled from the existing events. Also indexes start_time for the time range
+filters of the search.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FTS_COLUMNS = "name, description, location"
+
+UPGRADE = {
+    "mysql": [
+        f"CREATE FULLTEXT INDEX ix_events_search ON events ({FTS_COLUMNS})",
+    ],
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE events_fts USING fts5({FTS_COLUMNS}, "
+        "content='events', content_rowid='id')",
+        "CREATE TRIGGER events_fts_insert AFTER INSERT ON events BEGIN "
+        f"INSERT INTO events_fts (rowid, {FTS_COLUMNS}) "
+        "VALUES (new.id, new.name, new.description, new.location); END",
+        "CREATE TRIGGER events_fts_delete AFTER DELETE ON events BEGIN "
+        f"INSERT INTO events_fts (events_fts, rowid, {FTS_COLUMNS}) "
+        "VALUES ('delete', old.id, old.name, old.description, old.location); END",
+        f"CREATE TRIGGER events_fts_update AFTER UPDATE OF {FTS_COLUMNS} "
+        "ON events BEGIN "
+        f"INSERT INTO events_fts (events_fts, rowid, {FTS_COLUMNS}) "
+        "VALUES ('delete', old.id, old.name, old.description, old.location); "
+        f"INSERT INTO events_fts (rowid, {FTS_COLUMNS}) "
+        "VALUES (new.id, new.name, new.description, new.location); END",
+        "INSERT INTO events_fts (events_fts) VALUES ('rebuild')",
+    ],
+}
+
+DOWNGRADE = {
+    "mysql": ["DROP INDEX ix_events_search ON events"],
+    "sqlite": [
+        "DROP TRIGGER events_fts_update",
+        "DROP TRIGGER events_fts_delete",
+        "DROP TRIGGER events_fts_insert",
+        "DROP TABLE events_fts",
+    ],
+}
+
+
+def upgrade() -> None:
+    op.create_index("ix_events_start_time", "events", ["start_time"], unique=False)
+    for statement in UPGRADE.get(op.get_context().dialect.name, []):
+        op.execute(sa.text(statement))
+
+
+def downgrade() -> None:
+    for statement in DOWNGRADE.get(op.get_context().dialect.name, []):
+        op.execute(sa.text(statement))
+    op.drop_index("ix_events_start_time", table_name="events")
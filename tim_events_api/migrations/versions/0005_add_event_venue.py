@@ -0,0 +1,60 @@
+"""add event venue
+
+Events can be booked into a venue. The index on (venue_id, start_time,
+end_time) backs the checks keeping the bookings of a venue from
+overlapping. Existing events keep their free text location and no venue.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    sqlite = op.get_context().dialect.name == "sqlite"
+    if sqlite:
+        # In place: a batch would copy the events table and lose the triggers
+        # of the search index
+        op.execute(
+            sa.text(
+                "ALTER TABLE events ADD COLUMN venue_id INTEGER REFERENCES venues (id)"
+            )
+        )
+    else:
+        op.add_column("events", sa.Column("venue_id", sa.Integer(), nullable=True))
+    op.create_index(
+        "ix_events_venue_id_start_time_end_time",
+        "events",
+        ["venue_id", "start_time", "end_time"],
+        unique=False,
+    )
+    if not sqlite:
+        # After the index, which MySQL uses for the foreign key instead of
+        # creating one of its own
+        op.create_foreign_key(
+            "fk_events_venue_id_venues", "events", "venues", ["venue_id"], ["id"]
+        )
+
+
+def downgrade() -> None:
+    sqlite = op.get_context().dialect.name == "sqlite"
+    if not sqlite:
+        # MySQL keeps the index while the foreign key needs it
+        op.drop_constraint("fk_events_venue_id_venues", "events", type_="foreignkey")
+    op.drop_index("ix_events_venue_id_start_time_end_time", table_name="events")
+    if sqlite:
+        op.execute(sa.text("ALTER TABLE events DROP COLUMN venue_id"))
+    else:
+        op.drop_column("events", "venue_id")
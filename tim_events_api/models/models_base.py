@@ -3,7 +3,13 @@ from ..database import Base
 from datetime import datetime, timezone
 
 
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
 class BaseModel:
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, onupdate=datetime.now(timezone.utc))
+    # Indexed for the created_at ordering of the paginated list endpoints
+    created_at = Column(DateTime, default=utc_now, index=True)
+    # Set on every write, indexed for the incremental (since=) exports
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now, index=True)
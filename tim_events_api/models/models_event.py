@@ -1,4 +1,14 @@
-from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey
+from sqlalchemy import (
+    DDL,
+    Column,
+    String,
+    Text,
+    Integer,
+    DateTime,
+    ForeignKey,
+    Index,
+    event,
+)
 from sqlalchemy.orm import relationship
 from ..database import Base
 from .models_base import BaseModel
@@ -7,6 +17,20 @@ from .models_base import BaseModel
 class Event(BaseModel, Base):
 
     __tablename__ = "events"
+    __table_args__ = (
+        # Back the per-organizer listing in each of its orders
+        Index("ix_events_organizer_id_start_time", "organizer_id", "start_time"),
+        Index("ix_events_organizer_id_created_at", "organizer_id", "created_at"),
+        # Backs the time range filters of the search
+        Index("ix_events_start_time", "start_time"),
+        # Backs the booking conflict checks, see crud/bookings.py
+        Index(
+            "ix_events_venue_id_start_time_end_time",
+            "venue_id",
+            "start_time",
+            "end_time",
+        ),
+    )
 
     name = Column(String(255))
     description = Column(Text)
@@ -14,6 +38,48 @@ class Event(BaseModel, Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     organizer_id = Column(Integer, ForeignKey("users.id"))
+    venue_id = Column(Integer, ForeignKey("venues.id"), nullable=True)
 
     user = relationship("User", back_populates="events")
     speakers = relationship("Speaker", back_populates="event")
+    venue = relationship("Venue", back_populates="events")
+
+
+# The full-text index of the event search, see crud/search.py. It is not part
+# of the metadata: MySQL gets a FULLTEXT index, SQLite an FTS5 table indexing
+# the events table, kept in sync by triggers.
+SEARCH_INDEX_DDL = {
+    "mysql": [
+        "CREATE FULLTEXT INDEX ix_events_search ON events (name, description, location)"
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE events_fts USING fts5("
+        "name, description, location, content='events', content_rowid='id')",
+        "CREATE TRIGGER events_fts_insert AFTER INSERT ON events BEGIN "
+        "INSERT INTO events_fts (rowid, name, description, location) "
+        "VALUES (new.id, new.name, new.description, new.location); END",
+        "CREATE TRIGGER events_fts_delete AFTER DELETE ON events BEGIN "
+        "INSERT INTO events_fts (events_fts, rowid, name, description, location) "
+        "VALUES ('delete', old.id, old.name, old.description, old.location); END",
+        "CREATE TRIGGER events_fts_update AFTER UPDATE OF name, description, "
+        "location ON events BEGIN "
+        "INSERT INTO events_fts (events_fts, rowid, name, description, location) "
+        "VALUES ('delete', old.id, old.name, old.description, old.location); "
+        "INSERT INTO events_fts (rowid, name, description, location) "
+        "VALUES (new.id, new.name, new.description, new.location); END",
+    ],
+}
+
+for dialect, statements in SEARCH_INDEX_DDL.items():
+    for statement in statements:
+        event.listen(
+            Event.__table__,
+            "after_create",
+            DDL(statement).execute_if(dialect=dialect),
+        )
+# The triggers are dropped with the table, the FTS5 table is not
+event.listen(
+    Event.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS events_fts").execute_if(dialect="sqlite"),
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from ..database import Base
 from .models_base import BaseModel
@@ -6,6 +6,7 @@ from .models_base import BaseModel
 
 class Speaker(BaseModel, Base):
     __tablename__ = "speakers"
+    __table_args__ = (Index("ix_speakers_event_id_id", "event_id", "id"),)
 
     first_name = Column(String(60))
     last_name = Column(String(60))
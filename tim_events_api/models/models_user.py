@@ -8,9 +8,9 @@ class User(BaseModel, Base):
     __tablename__ = "users"
 
     first_name = Column(String(60))
-    username = Column(String(70))
+    username = Column(String(70), unique=True, index=True)
     last_name = Column(String(60))
-    email = Column(String(60))
+    email = Column(String(60), unique=True, index=True)
     hashed_password = Column(String(60))
     is_active = Column(Boolean, default=True)
     is_organizer = Column(Boolean, default=True)
@@ -12,3 +12,5 @@ class Venue(BaseModel, Base):
     location = Column(String(255))
     capacity = Column(Integer)
     description = Column(Text)
+
+    events = relationship("Event", back_populates="venue")
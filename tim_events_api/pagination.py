@@ -0,0 +1,154 @@
+"""This module implements keyset (cursor) pagination for the list endpoints.
+Pages are ordered by (sort_key, id), and the opaque cursor holds the sort key
+value and id of the last row of a page. The next page starts right after
+that row through an index range scan, instead of skipping rows with OFFSET.
+
+The functions are:
+- encode_cursor: Encode the position of a row into a cursor.
+- decode_cursor: Decode a cursor back into the position of a row.
+- paginate: Get one page of a query.
+- page_items: Set the next cursor header of a response and get the page's items.
+"""
+
+from typing import NamedTuple
+from datetime import datetime
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+import base64
+import binascii
+import json
+
+# Documents the X-Next-Cursor header in the OpenAPI schema of the list endpoints
+NEXT_CURSOR_RESPONSE = {
+    200: {
+        "headers": {
+            "X-Next-Cursor": {
+                "description": "Pass it as `after` to get the next page. "
+                "Absent on the last page.",
+                "schema": {"type": "string"},
+            }
+        }
+    }
+}
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: str | None
+
+
+def encode_cursor(order_by: str, sort_value, row_id: int):
+    """Encode the position of a row into a cursor.
+    Args:
+    order_by (str): The name of the sort column.
+    sort_value: The value of the sort column for the row.
+    row_id (int): The id of the row.
+
+    Returns:
+    str: The opaque cursor.
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([order_by, sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, order_by: str, sort_column):
+    """Decode a cursor back into the position of a row.
+    Args:
+    cursor (str): The opaque cursor.
+    order_by (str): The name of the sort column the page is requested with.
+    sort_column (Column): The sort column.
+
+    Returns:
+    tuple: The value of the sort column and the id of the row.
+
+    Raises:
+    HTTPException: 400 when the cursor is malformed or was made for another order.
+    """
+    invalid_cursor = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor"
+    )
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_order_by, sort_value, row_id = json.loads(
+            base64.urlsafe_b64decode(padded)
+        )
+        if cursor_order_by != order_by or not isinstance(row_id, int):
+            raise invalid_cursor
+        if sort_value is not None and sort_column.type.python_type is datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+    except (binascii.Error, ValueError, TypeError):
+        raise invalid_cursor
+    return sort_value, row_id
+
+
+def paginate(
+    query,
+    model,
+    order_by: str = "id",
+    after: str | None = None,
+    skip: int = 0,
+    limit: int = 100,
+):
+    """Get one page of a query.
+    Args:
+    query (Query): The filtered query.
+    model: The model class the query selects.
+    order_by (str): The column to order by, the id breaks ties.
+    after (str): The cursor of the previous page, see Page.next_cursor.
+    skip (int): The number of rows to skip, only used without a cursor.
+    limit (int): The number of rows to return.
+
+    Returns:
+    Page: The rows of the page and the cursor of the next page.
+    """
+    sort_column = getattr(model, order_by)
+    if after:
+        sort_value, last_id = decode_cursor(after, order_by, sort_column)
+        if sort_column is model.id:
+            query = query.filter(model.id > last_id)
+        elif sort_value is None:
+            # NULLs sort first, so the rest of the NULLs and then every value
+            query = query.filter(
+                or_(
+                    sort_column.is_not(None),
+                    and_(sort_column.is_(None), model.id > last_id),
+                )
+            )
+        else:
+            query = query.filter(
+                or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, model.id > last_id),
+                )
+            )
+    elif skip:
+        query = query.offset(skip)
+
+    if sort_column is model.id:
+        query = query.order_by(model.id)
+    else:
+        query = query.order_by(sort_column, model.id)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = encode_cursor(order_by, getattr(last_row, order_by), last_row.id)
+    return Page(rows, next_cursor)
+
+
+def page_items(response: Response, page: Page):
+    """Set the next cursor header of a response and get the page's items.
+    Args:
+    response (Response): The response of the path operation.
+    page (Page): The page to return.
+
+    Returns:
+    list: The items of the page.
+    """
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
@@ -0,0 +1,121 @@
+"""This module runs password hashing on a dedicated, size-limited process pool.
+bcrypt is CPU bound, hashing inline would hold a request worker (and the GIL)
+for the whole 100-300 ms of every signup and login.
+
+The functions are:
+- bcrypt_hash: Hash a password, runs in a pool worker.
+- bcrypt_verify: Verify a password and rehash it when needed, runs in a pool worker.
+- run_password_task: Run one of the above on the pool.
+- pending: Get the number of tasks running or waiting for a worker.
+- shutdown: Stop the pool workers.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from .metrics import Histogram
+from . import profiling
+from time import perf_counter
+import asyncio
+import multiprocessing
+import os
+
+# Changing BCRYPT_ROUNDS rehashes each password on the user's next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Tasks allowed to wait for a worker before requests are rejected with 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+_executor = None
+# Only touched from the event loop thread, so it needs no lock
+_pending = 0
+# Tasks refused with 503 because the pool and its queue were full
+rejected = 0
+# Time from submitting a task to its result, queueing included, by task
+task_seconds = {"bcrypt_hash": Histogram(), "bcrypt_verify": Histogram()}
+
+
+def bcrypt_hash(password: str):
+    """Hash a password.
+    Args:
+    password (str): The password to hash.
+
+    Returns:
+    str: The hashed password.
+    """
+    return pwd_context.hash(password)
+
+
+def bcrypt_verify(plain_password: str, hashed_password: str):
+    """Verify a password, and rehash it if it was hashed with other settings.
+    Args:
+    plain_password (str): The plain password.
+    hashed_password (str): The hashed password.
+
+    Returns:
+    tuple: Whether the password is valid, and its new hash or None.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def get_executor():
+    """Get the password hashing pool, starting it on first use.
+    Returns:
+    ProcessPoolExecutor: The password hashing pool.
+    """
+    global _executor
+    if _executor is None:
+        # spawn, so the workers don't inherit the parent's database connections
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def run_password_task(task, *args):
+    """Run a password task on the pool.
+    Args:
+    task: bcrypt_hash or bcrypt_verify.
+    args: The arguments of the task.
+
+    Returns:
+    The result of the task.
+
+    Raises:
+    HTTPException: 503 when the pool and its queue are full.
+    """
+    global _pending, rejected
+    if _pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE:
+        rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, retry later",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    started = perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        with profiling.timed("hash"):
+            return await loop.run_in_executor(get_executor(), task, *args)
+    finally:
+        _pending -= 1
+        task_seconds[task.__name__].observe(perf_counter() - started)
+
+
+def pending():
+    """Get the number of password tasks running or waiting for a worker."""
+    return _pending
+
+
+def shutdown():
+    """Stop the pool workers."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,336 @@
+"""This module profiles the requests, when the PROFILING setting is on.
+
+Every request gets a RequestProfile, reached by the code it runs through a
+context variable, adding up the time spent in:
+- sql: the statements sent to the database, also counted, timed with the
+  before/after_cursor_execute events of the engines.
+- pool: waiting for a database connection, see database.instrument_pool_class.
+- db, auth: the get_db and get_current_user dependencies.
+- hash: hashing and verifying passwords, see passwords.run_password_task.
+- endpoint: the path operation function.
+- serialize: turning its result into the response (validation and encoding).
+They are sent in a Server-Timing header, shown by the developer tools of the
+browsers, with the total time until the response started. The phases overlap
+(the sql of auth is also in auth), they do not add up to the total. Streamed
+responses are only timed until their headers are sent.
+
+A sample of the requests (PROFILE_SAMPLE_RATE), and the ones sending the
+PROFILE_TOKEN in an X-Profile header, are also run under cProfile, one at a
+time, and their stats dumped to PROFILE_DIR for pstats or snakeviz. The stats
+cover the event loop thread, with whatever other requests ran on it
+meanwhile, and the crud functions run on the threadpool by run_crud.
+
+The classes are:
+- RequestProfile: The timings of a request.
+- ProfilingMiddleware: Profile every request.
+
+The functions are:
+- record: Add time to a phase of the current request.
+- timed: Time a block as a phase of the current request.
+- profile_thread: Profile a function of the current request run on a thread.
+- install: Profile the requests of the app.
+"""
+
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import request_response
+from time import perf_counter
+import asyncio
+import cProfile
+import inspect
+import os
+import pstats
+import random
+import re
+import tempfile
+import time
+
+PROFILING = os.getenv("PROFILING", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Unset, the X-Profile header is ignored
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "tim-events-profiles")
+)
+
+current_profile = ContextVar("current_profile", default=None)
+
+# cProfile can only run one profiler per thread, sampled requests take turns
+_sampling = False
+
+
+class RequestProfile:
+    """The timings of a request, by phase.
+    Args:
+    profiler (Profile): The cProfile profiler of a sampled request.
+    """
+
+    def __init__(self, profiler: cProfile.Profile | None = None):
+        self.started = perf_counter()
+        # name: [count, seconds]
+        self.phases = {}
+        # When the endpoint returned, where the serialization starts
+        self.returned = None
+        self.profilers = [profiler] if profiler is not None else []
+
+    def add(self, name: str, seconds: float):
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [1, seconds]
+        else:
+            phase[0] += 1
+            phase[1] += seconds
+
+    def server_timing(self):
+        """Format the timings as the value of a Server-Timing header."""
+        metrics = []
+        for name, (count, seconds) in self.phases.items():
+            metric = f"{name};dur={seconds * 1000:.2f}"
+            if name == "sql":
+                metric += f';desc="{count} statement{"s" if count > 1 else ""}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={(perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def dump(self, scope: dict):
+        """Dump the cProfile stats of a sampled request to PROFILE_DIR.
+        Returns:
+        str: The path of the dump.
+        """
+        stats = pstats.Stats(self.profilers[0])
+        for profiler in self.profilers[1:]:
+            stats.add(profiler)
+        route = re.sub(r"[^\w.-]+", "_", scope["path"].strip("/")) or "root"
+        elapsed = (perf_counter() - self.started) * 1000
+        name = (
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{route}"
+            f"-{elapsed:.0f}ms-{os.getpid()}-{id(self):x}.prof"
+        )
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, name)
+        stats.dump_stats(path)
+        return path
+
+
+def record(name: str, seconds: float):
+    """Add time to a phase of the current request, if it is profiled.
+    Args:
+    name (str): The phase.
+    seconds (float): The time spent.
+    """
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add(name, seconds)
+
+
+@contextmanager
+def timed(name: str):
+    """Time a block as a phase of the current request."""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        record(name, perf_counter() - started)
+
+
+def profile_thread(function):
+    """Profile a function of the current request run on another thread, when
+    the request is sampled: cProfile only sees the thread it runs on.
+    Args:
+    function: The function, called on the thread.
+
+    Returns:
+    The function, wrapped when the current request is sampled.
+    """
+    profile = current_profile.get()
+    if profile is None or not profile.profilers:
+        return function
+
+    @wraps(function)
+    def profiled(*args, **kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profile.profilers.append(profiler)
+
+    return profiled
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.profile_started = perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "profile_started", None)
+    if started is not None:
+        record("sql", perf_counter() - started)
+
+
+def timed_dependency(name: str, dependency):
+    """Wrap a dependency to time it as a phase, keeping its kind (coroutine,
+    generator...) and signature. Generators are timed until they yield."""
+    if inspect.isasyncgenfunction(dependency):
+        manager = asynccontextmanager(dependency)
+
+        @wraps(dependency)
+        async def wrapper(*args, **kwargs):
+            started = perf_counter()
+            async with manager(*args, **kwargs) as value:
+                record(name, perf_counter() - started)
+                yield value
+
+    elif inspect.isgeneratorfunction(dependency):
+        manager = contextmanager(dependency)
+
+        @wraps(dependency)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            with manager(*args, **kwargs) as value:
+                record(name, perf_counter() - started)
+                yield value
+
+    elif asyncio.iscoroutinefunction(dependency):
+
+        @wraps(dependency)
+        async def wrapper(*args, **kwargs):
+            with timed(name):
+                return await dependency(*args, **kwargs)
+
+    else:
+
+        @wraps(dependency)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return dependency(*args, **kwargs)
+
+    return wrapper
+
+
+def endpoint_returned(started: float):
+    """Record the time of the endpoint and when its serialization started."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.returned = perf_counter()
+        profile.add("endpoint", profile.returned - started)
+
+
+def replace_dependencies(dependant, replacements: dict):
+    """Swap the calls of a dependency tree for their replacements, in place.
+    Their cache key is left alone, so a dependency still runs once a request.
+    """
+    for sub_dependant in dependant.dependencies:
+        sub_dependant.call = replacements.get(sub_dependant.call, sub_dependant.call)
+        replace_dependencies(sub_dependant, replacements)
+
+
+def profile_route(route: APIRoute, dependencies: dict):
+    """Time the dependencies, endpoint and serialization of a route."""
+    replace_dependencies(route.dependant, dependencies)
+    endpoint = route.dependant.call
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                endpoint_returned(started)
+
+    else:
+
+        @wraps(endpoint)
+        def timed_endpoint(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                endpoint_returned(started)
+
+    route.dependant.call = timed_endpoint
+    handler = route.get_route_handler()
+
+    async def timed_handler(request):
+        response = await handler(request)
+        profile = current_profile.get()
+        if profile is not None and profile.returned is not None:
+            profile.add("serialize", perf_counter() - profile.returned)
+        return response
+
+    route.app = request_response(timed_handler)
+
+
+class ProfilingMiddleware:
+    """Profile every request, sending its timings in a Server-Timing header.
+    Args:
+    app (ASGIApp): The wrapped application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def sampled(self, scope: dict):
+        if PROFILE_TOKEN is not None:
+            if Headers(scope=scope).get("x-profile") == PROFILE_TOKEN:
+                return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        global _sampling
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profiler = None
+        if not _sampling and self.sampled(scope):
+            _sampling = True
+            profiler = cProfile.Profile()
+        profile = RequestProfile(profiler)
+        token = current_profile.set(profile)
+
+        async def send_timings(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing())
+            await send(message)
+
+        if profiler is not None:
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_timings)
+        finally:
+            current_profile.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _sampling = False
+                profile.dump(scope)
+
+
+def install(app):
+    """Profile the requests of the app, once all its routes are added.
+    Args:
+    app (FastAPI): The application.
+    """
+    from .crud.users import get_current_user
+    from .database import sync_engines
+    from .dependencies import get_db
+
+    for db_engine in sync_engines():
+        event.listen(db_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(db_engine, "after_cursor_execute", after_cursor_execute)
+
+    dependencies = {
+        get_current_user: timed_dependency("auth", get_current_user),
+        get_db: timed_dependency("db", get_db),
+    }
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            profile_route(route, dependencies)
+    app.add_middleware(ProfilingMiddleware)
@@ -0,0 +1,294 @@
+"""This module routes the read-only requests to the read replicas, when
+DATABASE_REPLICA_URLS is set.
+
+The GET and HEAD requests get a session on a replica, every other request (and
+everything outside of a request) one on the primary. The crud getters run by
+the read-only routes are thus read from a replica, while the reads made by a
+write (eg. the checks before it) stay in the primary's transaction. The replica
+is the one serving the fewest requests, ties are broken round-robin.
+
+A client that wrote is pinned to the primary for REPLICA_READ_YOUR_WRITES
+seconds, so that it reads its writes however late the replicas are. Clients
+are told apart by their Authorization header, or by their address when they
+send none (eg. signups and logins). The pins are kept in-process, like the
+response cache: with several workers a client may read from a replica through
+another worker than the one it wrote through.
+
+Every REPLICA_CHECK_INTERVAL seconds each replica is checked by a background
+task: it is taken out of rotation when it cannot be reached or lags behind the
+primary by more than REPLICA_MAX_LAG seconds, and back in once it catches up.
+A request failing to reach a replica takes it out of rotation right away.
+Without a healthy replica the reads go to the primary.
+
+The classes are:
+- Replica: A read replica and its health.
+
+The functions are:
+- choose: Pick the replica a request reads from.
+- pin: Pin a client to the primary.
+- routed: Route a request to a replica or the primary.
+- replication_lag: Measure how late a replica is.
+- check_replicas: Check the health of every replica.
+- start_health_checks: Check the replicas in the background.
+- stop_health_checks: Stop the background checks.
+- status: Get the health of every replica.
+"""
+
+from contextlib import contextmanager
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError, OperationalError
+from starlette.concurrency import run_in_threadpool
+from threading import Lock
+from .cache import TTLCache
+from .database import replica_engines
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+REPLICA_READ_YOUR_WRITES = float(os.getenv("REPLICA_READ_YOUR_WRITES", "5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+READ_METHODS = ("GET", "HEAD")
+# An evicted pin only sends the client's reads back to the replicas early
+PINNED_CLIENTS_SIZE = 100000
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """A read replica and its health.
+    Replicas start out of rotation, until their first health check passes.
+    Args:
+    name (str): The name of the replica, in the metrics and /health/db.
+    engine (Engine): Its engine.
+    async_engine (AsyncEngine): Its asyncio engine, with USE_ASYNC_DB.
+    """
+
+    def __init__(self, name: str, engine, async_engine=None):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+        # The requests reading from the replica
+        self.in_flight = 0
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def mark_down(self, error: Exception):
+        """Take the replica out of rotation until its next passing check."""
+        if self.healthy:
+            logger.warning("replica %s is out of rotation: %s", self.name, error)
+        self.healthy = False
+        self.error = str(error)
+
+
+replicas = [Replica(*engines) for engines in replica_engines]
+_pinned = TTLCache(maxsize=PINNED_CLIENTS_SIZE, ttl=REPLICA_READ_YOUR_WRITES)
+_turns = itertools.count()
+_health_checks = None
+
+
+def client_key(request: Request):
+    """The key of the client of a request: its token, or else its address."""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return authorization
+    return request.client.host if request.client is not None else None
+
+
+def pin(request: Request):
+    """Pin the client of a request to the primary, for the read-your-writes
+    window."""
+    key = client_key(request)
+    if key is not None:
+        _pinned.set(key, True)
+
+
+def pinned(request: Request):
+    """Tell whether the client of a request wrote in the read-your-writes
+    window. The reads of a client logged in since are covered by its address."""
+    keys = {client_key(request)}
+    if request.client is not None:
+        keys.add(request.client.host)
+    return any(_pinned.get(key) for key in keys if key is not None)
+
+
+def choose(request: Request):
+    """Pick the replica a request reads from.
+    Args:
+    request (Request): The request.
+
+    Returns:
+    Replica: The healthy replica serving the fewest requests, or None when the
+    request goes to the primary.
+    """
+    if request.method not in READ_METHODS or not replicas or pinned(request):
+        return None
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return None
+    start = next(_turns) % len(healthy)
+    return min(healthy[start:] + healthy[:start], key=lambda r: r.in_flight)
+
+
+@contextmanager
+def routed(request: Request):
+    """Route a request to a replica or the primary, for the session of the
+    request. The writes pin their client to the primary, when they start (so
+    that it is pinned before it gets the response) and again when they end.
+    Args:
+    request (Request): The request.
+
+    Yields:
+    Replica: The replica to read from, or None for the primary.
+    """
+    if request.method not in READ_METHODS:
+        if replicas:
+            pin(request)
+        try:
+            yield None
+        finally:
+            if replicas:
+                pin(request)
+        return
+    replica = choose(request)
+    if replica is None:
+        yield None
+        return
+    # Tells the response cache that the content may be late
+    request.state.replica = replica
+    replica.acquire()
+    try:
+        yield replica
+    except DBAPIError as error:
+        if error.connection_invalidated or isinstance(error, OperationalError):
+            replica.mark_down(error)
+        raise
+    finally:
+        replica.release()
+
+
+def replication_lag(connection):
+    """Measure how late a replica is behind its primary.
+    Args:
+    connection (Connection): A connection to the replica.
+
+    Returns:
+    float: The lag in seconds, 0 for a server that replicates nothing and None
+    when its replication is stopped.
+    """
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        # SHOW REPLICA STATUS is MySQL 8.0.22+, older servers know the other
+        for statement, column in (
+            ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+            ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+        ):
+            try:
+                row = connection.exec_driver_sql(statement).mappings().first()
+            except DBAPIError:
+                continue
+            if row is None:
+                return 0.0
+            return None if row[column] is None else float(row[column])
+        return None
+    if dialect == "postgresql":
+        # The replay timestamp does not move while the primary is idle, which
+        # reads as a growing lag, so an up to date replica reports 0
+        return float(
+            connection.exec_driver_sql(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() OR "
+                "pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+                "END"
+            ).scalar()
+            or 0
+        )
+    connection.exec_driver_sql("SELECT 1")
+    return 0.0
+
+
+def check_replica(replica: Replica):
+    """Check that a replica answers and is up to date, updating its health."""
+    try:
+        with replica.engine.connect() as connection:
+            lag = replication_lag(connection)
+    except Exception as error:
+        replica.lag = None
+        replica.mark_down(error)
+    else:
+        replica.lag = lag
+        if lag is None:
+            replica.mark_down(RuntimeError("replication is stopped"))
+        elif lag > REPLICA_MAX_LAG:
+            replica.mark_down(RuntimeError(f"{lag:.1f}s behind the primary"))
+        else:
+            if not replica.healthy:
+                logger.info("replica %s is back in rotation", replica.name)
+            replica.healthy = True
+            replica.error = None
+    replica.checked_at = time.time()
+
+
+async def check_replicas():
+    """Check the health of every replica, in the threadpool."""
+    await asyncio.gather(
+        *(run_in_threadpool(check_replica, replica) for replica in replicas)
+    )
+
+
+async def run_health_checks():
+    while True:
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+        try:
+            await check_replicas()
+        except Exception:
+            logger.exception("the replica health checks failed")
+
+
+async def start_health_checks():
+    """Check the replicas, then again every REPLICA_CHECK_INTERVAL seconds in
+    the background. Run on startup, so the replicas serve once checked."""
+    global _health_checks
+    if replicas:
+        await check_replicas()
+        _health_checks = asyncio.create_task(run_health_checks())
+
+
+async def stop_health_checks():
+    """Stop the background health checks, on shutdown."""
+    global _health_checks
+    if _health_checks is not None:
+        _health_checks.cancel()
+        _health_checks = None
+
+
+def status():
+    """Get the health of every replica.
+    Returns:
+    dict: Whether each replica is in rotation, its lag in seconds, the error
+    taking it out, when it was last checked and the requests it serves.
+    """
+    return {
+        replica.name: {
+            "healthy": replica.healthy,
+            "lag_seconds": replica.lag,
+            "error": replica.error,
+            "checked_at": replica.checked_at,
+            "in_flight": replica.in_flight,
+        }
+        for replica in replicas
+    }
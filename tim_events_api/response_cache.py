@@ -0,0 +1,293 @@
+"""This module caches the rendered responses of the hot read endpoints.
+Entries are keyed by the request's path and query string, the user for the
+per-user routes, the database the request reads from (the primary or a
+replica) and the current version of the entry's tags (eg. venue:1).
+Writes invalidate a tag by bumping its version, which makes every entry built
+from the previous version unreachable, so an entry loaded while a write was
+in flight can never be served after the write. A replica may not have the
+write yet when the version is bumped, so its entries are kept apart: a client
+pinned to the primary after writing never gets an entry read from a replica.
+
+Responses carry a strong ETag, the hash of the body. A request whose
+If-None-Match matches a cached entry is answered with 304 straight from the
+cache, without touching the database. The misses for the same key are
+coalesced: concurrent requests share one load and rendering (see coalescing).
+
+The backend is in-process (an LRU) unless RESPONSE_CACHE_URL points at a
+redis server, which is needed for the invalidations to reach every worker
+process when the app runs with more than one.
+
+The classes are:
+- MemoryBackend: Entries and tag versions kept in-process.
+- RedisBackend: Entries and tag versions shared through redis.
+
+The functions are:
+- venue_tag, event_tag: Get the tag of a single row.
+- invalidate: Invalidate the entries built from some tags.
+- cached_response: Serve a read endpoint through the cache.
+"""
+
+from typing import NamedTuple
+from fastapi import Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from threading import Lock
+from .cache import TTLCache
+from .coalescing import SingleFlight
+from .serialization import dumps
+from . import replicas
+import hashlib
+import itertools
+import json
+import os
+import time
+
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+
+# Invalidated by every venue write, the venue list depends on all of them
+VENUES_TAG = "venues"
+
+# Documents the conditional GET in the OpenAPI schema of the cached endpoints
+NOT_MODIFIED_RESPONSE = {
+    304: {"description": "Not Modified, the ETag in `If-None-Match` is current."}
+}
+
+
+class CachedEntry(NamedTuple):
+    etag: str
+    body: bytes
+    headers: dict
+
+
+class MemoryBackend:
+    """Entries and tag versions kept in-process.
+
+    Entries are evicted least recently used first. A version is never handed
+    out twice: a bump takes the next value of a counter shared by every tag,
+    and the tags without a version get the floor, itself a fresh value of the
+    counter after every pruning. So a tag's version never goes back to one
+    an entry may still be keyed with.
+
+    Every RESPONSE_CACHE_TTL seconds the versions bumped more than
+    RESPONSE_CACHE_TTL seconds ago are pruned, the entries keyed with them
+    have expired. Only the tags written recently are kept, and a pruned tag
+    costs a miss at most.
+    """
+
+    blocking = False
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.entries = TTLCache(maxsize=maxsize, ttl=RESPONSE_CACHE_TTL)
+        # tag: (version, when it was bumped)
+        self._versions = {}
+        self._counter = itertools.count(1)
+        self._floor = 0
+        self._pruned_at = time.monotonic()
+        self._lock = Lock()
+
+    @property
+    def hits(self):
+        return self.entries.hits
+
+    @property
+    def misses(self):
+        return self.entries.misses
+
+    def get_versions(self, tags: list):
+        versions, floor = self._versions, self._floor
+        return [versions[tag][0] if tag in versions else floor for tag in tags]
+
+    def bump_versions(self, tags: list):
+        now = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = (next(self._counter), now)
+            if now - self._pruned_at >= RESPONSE_CACHE_TTL:
+                self.prune(now - RESPONSE_CACHE_TTL)
+                self._pruned_at = now
+
+    def prune(self, bumped_before: float):
+        """Drop the versions bumped before a time, called with the lock held.
+        The floor is moved first, the pruned tags never get an older version."""
+        self._floor = next(self._counter)
+        self._versions = {
+            tag: version
+            for tag, version in self._versions.items()
+            if version[1] >= bumped_before
+        }
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def set(self, key: str, entry: CachedEntry, ttl: float):
+        self.entries.set(key, entry, ttl)
+
+    def clear(self):
+        self.entries.clear()
+        with self._lock:
+            self._versions = {}
+            self._floor = next(self._counter)
+
+
+class RedisBackend:
+    """Entries and tag versions shared through redis.
+
+    Requires the redis package. Calls are made from the threadpool since the
+    client is blocking.
+    """
+
+    blocking = True
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_URL needs the redis package installed")
+        self.client = redis.Redis.from_url(url)
+        self.hits = 0
+        self.misses = 0
+
+    def get_versions(self, tags: list):
+        versions = self.client.mget([f"response-cache:tag:{tag}" for tag in tags])
+        return [int(version or 0) for version in versions]
+
+    def bump_versions(self, tags: list):
+        pipeline = self.client.pipeline(transaction=False)
+        for tag in tags:
+            pipeline.incr(f"response-cache:tag:{tag}")
+        pipeline.execute()
+
+    def get(self, key: str):
+        value = self.client.get(f"response-cache:entry:{key}")
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, headers, body = json.loads(value)
+        return CachedEntry(etag, body.encode(), headers)
+
+    def set(self, key: str, entry: CachedEntry, ttl: float):
+        if ttl <= 0:
+            return
+        value = json.dumps([entry.etag, entry.headers, entry.body.decode()])
+        self.client.set(f"response-cache:entry:{key}", value, px=int(ttl * 1000))
+
+    def clear(self):
+        keys = list(self.client.scan_iter("response-cache:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+backend = RedisBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else MemoryBackend()
+# The loads of the missed entries, by cache key
+flights = SingleFlight()
+
+
+def venue_tag(venue_id: int):
+    return f"venue:{venue_id}"
+
+
+def event_tag(event_id: int | None):
+    # Speakers may have no event
+    return None if event_id is None else f"event:{event_id}"
+
+
+def invalidate(*tags: str):
+    """Invalidate the entries built from some tags.
+    Called by the crud functions once their writes are committed.
+    Args:
+    tags (str): The tags of the written rows, None values are ignored.
+    """
+    tags = sorted({tag for tag in tags if tag is not None})
+    if tags:
+        backend.bump_versions(tags)
+
+
+def cache_key(request: Request, tags: list, versions: list, user_id: int | None):
+    routing = (
+        "primary" if getattr(request.state, "replica", None) is None else "replica"
+    )
+    tag_versions = ",".join(f"{tag}={version}" for tag, version in zip(tags, versions))
+    query = "&".join(
+        f"{name}={value}" for name, value in sorted(request.query_params.multi_items())
+    )
+    return f"{request.url.path}?{query}|user={user_id}|db={routing}|{tag_versions}"
+
+
+def etag_matches(if_none_match: str | None, etag: str):
+    """Check an If-None-Match header against an ETag, with the weak comparison."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def render(content, response: Response):
+    """Render the content of a path operation to a cache entry."""
+    body = dumps(content)
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+    return CachedEntry(etag, body, headers)
+
+
+async def call_backend(method, *args):
+    if backend.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+async def cached_response(
+    request: Request, load, tags: list, user_id: int | None = None
+):
+    """Serve a read endpoint through the cache.
+    Args:
+    request (Request): The request.
+    load: A coroutine function building the content on a miss. It receives a
+    Response to set headers on, like a path operation's Response parameter,
+    and may raise HTTPException (errors are not cached, but are shared with
+    the requests coalesced with it).
+    tags (list): The tags of the rows the content is built from.
+    user_id (int): The user to key the entry by, for the per-user routes.
+
+    Returns:
+    Response: The JSON response, or 304 when the client's ETag is current.
+    """
+    versions = await call_backend(backend.get_versions, tags)
+    key = cache_key(request, tags, versions, user_id)
+    entry = await call_backend(backend.get, key)
+    if entry is None:
+
+        async def fill():
+            response = Response()
+            entry = render(await load(response), response)
+            ttl = RESPONSE_CACHE_TTL
+            if getattr(request.state, "replica", None) is not None:
+                # Read from a replica, which may not have the latest writes yet
+                ttl = min(ttl, replicas.REPLICA_MAX_LAG)
+            await call_backend(backend.set, key, entry, ttl)
+            return entry
+
+        # The key holds the tag versions and the routing, a load never serves
+        # a later write, nor a replica's content to a request on the primary
+        entry = await flights.run(key, fill)
+
+    headers = {
+        "ETag": entry.etag,
+        # Authenticated content, clients may keep it but must revalidate it
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        entry.body,
+        media_type="application/json",
+        headers={**entry.headers, **headers},
+    )
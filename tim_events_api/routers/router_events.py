@@ -1,72 +1,251 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from pydantic import conlist
+from typing import Literal
 from ..crud.events import *
-from ..schemas import schema_events, schema_users
-from ..dependencies import get_db
+from ..schemas import schema_bulk, schema_events, schema_users
+from ..dependencies import get_db, run_crud
+from ..fieldsets import sparse_schema
+from ..pagination import NEXT_CURSOR_RESPONSE
+from ..serialization import page_response
+from ..crud.bookings import BOOKING_RESPONSES, BookingError
+from ..crud.bulk import BULK_MAX_ITEMS
 from ..crud.users import get_current_user
+from .. import response_cache
 
 router = APIRouter(
     dependencies=[Depends(get_current_user)], prefix="/users/me", tags=["events"]
 )
 
 
-@router.post("/events", response_model=schema_events.Event)
-def create_event(
+@router.post("/events", response_model=schema_events.Event, responses=BOOKING_RESPONSES)
+async def create_event(
     event: schema_events.EventCreate,
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
 ):
-    events = add_event(db=db, event=event, user_id=current_user.id)
+    try:
+        events = await run_crud(
+            db,
+            add_event,
+            schema=schema_events.Event,
+            event=event,
+            user_id=current_user.id,
+        )
+    except BookingError as error:
+        raise HTTPException(status_code=error.status_code, detail=str(error))
     return events
 
 
-@router.get("/events", response_model=list[schema_events.Event])
-def read_events(
+@router.get(
+    "/events",
+    response_model=list[sparse_schema(schema_events.Event)],
+    responses=NEXT_CURSOR_RESPONSE,
+)
+async def read_events(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(default=100, ge=1, le=1000),
+    order_by: Literal["id", "created_at", "start_time"] = "id",
+    after: str | None = None,
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    selected: FieldSet = Depends(event_fields),
 ):
-    events = get_events(user_id=current_user.id, skip=skip, limit=limit, db=db)
-    return events
+    # Served from column tuples, response_model only documents the schema
+    events = await run_crud(
+        db,
+        get_event_rows,
+        user_id=current_user.id,
+        skip=skip,
+        limit=limit,
+        order_by=order_by,
+        after=after,
+        selected=selected,
+    )
+    return page_response(events)
+
+
+@router.post(
+    "/events/bulk/",
+    response_model=schema_bulk.BulkResult[schema_events.Event],
+    response_model_exclude_none=True,
+)
+async def create_events(
+    events: conlist(
+        schema_events.EventCreate, min_items=1, max_items=BULK_MAX_ITEMS
+    ) = Body(),
+    ids_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    return await run_crud(
+        db,
+        add_events,
+        schema=schema_bulk.BulkResult[schema_events.Event],
+        events=events,
+        user_id=current_user.id,
+        ids_only=ids_only,
+    )
+
+
+@router.put(
+    "/events/bulk/",
+    response_model=schema_bulk.BulkResult[schema_events.Event],
+    response_model_exclude_none=True,
+)
+async def update_events(
+    events: conlist(
+        schema_events.EventBulkUpdate, min_items=1, max_items=BULK_MAX_ITEMS
+    ) = Body(),
+    ids_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    return await run_crud(
+        db,
+        edit_events,
+        schema=schema_bulk.BulkResult[schema_events.Event],
+        events=events,
+        user_id=current_user.id,
+        ids_only=ids_only,
+    )
+
+
+@router.delete(
+    "/events/bulk/",
+    response_model=schema_bulk.BulkResult[schema_events.Event],
+    response_model_exclude_none=True,
+)
+async def delete_events(
+    event_ids: conlist(int, min_items=1, max_items=BULK_MAX_ITEMS) = Body(),
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    return await run_crud(
+        db,
+        remove_events,
+        schema=schema_bulk.BulkResult[schema_events.Event],
+        event_ids=event_ids,
+        user_id=current_user.id,
+    )
+
+
+@router.get(
+    "/events/{event_id}/",
+    response_model=sparse_schema(schema_events.Event),
+    responses=response_cache.NOT_MODIFIED_RESPONSE,
+)
+async def read_event(
+    event_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    selected: FieldSet = Depends(event_fields),
+):
+    # The fields and expand parameters are part of the cache key
+    async def load(response: Response):
+        event = await run_crud(
+            db, get_event_fields, event_id=event_id, selected=selected
+        )
+        if not event:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="event does not exist"
+            )
+        return event
+
+    return await response_cache.cached_response(
+        request,
+        load,
+        tags=[response_cache.event_tag(event_id)],
+        user_id=current_user.id,
+    )
+
+
+async def raise_not_owned(
+    db: Session,
+    event_id: int,
+    current_user: schema_users.UserIdentity,
+    detail: str,
+):
+    """Raise the error of a write scoped to the organizer that matched no event.
+    The organizer is only looked up here, on the error path."""
+    owner = await run_crud(db, get_event_owner, event_id=event_id)
+    if owner is not None and owner.organizer_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="event does not exist"
+    )
 
 
-@router.get("/events/{event_id}/", response_model=schema_events.Event)
-def read_event(event_id: int, db: Session = Depends(get_db)):
-    event = get_event(event_id=event_id, db=db)
-    if not event:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="event does not exist"
+async def update_owned_event(
+    db: Session,
+    event_id: int,
+    event: schema_events.EventUpdate | schema_events.EventPatch,
+    current_user: schema_users.UserIdentity,
+):
+    try:
+        updated_event = await run_crud(
+            db,
+            edit_event,
+            schema=schema_events.Event,
+            event=event,
+            event_id=event_id,
+            user_id=current_user.id,
         )
-    return event
+    except BookingError as error:
+        raise HTTPException(status_code=error.status_code, detail=str(error))
+    if not updated_event:
+        await raise_not_owned(db, event_id, current_user, "You cannot update this user")
+    return updated_event
 
 
-@router.put("/events/{event_id}/", response_model=schema_events.Event)
-def update_event(
+@router.put(
+    "/events/{event_id}/",
+    response_model=schema_events.Event,
+    responses=BOOKING_RESPONSES,
+)
+async def update_event(
     event_id: int,
     event: schema_events.EventUpdate,
-    current_user: schema_users = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
+    return await update_owned_event(db, event_id, event, current_user)
 
-    db_event = get_event(event_id=event_id, db=db)
-    if not db_event:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="event does not exist"
-        )
-    event_ids = []
-    for user_events in current_user.events:
-        event_ids.append(user_events.id)
-
-    if event_id not in event_ids:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You cannot update this user",
-        )
 
-    updated_event = edit_event(event=event, event_id=event_id, db=db)
-    return updated_event
+@router.patch(
+    "/events/{event_id}/",
+    response_model=schema_events.Event,
+    responses=BOOKING_RESPONSES,
+)
+async def patch_event(
+    event_id: int,
+    event: schema_events.EventPatch,
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return await update_owned_event(db, event_id, event, current_user)
 
 
 @router.delete("/events/{event_id}/")
-def delete_event(event_id: int, db: Session = Depends(get_db)):
-    return remove_event(event_id=event_id, db=db)
+async def delete_event(
+    event_id: int,
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    deleted = await run_crud(
+        db, remove_event, event_id=event_id, user_id=current_user.id
+    )
+    if deleted is None:
+        await raise_not_owned(
+            db, event_id, current_user, "You cannot delete this event"
+        )
+    return deleted
@@ -0,0 +1,145 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timezone
+from typing import Literal
+from ..crud.export import *
+from ..crud.users import get_current_user
+from ..database import SessionLocal
+from ..schemas import schema_users
+from ..serialization import dumps
+import csv
+import io
+
+
+async def get_current_admin(
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Cannot export, you are not an admin",
+        )
+    return current_user
+
+
+router = APIRouter(
+    dependencies=[Depends(get_current_admin)], prefix="/export", tags=["export"]
+)
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_RESPONSES = {
+    200: {
+        "content": {media_type: {} for media_type in MEDIA_TYPES.values()},
+        "description": "One row per line. NDJSON rows are JSON objects, CSV "
+        "rows follow a header line.",
+    }
+}
+
+
+def to_utc(since: datetime | None):
+    """The timestamps are stored as naive UTC datetimes."""
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(lines):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(lines)
+    return buffer.getvalue().encode()
+
+
+def export_response(batches, format: str, fields: list, name: str):
+    """Stream batches of rows as NDJSON or CSV.
+    Args:
+    batches: The generator of row batches, closed once the response is sent.
+    format (str): ndjson or csv.
+    fields (list): The CSV columns.
+    name (str): The name of the exported file, without extension.
+
+    Returns:
+    StreamingResponse: The export, one encoded batch per chunk.
+    """
+
+    def body():
+        try:
+            if format == "csv":
+                yield encode_csv([fields])
+            for rows in batches:
+                if format == "csv":
+                    yield encode_csv(
+                        [csv_value(row[field]) for field in fields] for row in rows
+                    )
+                else:
+                    yield b"".join(dumps(row) + b"\n" for row in rows)
+        finally:
+            batches.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+
+def event_batches(since: datetime | None):
+    with SessionLocal() as db, SessionLocal() as speakers_db:
+        yield from stream_events(db, speakers_db, since=since)
+
+
+def speaker_batches(since: datetime | None):
+    with SessionLocal() as db:
+        yield from stream_speakers(db, since=since)
+
+
+def venue_batches(since: datetime | None):
+    with SessionLocal() as db:
+        yield from stream_venues(db, since=since)
+
+
+@router.get("/events", response_class=StreamingResponse, responses=EXPORT_RESPONSES)
+async def export_events(
+    format: Literal["ndjson", "csv"] = "ndjson", since: datetime | None = None
+):
+    """Every event with its speakers, or only the ones updated since a time
+    (or whose speakers were). The CSV has no speakers, see /export/speakers."""
+    return export_response(
+        event_batches(to_utc(since)),
+        format,
+        [column.key for column in EVENT_COLUMNS],
+        "events",
+    )
+
+
+@router.get("/speakers", response_class=StreamingResponse, responses=EXPORT_RESPONSES)
+async def export_speakers(
+    format: Literal["ndjson", "csv"] = "ndjson", since: datetime | None = None
+):
+    """Every speaker, or only the ones updated since a time."""
+    return export_response(
+        speaker_batches(to_utc(since)),
+        format,
+        [column.key for column in SPEAKER_COLUMNS],
+        "speakers",
+    )
+
+
+@router.get("/venues", response_class=StreamingResponse, responses=EXPORT_RESPONSES)
+async def export_venues(
+    format: Literal["ndjson", "csv"] = "ndjson", since: datetime | None = None
+):
+    """Every venue, or only the ones updated since a time."""
+    return export_response(
+        venue_batches(to_utc(since)),
+        format,
+        [column.key for column in VENUE_COLUMNS],
+        "venues",
+    )
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, Query
+from datetime import datetime
+from ..crud.search import *
+from ..crud.users import get_current_user
+from ..dependencies import get_db, run_crud
+from ..fieldsets import FieldSet, sparse_schema
+from ..pagination import NEXT_CURSOR_RESPONSE
+from ..schemas import schema_events
+from ..serialization import page_response
+
+router = APIRouter(
+    dependencies=[Depends(get_current_user)], prefix="/events", tags=["events"]
+)
+
+
+@router.get(
+    "/search",
+    response_model=list[sparse_schema(schema_events.EventSearchResult)],
+    responses=NEXT_CURSOR_RESPONSE,
+)
+async def search(
+    q: str = Query(min_length=1, max_length=200),
+    starts_after: datetime | None = None,
+    ends_before: datetime | None = None,
+    organizer_id: int | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    after: str | None = None,
+    db: Session = Depends(get_db),
+    selected: FieldSet = Depends(search_fields),
+):
+    """Events of every organizer whose name, description or location match
+    every word of `q`, most relevant first."""
+    # Served from column tuples, response_model only documents the schema
+    events = await run_crud(
+        db,
+        search_events,
+        q=q,
+        starts_after=starts_after,
+        ends_before=ends_before,
+        organizer_id=organizer_id,
+        limit=limit,
+        after=after,
+        selected=selected,
+    )
+    return page_response(events)
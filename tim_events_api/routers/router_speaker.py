@@ -1,7 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from pydantic import conlist
+from typing import Literal
 from ..crud.speakers import *
-from ..schemas import schema_speakers, schema_users
-from ..dependencies import get_db
+from ..crud.events import get_event_owner
+from ..schemas import schema_bulk, schema_speakers, schema_users
+from ..dependencies import get_db, run_crud
+from ..fieldsets import sparse_schema
+from ..pagination import NEXT_CURSOR_RESPONSE
+from ..serialization import FastJSONResponse, page_response
+from ..crud.bulk import BULK_MAX_ITEMS
 from ..crud.users import get_current_user
 
 router = APIRouter(
@@ -9,51 +16,260 @@ router = APIRouter(
 )
 
 
+async def raise_event_not_owned(
+    db: Session,
+    event_id: int,
+    current_user: schema_users.UserIdentity,
+    detail: str = "You cannot add speakers to this event",
+):
+    """Raise the error of a request that matched no event of the organizer.
+    The organizer is only looked up here, on the error path."""
+    owner = await run_crud(db, get_event_owner, event_id=event_id)
+    if owner is not None and owner.organizer_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="event does not exist"
+    )
+
+
+async def raise_not_owned(
+    db: Session,
+    speaker_id: int,
+    current_user: schema_users.UserIdentity,
+    detail: str,
+    event_id: int | None = None,
+):
+    """Raise the error of a write scoped to the organizer that matched no
+    speaker, or no event to move the speaker to.
+    The organizers are only looked up here, on the error path."""
+    owner = await run_crud(db, get_speaker_owner, speaker_id=speaker_id)
+    if owner is not None and owner.organizer_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+    if owner is not None and event_id is not None:
+        await raise_event_not_owned(db, event_id, current_user)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="speaker does not exist"
+    )
+
+
 @router.post("/speakers/", response_model=schema_speakers.Speaker)
-def create_speaker(
+async def create_speaker(
     speaker: schema_speakers.SpeakerCreate,
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
 ):
-    return add_speaker(db=db, speaker=speaker)
+    created_speaker = await run_crud(
+        db,
+        add_speaker,
+        schema=schema_speakers.Speaker,
+        speaker=speaker,
+        user_id=current_user.id,
+    )
+    if not created_speaker:
+        await raise_event_not_owned(db, speaker.event_id, current_user)
+    return created_speaker
 
 
-@router.get("/speakers/", response_model=list[schema_speakers.Speaker])
-def read_speakers(
+@router.get(
+    "/speakers/",
+    response_model=list[sparse_schema(schema_speakers.Speaker)],
+    responses=NEXT_CURSOR_RESPONSE,
+)
+async def read_speakers(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(default=100, ge=1, le=1000),
+    order_by: Literal["id", "created_at"] = "id",
+    after: str | None = None,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    selected: FieldSet = Depends(speaker_fields),
+):
+    # Served from column tuples, response_model only documents the schema
+    speakers = await run_crud(
+        db,
+        get_speaker_rows,
+        user_id=current_user.id,
+        skip=skip,
+        limit=limit,
+        order_by=order_by,
+        after=after,
+        selected=selected,
+    )
+    return page_response(speakers)
+
+
+@router.get("/events/speakers", response_model=dict[int, list[schema_speakers.Speaker]])
+async def read_events_speakers(
+    event_ids: list[int] = Query(min_items=1, max_items=1000),
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    """The speakers of many events of the current user, by event id, in one
+    query. Events that do not exist or are another organizer's are left out."""
+    # Served from column tuples, response_model only documents the schema
+    speakers = await run_crud(
+        db, get_event_speakers, event_ids=event_ids, user_id=current_user.id
+    )
+    return FastJSONResponse({str(key): value for key, value in speakers.items()})
+
+
+@router.get("/events/{event_id}/speakers", response_model=list[schema_speakers.Speaker])
+async def read_event_speakers(
+    event_id: int,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    speakers = await run_crud(
+        db, get_event_speakers, event_ids=[event_id], user_id=current_user.id
+    )
+    if event_id not in speakers:
+        await raise_event_not_owned(
+            db, event_id, current_user, "You cannot read the speakers of this event"
+        )
+    # Served from column tuples, response_model only documents the schema
+    return FastJSONResponse(speakers[event_id])
+
+
+@router.post(
+    "/speakers/bulk/",
+    response_model=schema_bulk.BulkResult[schema_speakers.Speaker],
+    response_model_exclude_none=True,
+)
+async def create_speakers(
+    speakers: conlist(
+        schema_speakers.SpeakerCreate, min_items=1, max_items=BULK_MAX_ITEMS
+    ) = Body(),
+    ids_only: bool = False,
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
 ):
-    speakers = get_speakers(user_id=current_user.id, skip=skip, limit=limit, db=db)
-    return speakers
+    return await run_crud(
+        db,
+        add_speakers,
+        schema=schema_bulk.BulkResult[schema_speakers.Speaker],
+        speakers=speakers,
+        user_id=current_user.id,
+        ids_only=ids_only,
+    )
 
 
-@router.get("/speakers/{speaker_id}/", response_model=schema_speakers.Speaker)
-def read_speaker(speaker_id: int, db: Session = Depends(get_db)):
-    speaker = get_speaker(speaker_id=speaker_id, db=db)
+@router.put(
+    "/speakers/bulk/",
+    response_model=schema_bulk.BulkResult[schema_speakers.Speaker],
+    response_model_exclude_none=True,
+)
+async def update_speakers(
+    speakers: conlist(
+        schema_speakers.SpeakerBulkUpdate, min_items=1, max_items=BULK_MAX_ITEMS
+    ) = Body(),
+    ids_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    return await run_crud(
+        db,
+        edit_speakers,
+        schema=schema_bulk.BulkResult[schema_speakers.Speaker],
+        speakers=speakers,
+        user_id=current_user.id,
+        ids_only=ids_only,
+    )
+
+
+@router.delete(
+    "/speakers/bulk/",
+    response_model=schema_bulk.BulkResult[schema_speakers.Speaker],
+    response_model_exclude_none=True,
+)
+async def delete_speakers(
+    speaker_ids: conlist(int, min_items=1, max_items=BULK_MAX_ITEMS) = Body(),
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    return await run_crud(
+        db,
+        remove_speakers,
+        schema=schema_bulk.BulkResult[schema_speakers.Speaker],
+        speaker_ids=speaker_ids,
+        user_id=current_user.id,
+    )
+
+
+@router.get(
+    "/speakers/{speaker_id}/", response_model=sparse_schema(schema_speakers.Speaker)
+)
+async def read_speaker(
+    speaker_id: int,
+    db: Session = Depends(get_db),
+    selected: FieldSet = Depends(speaker_fields),
+):
+    speaker = await run_crud(
+        db, get_speaker_fields, speaker_id=speaker_id, selected=selected
+    )
     if not speaker:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="speaker does not exist"
         )
-    return speaker
+    # Served from a column tuple, response_model only documents the schema
+    return FastJSONResponse(speaker)
+
+
+async def update_owned_speaker(
+    db: Session,
+    speaker_id: int,
+    speaker: schema_speakers.SpeakerUpdate | schema_speakers.SpeakerPatch,
+    current_user: schema_users.UserIdentity,
+):
+    updated_speaker = await run_crud(
+        db,
+        edit_speaker,
+        schema=schema_speakers.Speaker,
+        speaker=speaker,
+        speaker_id=speaker_id,
+        user_id=current_user.id,
+    )
+    if not updated_speaker:
+        await raise_not_owned(
+            db,
+            speaker_id,
+            current_user,
+            "You cannot update this speaker",
+            event_id=speaker.dict(exclude_unset=True).get("event_id"),
+        )
+    return updated_speaker
 
 
 @router.put("/speakers/{speaker_id}/", response_model=schema_speakers.Speaker)
-def update_speaker(
+async def update_speaker(
     speaker_id: int,
     speaker: schema_speakers.SpeakerUpdate,
     db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
 ):
-    db_speaker = get_speaker(speaker_id=speaker_id, db=db)
-    if not db_speaker:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="speaker does not exist"
-        )
-    updated_speaker = edit_speaker(speaker=speaker, speaker_id=speaker_id, db=db)
-    return updated_speaker
+    return await update_owned_speaker(db, speaker_id, speaker, current_user)
+
+
+@router.patch("/speakers/{speaker_id}/", response_model=schema_speakers.Speaker)
+async def patch_speaker(
+    speaker_id: int,
+    speaker: schema_speakers.SpeakerPatch,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    return await update_owned_speaker(db, speaker_id, speaker, current_user)
 
 
 @router.delete("/speakers/{speaker_id}/")
-def delete_speaker(speaker_id: int, db: Session = Depends(get_db)):
-    return remove_speaker(speaker_id=speaker_id, db=db)
+async def delete_speaker(
+    speaker_id: int,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    deleted = await run_crud(
+        db, remove_speaker, speaker_id=speaker_id, user_id=current_user.id
+    )
+    if deleted is None:
+        await raise_not_owned(
+            db, speaker_id, current_user, "You cannot delete this speaker"
+        )
+    return deleted
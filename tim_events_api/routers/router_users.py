@@ -1,18 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from email_validator import EmailNotValidError
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from typing import Literal
 from ..crud.users import *
 from ..schemas import schema_users
-from ..dependencies import get_db, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..dependencies import get_db, run_crud, ACCESS_TOKEN_EXPIRE_MINUTES
+from .. import emails
+from ..fieldsets import sparse_schema
+from ..pagination import NEXT_CURSOR_RESPONSE, page_items
 from ..schemas.schema_token import Token
+from ..serialization import FastJSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 router = APIRouter(tags=["users"])
 
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()
 ):
-    user = authenticate_user(
+    user = await authenticate_user(
         db=db, username=form_data.username, password=form_data.password
     )
     if not user:
@@ -27,34 +33,97 @@ def login_for_access_token(
     return Token(access_token=access_token, token_type="bearer")
 
 
+CONFLICT_DETAILS = {
+    "email": "User with this Email Exists",
+    "username": "User with that Username already exists",
+}
+
+
 @router.post("/users/", response_model=schema_users.User)
-def create_user(user: schema_users.UserCreate, db: Session = Depends(get_db)):
-    db_user_email = get_user_by_email(db=db, email=user.email)
-    db_user_username = get_user_by_username(db=db, username=user.username)
-    if db_user_email:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User with this Email Exists",
+async def create_user(user: schema_users.UserCreate, db: Session = Depends(get_db)):
+    try:
+        await emails.check_email(user.email)
+    except EmailNotValidError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    conflict = await run_crud(
+        db, get_user_conflict, email=user.email, username=user.username
+    )
+    if conflict is None:
+        hashed_password = await hash_password(user.password)
+        db_user = await run_crud(
+            db,
+            add_user,
+            schema=schema_users.User,
+            user=user,
+            hashed_password=hashed_password,
         )
+        if db_user is not None:
+            return db_user
+        # Taken by a concurrent signup since the check
+        conflict = await run_crud(
+            db, get_user_conflict, email=user.email, username=user.username
+        )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=CONFLICT_DETAILS.get(conflict, CONFLICT_DETAILS["email"]),
+    )
 
-    if db_user_username:
+
+@router.get(
+    "/users/",
+    response_model=list[schema_users.UserIdentity],
+    responses=NEXT_CURSOR_RESPONSE,
+)
+async def read_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    order_by: Literal["id", "created_at"] = "id",
+    after: str | None = None,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    if not current_user.is_admin:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User with that Username already exists",
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Cannot list users, you are not an admin",
         )
-    return add_user(db=db, user=user)
+    users = await run_crud(
+        db,
+        get_users,
+        schema=schema_users.UserIdentity,
+        skip=skip,
+        limit=limit,
+        order_by=order_by,
+        after=after,
+    )
+    return page_items(response, users)
 
 
-@router.get("/users/me/", response_model=schema_users.User)
-def get_user_me(current_user: schema_users.User = Depends(get_current_user)):
-    return current_user
+@router.get("/users/me/", response_model=sparse_schema(schema_users.User))
+async def get_user_me(
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    selected: FieldSet = Depends(user_fields),
+):
+    # Served from column tuples, response_model only documents the schema
+    user = await run_crud(
+        db, get_user_fields, user_id=current_user.id, selected=selected
+    )
+    # The user cached by the authentication may be gone, or not on a replica yet
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="user does not exist"
+        )
+    return FastJSONResponse(user)
 
 
-@router.get("/users/{user_id}/", response_model=schema_users.User)
-def read_user(
+@router.get("/users/{user_id}/", response_model=sparse_schema(schema_users.User))
+async def read_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+    selected: FieldSet = Depends(user_fields),
 ):
     if user_id != current_user.id:
         if not current_user.is_admin:
@@ -62,32 +131,54 @@ def read_user(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Cannot See the specified user, you are not an admin",
             )
-    user = get_user(user_id=current_user.id, db=db)
+    user = await run_crud(db, get_user_fields, user_id=user_id, selected=selected)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="user does not exist"
         )
-    return user
+    return FastJSONResponse(user)
 
 
 @router.put("/users/me/", response_model=schema_users.User)
-def update_user(
+async def update_user(
     user: schema_users.UserUpdate,
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
 ):
-    db_user = get_user(user_id=current_user.id, db=db)
-    if not db_user:
+    updated_user = await run_crud(
+        db, edit_user, schema=schema_users.User, user=user, user_id=current_user.id
+    )
+    if not updated_user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="user does not exist"
+        )
+    return updated_user
+
+
+@router.patch("/users/me/", response_model=schema_users.User)
+async def patch_user(
+    user: schema_users.UserPatch,
+    db: Session = Depends(get_db),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
+):
+    updated_user = await run_crud(
+        db, edit_user, schema=schema_users.User, user=user, user_id=current_user.id
+    )
+    if not updated_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="user does not exist"
         )
-    updated_user = edit_user(user=user, user_id=current_user.id, db=db)
     return updated_user
 
 
 @router.delete("/users/me/")
-def delete_user(
+async def delete_user(
     db: Session = Depends(get_db),
-    current_user: schema_users.User = Depends(get_current_user),
+    current_user: schema_users.UserIdentity = Depends(get_current_user),
 ):
-    return remove_user(user_id=current_user.id, db=db)
+    deleted = await run_crud(db, remove_user, user_id=current_user.id)
+    if deleted is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="user does not exist"
+        )
+    return deleted
@@ -1,46 +1,220 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from datetime import datetime
+from pydantic import conlist
+from typing import Literal
 from ..crud.venues import *
-from ..schemas import schema_venues
-from ..dependencies import get_db
+from ..crud.bookings import get_availability, get_conflicts
+from ..schemas import schema_bulk, schema_venues
+from ..dependencies import get_db, run_crud
+from ..pagination import NEXT_CURSOR_RESPONSE, page_items
+from ..crud.bulk import BULK_MAX_ITEMS
 from ..crud.users import get_current_user
+from .. import response_cache
 
 router = APIRouter(dependencies=[Depends(get_current_user)], tags=["venues"])
 
 
 @router.post("/venues/", response_model=schema_venues.Venue)
-def create_venue(venue: schema_venues.VenueCreate, db: Session = Depends(get_db)):
-    return add_venue(db=db, venue=venue)
+async def create_venue(venue: schema_venues.VenueCreate, db: Session = Depends(get_db)):
+    return await run_crud(db, add_venue, schema=schema_venues.Venue, venue=venue)
 
 
-@router.get("/venues/", response_model=list[schema_venues.Venue])
-def read_venues(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    venues = get_venues(skip=skip, limit=limit, db=db)
-    return venues
+@router.get(
+    "/venues/",
+    response_model=list[schema_venues.Venue],
+    responses={**NEXT_CURSOR_RESPONSE, **response_cache.NOT_MODIFIED_RESPONSE},
+)
+async def read_venues(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    order_by: Literal["id", "created_at"] = "id",
+    after: str | None = None,
+    db: Session = Depends(get_db),
+):
+    async def load(response: Response):
+        venues = await run_crud(
+            db,
+            get_venue_rows,
+            skip=skip,
+            limit=limit,
+            order_by=order_by,
+            after=after,
+        )
+        return page_items(response, venues)
+
+    return await response_cache.cached_response(
+        request, load, tags=[response_cache.VENUES_TAG]
+    )
+
+
+@router.post(
+    "/venues/bulk/",
+    response_model=schema_bulk.BulkResult[schema_venues.Venue],
+    response_model_exclude_none=True,
+)
+async def create_venues(
+    venues: conlist(
+        schema_venues.VenueCreate, min_items=1, max_items=BULK_MAX_ITEMS
+    ) = Body(),
+    ids_only: bool = False,
+    db: Session = Depends(get_db),
+):
+    return await run_crud(
+        db,
+        add_venues,
+        schema=schema_bulk.BulkResult[schema_venues.Venue],
+        venues=venues,
+        ids_only=ids_only,
+    )
+
+
+@router.put(
+    "/venues/bulk/",
+    response_model=schema_bulk.BulkResult[schema_venues.Venue],
+    response_model_exclude_none=True,
+)
+async def update_venues(
+    venues: conlist(
+        schema_venues.VenueBulkUpdate, min_items=1, max_items=BULK_MAX_ITEMS
+    ) = Body(),
+    ids_only: bool = False,
+    db: Session = Depends(get_db),
+):
+    return await run_crud(
+        db,
+        edit_venues,
+        schema=schema_bulk.BulkResult[schema_venues.Venue],
+        venues=venues,
+        ids_only=ids_only,
+    )
 
 
-@router.get("/venues/{venue_id}/", response_model=schema_venues.Venue)
-def read_venue(venue_id: int, db: Session = Depends(get_db)):
-    venue = get_venue(venue_id=venue_id, db=db)
-    if not venue:
+@router.delete(
+    "/venues/bulk/",
+    response_model=schema_bulk.BulkResult[schema_venues.Venue],
+    response_model_exclude_none=True,
+)
+async def delete_venues(
+    venue_ids: conlist(int, min_items=1, max_items=BULK_MAX_ITEMS) = Body(),
+    db: Session = Depends(get_db),
+):
+    return await run_crud(
+        db,
+        remove_venues,
+        schema=schema_bulk.BulkResult[schema_venues.Venue],
+        venue_ids=venue_ids,
+    )
+
+
+@router.get(
+    "/venues/{venue_id}/",
+    response_model=schema_venues.Venue,
+    responses=response_cache.NOT_MODIFIED_RESPONSE,
+)
+async def read_venue(venue_id: int, request: Request, db: Session = Depends(get_db)):
+    async def load(response: Response):
+        venue = await run_crud(
+            db, get_venue, schema=schema_venues.Venue, venue_id=venue_id
+        )
+        if not venue:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="venue does not exist"
+            )
+        return venue
+
+    return await response_cache.cached_response(
+        request, load, tags=[response_cache.venue_tag(venue_id)]
+    )
+
+
+@router.get(
+    "/venues/{venue_id}/availability", response_model=schema_venues.VenueAvailability
+)
+async def read_venue_availability(
+    venue_id: int, start: datetime, end: datetime, db: Session = Depends(get_db)
+):
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="end must be after start"
+        )
+    availability = await run_crud(
+        db, get_availability, venue_id=venue_id, start=start, end=end
+    )
+    if availability is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="venue does not exist"
         )
-    return venue
+    return availability
+
+
+@router.get(
+    "/venues/{venue_id}/conflicts", response_model=list[schema_venues.VenueConflict]
+)
+async def read_venue_conflicts(
+    venue_id: int,
+    starts_after: datetime | None = None,
+    ends_before: datetime | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    conflicts = await run_crud(
+        db,
+        get_conflicts,
+        venue_id=venue_id,
+        starts_after=starts_after,
+        ends_before=ends_before,
+        limit=limit,
+    )
+    if conflicts is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="venue does not exist"
+        )
+    return conflicts
 
 
 @router.put("/venues/{venue_id}/", response_model=schema_venues.Venue)
-def update_venue(
+async def update_venue(
     venue_id: int, venue: schema_venues.VenueUpdate, db: Session = Depends(get_db)
 ):
-    db_venue = get_venue(venue_id=venue_id, db=db)
-    if not db_venue:
+    updated_venue = await run_crud(
+        db, edit_venue, schema=schema_venues.Venue, venue=venue, venue_id=venue_id
+    )
+    if not updated_venue:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="venue does not exist"
+        )
+    return updated_venue
+
+
+@router.patch("/venues/{venue_id}/", response_model=schema_venues.Venue)
+async def patch_venue(
+    venue_id: int, venue: schema_venues.VenuePatch, db: Session = Depends(get_db)
+):
+    updated_venue = await run_crud(
+        db, edit_venue, schema=schema_venues.Venue, venue=venue, venue_id=venue_id
+    )
+    if not updated_venue:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="venue does not exist"
         )
-    updated_venue = edit_venue(venue=venue, venue_id=venue_id, db=db)
     return updated_venue
 
 
 @router.delete("/venues/{venue_id}/")
-def delete_venue(venue_id: int, db: Session = Depends(get_db)):
-    return remove_venue(venue_id=venue_id, db=db)
+async def delete_venue(venue_id: int, db: Session = Depends(get_db)):
+    deleted = await run_crud(db, remove_venue, venue_id=venue_id)
+    if deleted is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="venue does not exist"
+        )
+    return deleted
@@ -0,0 +1,17 @@
+from pydantic.generics import GenericModel
+from typing import Generic, TypeVar
+
+ItemT = TypeVar("ItemT")
+
+
+class BulkItemResult(GenericModel, Generic[ItemT]):
+    index: int
+    id: int | None = None
+    item: ItemT | None = None
+    error: str | None = None
+
+
+class BulkResult(GenericModel, Generic[ItemT]):
+    succeeded: int
+    failed: int
+    results: list[BulkItemResult[ItemT]]
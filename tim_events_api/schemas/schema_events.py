@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from .schema_patch import PatchBase
 from .schema_speakers import Speaker
 from datetime import datetime
 
@@ -9,6 +10,7 @@ class EventBase(BaseModel):
     location: str
     start_time: datetime
     end_time: datetime
+    venue_id: int | None = None
 
 
 class EventCreate(EventBase):
@@ -19,6 +21,22 @@ class EventUpdate(EventBase):
     pass
 
 
+class EventPatch(PatchBase):
+    # A null venue_id unbooks the event, like with PUT
+    nullable = ("venue_id",)
+
+    name: str | None
+    description: str | None
+    location: str | None
+    start_time: datetime | None
+    end_time: datetime | None
+    venue_id: int | None
+
+
+class EventBulkUpdate(EventUpdate):
+    id: int
+
+
 class Event(EventBase):
     id: int
     organizer_id: int
@@ -26,3 +44,7 @@ class Event(EventBase):
 
     class Config:
         orm_mode = True
+
+
+class EventSearchResult(Event):
+    score: float
@@ -0,0 +1,15 @@
+from pydantic import BaseModel, validator
+from typing import ClassVar
+
+
+# Base of the partial update schemas: every field may be left out, the fields
+# that are sent are validated like in the full update. Only the fields listed
+# in nullable may be sent as null, eg. to unset a reference
+class PatchBase(BaseModel):
+    nullable: ClassVar[tuple] = ()
+
+    @validator("*", pre=True)
+    def not_null(cls, value, field):
+        if value is None and field.name not in cls.nullable:
+            raise ValueError("may be omitted but not null")
+        return value
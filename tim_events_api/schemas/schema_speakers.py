@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from .schema_patch import PatchBase
 
 
 class SpeakerBase(BaseModel):
@@ -17,6 +18,18 @@ class SpeakerUpdate(SpeakerBase):
     pass
 
 
+class SpeakerPatch(PatchBase):
+    first_name: str | None
+    last_name: str | None
+    contact_info: str | None
+    bio: str | None
+    event_id: int | None
+
+
+class SpeakerBulkUpdate(SpeakerUpdate):
+    id: int
+
+
 class Speaker(SpeakerBase):
     id: int
 
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr
 from typing import Annotated
+from .schema_patch import PatchBase
 from .schema_events import Event
 
 
@@ -18,12 +19,22 @@ class UserUpdate(UserBase):
     pass
 
 
-class User(UserBase):
+class UserPatch(PatchBase):
+    email: EmailStr | None
+    first_name: str | None
+    last_name: str | None
+    username: str | None
+
+
+class UserIdentity(UserBase):
     id: int
     is_active: bool
     is_organizer: bool
     is_admin: bool
-    events: list[Event] = []
 
     class Config:
         orm_mode = True
+
+
+class User(UserIdentity):
+    events: list[Event] = []
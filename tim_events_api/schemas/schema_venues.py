@@ -1,4 +1,6 @@
 from pydantic import BaseModel
+from datetime import datetime
+from .schema_patch import PatchBase
 
 
 class VenueBase(BaseModel):
@@ -16,8 +18,34 @@ class VenueUpdate(VenueBase):
     pass
 
 
+class VenuePatch(PatchBase):
+    name: str | None
+    location: str | None
+    capacity: int | None
+    description: str | None
+
+
+class VenueBulkUpdate(VenueUpdate):
+    id: int
+
+
 class Venue(VenueBase):
     id: int
 
     class Config:
         orm_mode = True
+
+
+class VenueAvailability(BaseModel):
+    venue_id: int
+    start: datetime
+    end: datetime
+    free: bool
+    conflicts: list[int]
+
+
+class VenueConflict(BaseModel):
+    event_id: int
+    other_event_id: int
+    start: datetime
+    end: datetime